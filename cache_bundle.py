@@ -0,0 +1,144 @@
+import hashlib
+import io
+import tarfile
+from pathlib import Path
+from typing import Dict, List
+from constants import CACHE_PATH
+from model.contest import Contest
+from model.grading import Grading
+from util.cache import CacheStore
+from util.common import fail
+from util.datetime import get_curr_dt_est
+from util.decode import loads, dumps
+from util.log import get_logger
+
+LOG = get_logger("CacheBundle")
+
+# Version of the bundle's layout (a manifest.json, and the files under files/, by their path in the cache directory).
+# Pre-processed files have their own (PRE_PROCESSED_VERSION).
+BUNDLE_FORMAT_VERSION = 2
+MANIFEST_NAME = "manifest.json"
+FILES_DIR = "files"
+
+
+def bundle_path(week_nums: List[int]) -> Path:
+    return CACHE_PATH.joinpath("preprocessed_" + "_".join([str(week_num) for week_num in sorted(set(week_nums))]) + ".tar.gz")
+
+
+def sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_name(path: Path) -> str:
+    return path.relative_to(CACHE_PATH).as_posix()
+
+
+def export_bundle(platforms: List, week_nums: List[int], output_path: Path = None) -> Path:
+    """
+    Packs the weeks' pre-processed files (see ContestPlatformBase.pre_processed_path) into a single tar.gz, along with a manifest
+    of what's in it: each file's platform, week, contest, format version, hash and number of users. A file that doesn't parse
+    (ex: cut short by a copy) fails the export, and one without users is only warned about, as it's unusual.
+    """
+    output_path = output_path if output_path is not None else bundle_path(week_nums)
+    manifest = {"format_version": BUNDLE_FORMAT_VERSION, "created_dt": get_curr_dt_est().isoformat(), "week_nums": sorted(set(week_nums)), "files": []}
+    contents = dict()
+    for week_num in sorted(set(week_nums)):
+        gd = Grading(week_num=week_num)
+        for platform in platforms:
+            for contest_id in platform.pre_processed_contests(gd):
+                path = platform.pre_processed_path(gd, Contest(contest_id))
+                data = path.read_bytes()
+                try:
+                    num_records = platform.num_pre_processed_records(CacheStore.decode(data))
+                except Exception as e:
+                    fail(f"Pre-processed file: [{path}] is unreadable, pre-process contest: [{contest_id}] again. {e}", LOG)
+                if num_records == 0:
+                    LOG.warning(f"Pre-processed file: [{file_name(path)}] has no users")
+
+                contents[file_name(path)] = data
+                manifest["files"].append({"platform_name": platform.name(), "week_num": week_num, "contest_id": contest_id, "file_name": file_name(path),
+                    "version": platform.PRE_PROCESSED_VERSION, "sha256": sha256(data), "num_bytes": len(data), "num_records": num_records})
+
+    if len(manifest["files"]) == 0:
+        fail(f"Nothing pre-processed for weeks: [{manifest['week_nums']}]", LOG)
+
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    with tarfile.open(tmp_path, "w:gz") as tar:
+        for name, data in [(MANIFEST_NAME, dumps(manifest).encode("utf-8"))] + [(f"{FILES_DIR}/{name}", data) for name, data in contents.items()]:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    tmp_path.replace(output_path)
+
+    LOG.info(f"Exported: [{len(manifest['files'])}] pre-processed files for weeks: [{manifest['week_nums']}] to: [{output_path}]")
+    for entry in manifest["files"]:
+        LOG.info(f"[{entry['platform_name']}] week: [{entry['week_num']}] contest: [{entry['contest_id']}] users: [{entry['num_records']}]")
+    return output_path
+
+
+def verify(platforms: Dict, tar: tarfile.TarFile, manifest: Dict, entry: Dict) -> bytes:
+    """
+    The file's contents, if it's what the manifest says, and what this grader expects (platform, naming, format version).
+    """
+    platform = platforms.get(entry["platform_name"])
+    if platform is None:
+        fail(f"Unknown platform, or one that doesn't pre-process: [{entry['platform_name']}]", LOG)
+    if entry["week_num"] not in manifest["week_nums"]:
+        fail(f"File: [{entry['file_name']}] is for week: [{entry['week_num']}], which the bundle isn't for", LOG)
+    expected_name = file_name(platform.pre_processed_path(Grading(week_num=entry["week_num"]), Contest(entry["contest_id"])))
+    if entry["file_name"] != expected_name:
+        fail(f"File: [{entry['file_name']}] should be named: [{expected_name}]", LOG)
+    if entry["version"] != platform.PRE_PROCESSED_VERSION:
+        fail(f"File: [{entry['file_name']}] is in version: [{entry['version']}] of the format, this grader reads: [{platform.PRE_PROCESSED_VERSION}]", LOG)
+
+    member = tar.extractfile(f"{FILES_DIR}/{entry['file_name']}")
+    data = member.read() if member is not None else b""
+    if len(data) != entry["num_bytes"] or sha256(data) != entry["sha256"]:
+        fail(f"File: [{entry['file_name']}] doesn't match its hash, the bundle is corrupt or incomplete", LOG)
+    try:
+        num_records = platform.num_pre_processed_records(CacheStore.decode(data))
+    except Exception as e:
+        fail(f"File: [{entry['file_name']}] is unreadable. {e}", LOG)
+    if num_records != entry["num_records"]:
+        fail(f"File: [{entry['file_name']}] has: [{num_records}] users, the manifest says: [{entry['num_records']}]", LOG)
+    return data
+
+
+def import_bundle(platforms: List, input_path: Path, force: bool = False) -> None:
+    """
+    Installs the pre-processed files of a bundle (see export_bundle), once all of them are verified. Nothing is installed if any
+    of them isn't right. Files are written aside and then moved in place, so grading never reads a half written one.
+
+    Files that exist already are left alone, unless forced.
+    """
+    platforms = {platform.name(): platform for platform in platforms if platform.PRE_PROCESSES}
+    try:
+        tar = tarfile.open(input_path, "r:gz")
+    except Exception as e:
+        fail(f"Unable to open bundle: [{input_path}]. {e}", LOG)
+
+    with tar:
+        try:
+            manifest = loads(tar.extractfile(MANIFEST_NAME).read())
+        except Exception as e:
+            fail(f"Bundle: [{input_path}] has no readable manifest. {e}", LOG)
+        if manifest.get("format_version") != BUNDLE_FORMAT_VERSION:
+            fail(f"Bundle: [{input_path}] is in version: [{manifest.get('format_version')}] of the format, this grader reads: [{BUNDLE_FORMAT_VERSION}]", LOG)
+
+        to_install = dict()
+        for entry in manifest["files"]:
+            path = CACHE_PATH.joinpath(entry["file_name"])
+            data = verify(platforms, tar, manifest, entry)
+            if path.exists() and not force:
+                if path.read_bytes() != data:
+                    LOG.warning(f"Keeping the existing: [{entry['file_name']}], which differs from the bundle's. Use force to replace it.")
+                continue
+            to_install[path] = data
+
+    tmp_paths = {path: path.with_name(path.name + ".tmp") for path in to_install}
+    for path, data in to_install.items():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_paths[path].write_bytes(data)
+    for path, tmp_path in tmp_paths.items():
+        tmp_path.replace(path)
+    LOG.info(f"Imported: [{len(to_install)}] of: [{len(manifest['files'])}] pre-processed files for weeks: [{manifest['week_nums']}] from: [{input_path}]")
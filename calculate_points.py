@@ -1,11 +1,13 @@
 import argparse
 from collections import defaultdict
-from typing import Dict
+from typing import Dict, Iterable
 from constants import CACHE_PATH
+from model.grading_event import GradingEvent
 from util.common import fail
 from util.log import get_logger
-from grader import CONTEST_PLATFORMS, PRACTICE_PLATFORMS
-import json
+from platform_registry import CONTEST, PRACTICE, platform_names
+from util.scoring import ScoringRules
+from pathlib import Path
 from csv import DictWriter, DictReader
 
 
@@ -18,6 +20,8 @@ def parse_args():
     parser.add_argument('-w', '--week', help="Week number, ex: 5, or 6...", required=True, dest="week_num", type=int)
     parser.add_argument('-u', '--uni', help="For a particular uni (eg: ar4160, ak3232)", dest="uni")
     parser.add_argument('-p', '--platform', help="For a particular platform (eg: Leetcode, Codeforces, Spoj)", dest="platform_name")
+    parser.add_argument('-r', '--rescore', help="Re-score the grading events offline with the rules in this json file (see util/scoring.py) instead of using their logged points", dest="rules_path", type=Path)
+    parser.add_argument('-y', '--yes', help="Overwrite an existing grade sheet without asking", dest="overwrite", action="store_true")
     return parser.parse_args()
 
 
@@ -32,82 +36,104 @@ def prepare_file_name(prefix: str, extension: str, week_num: int, uni: str, plat
     return file_name
 
 
-def calculate(week_num: int, uni: str, platform_name: str):
-    # Create grade file if not present
-    grade_sheet_name = prepare_file_name("grades", "csv", week_num, uni, platform_name)
-    grade_sheet_path = CACHE_PATH.joinpath(grade_sheet_name) #(f"grades_{week_num}.csv")
-
-    grade_events_name = prepare_file_name("grading_events", "log", week_num, uni, platform_name)
-    grade_events_path = CACHE_PATH.joinpath(grade_events_name) #(f"grading_events_{week_num}.log")
-
-    uni_to_courseworks_path = CACHE_PATH.joinpath("uni_courseworks_id.csv")
-    
-    if not grade_events_path.exists():
-        fail(f"Grading events file: [{grade_events_path}] does not exist", LOG)
-
-    if not uni_to_courseworks_path.exists():
-        fail(f"Uni to courseworks file: [{uni_to_courseworks_path}] does not exist", LOG)
-
-    if grade_sheet_path.exists():
+def check_overwrite(grade_sheet_path: Path, overwrite: bool) -> None:
+    """
+    Asks before overwriting an existing grade sheet, unless overwrite is set.
+    """
+    if grade_sheet_path.exists() and not overwrite:
         LOG.warning(f"Grade sheet: [{grade_sheet_path}] already exists")
         val = input("Overwrite? (y/n): ")
         if val != "y":
             exit(-1)
 
-    # Create uni to courseworks id map
-    uni_to_courseworks_id = dict()
-    uni_to_name = dict()
-    name_idx = dict()
-    with open(uni_to_courseworks_path, 'r', encoding='utf-8', newline='') as f:
-        reader = DictReader(f)
-        for i, row in enumerate(reader):
-            print(row)
-            uni_to_courseworks_id[row["uni"]] = row["courseworks_id"]
-            uni_to_name[row["uni"]] = row["name"]
-            name_idx[row["name"]] = i
-
-    # Gather into map
-    usr_points_map = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
-    num_exceptions = 0
+
+def read_grading_events(grade_events_path: Path) -> Iterable[GradingEvent]:
     with open(grade_events_path, "r", encoding='utf-8') as f:
         for line in f:
-            LOG.debug(f"line: {line}")
-            data = json.loads(line)
-            uni = data["uni"]
-            platform_name = data["platform_name"]
-            event_type = data["event_type"]
-            points = int(data["points"])
-            num_exceptions += int(bool(data["is_exception"]))
-            usr_points_map[uni][event_type][platform_name] += points
-
-    if num_exceptions:
-        LOG.error(f"There are [{num_exceptions}] exceptions in grade log!!")
-
-    # finalize headers.
-    # final_headers should be ordered in the way we wanna see in the csv
-    contest_platform_headers = sorted([platform.name() for platform in CONTEST_PLATFORMS])
-    practice_platform_headers = sorted([platform.name() for platform in PRACTICE_PLATFORMS])
-
-    final_headers = ["uni", "name", "courseworks_id"]
-    final_headers += ["final_points", "comments", "private_comments"]
-    final_headers += ["total_contest_points", "total_practice_points", "total_points"]
-    final_headers += [ct + "_contest" for ct in contest_platform_headers]
-    final_headers += [pt + "_practice" for pt in practice_platform_headers]
-    final_headers += ["Topcoder_contest", "Topcode_practice", "Leetcode_practice", "Kattis_practice"] # manual - auto grader does not cover these yet - dictwriter will fill in 'MANUAL' in each row
-
-    # begin creating csv rows as dicts
-    rows = []
-    for uni, event_type_map in usr_points_map.items():
-        row = {"uni": uni, "name": uni_to_name[uni], "courseworks_id": uni_to_courseworks_id[uni]}
+            yield GradingEvent.from_log_line(line)
+
+
+class GradeSheet:
+    """
+    Aggregates grading events into a grade sheet (grades_<week_num>.csv), one row per user.
+
+    Events are consumed incrementally, as they're read from the log or as the grader produces them. The grader
+    produces all events of a user before moving on to the next one, so as soon as an event for another user shows up,
+    the previous user's row is final and gets appended to the sheet right away. On close, the sheet is rewritten
+    in courseworks order.
+    """
+
+    def __init__(self, grade_sheet_path: Path, rules: ScoringRules = None) -> None:
+        uni_to_courseworks_path = CACHE_PATH.joinpath("uni_courseworks_id.csv")
+        if not uni_to_courseworks_path.exists():
+            fail(f"Uni to courseworks file: [{uni_to_courseworks_path}] does not exist", LOG)
+
+        self.grade_sheet_path = grade_sheet_path
+        self.rules = rules
+
+        # Create uni to courseworks id map
+        self.uni_to_courseworks_id = dict()
+        self.uni_to_name = dict()
+        self.name_idx = dict()
+        with open(uni_to_courseworks_path, 'r', encoding='utf-8', newline='') as f:
+            reader = DictReader(f)
+            for i, row in enumerate(reader):
+                self.uni_to_courseworks_id[row["uni"]] = row["courseworks_id"]
+                self.uni_to_name[row["uni"]] = row["name"]
+                self.name_idx[row["name"]] = i
+
+        # finalize headers.
+        # final_headers should be ordered in the way we wanna see in the csv
+        self.contest_platform_headers = sorted(platform_names(CONTEST))
+        self.practice_platform_headers = sorted(platform_names(PRACTICE))
+
+        self.final_headers = ["uni", "name", "courseworks_id"]
+        self.final_headers += ["final_points", "comments", "private_comments"]
+        self.final_headers += ["total_contest_points", "total_practice_points", "total_points"]
+        self.final_headers += [ct + "_contest" for ct in self.contest_platform_headers]
+        self.final_headers += [pt + "_practice" for pt in self.practice_platform_headers]
+        self.final_headers += ["Topcoder_contest", "Topcode_practice", "Kattis_practice"] # manual - auto grader does not cover these yet - dictwriter will fill in 'MANUAL' in each row
+
+        self.usr_points_map = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+        self.num_exceptions = 0
+        self.rows: Dict[str, Dict] = dict() # uni => row, for users whose events are all in
+        self.curr_uni = None
+
+        with open(self.grade_sheet_path, "w", newline='', encoding='utf-8') as f:
+            DictWriter(f, fieldnames=self.final_headers, restval='MANUAL').writeheader()
+
+
+    def add(self, event: GradingEvent) -> None:
+        if self.curr_uni is not None and event.uni != self.curr_uni:
+            self.__finish_user(self.curr_uni)
+        self.curr_uni = event.uni
+        if event.uni in self.rows:
+            # Events of a user that were not contiguous (ex: hand merged logs). The row is only final on close.
+            LOG.warning(f"More events found for user: [{event.uni}] after their row was written")
+            del self.rows[event.uni]
+
+        points = int(event.points if self.rules is None else self.rules.score(event))
+        self.num_exceptions += int(event.is_exception)
+        self.usr_points_map[event.uni][event.event_type][event.platform_name] += points
+
+
+    def add_all(self, events: Iterable[GradingEvent]) -> None:
+        for event in events:
+            self.add(event)
+
+
+    def __finish_user(self, uni: str) -> None:
+        event_type_map = self.usr_points_map[uni]
+        row = {"uni": uni, "name": self.uni_to_name[uni], "courseworks_id": self.uni_to_courseworks_id[uni]}
 
         contest_points = 0
-        for platform_name in contest_platform_headers:
+        for platform_name in self.contest_platform_headers:
             row[platform_name + "_contest"] = event_type_map["contest"][platform_name]
             contest_points += event_type_map["contest"][platform_name]
         row["total_contest_points"] = contest_points
 
         practice_points = 0
-        for platform_name in practice_platform_headers:
+        for platform_name in self.practice_platform_headers:
             row[platform_name + "_practice"] = event_type_map["practice"][platform_name]
             practice_points += event_type_map["practice"][platform_name]
         row["total_practice_points"] = practice_points
@@ -115,21 +141,54 @@ def calculate(week_num: int, uni: str, platform_name: str):
         row["total_points"] = contest_points + practice_points
         row["comments"] = ""
         row["private_comments"] = ""
-        rows.append(row)
+        self.rows[uni] = row
+
+        with open(self.grade_sheet_path, "a", newline='', encoding='utf-8') as f:
+            DictWriter(f, fieldnames=self.final_headers, restval='MANUAL').writerow(row)
+
+
+    def close(self) -> None:
+        if self.curr_uni is not None:
+            self.__finish_user(self.curr_uni)
+            self.curr_uni = None
 
+        if self.num_exceptions:
+            LOG.error(f"There are [{self.num_exceptions}] exceptions in grade log!!")
 
-    # write the rows into csv
-    # NOTE: Courseworks outputs submissions ordered by name as seen in the uni_courseworks_id.csv
-    #       So, we gotta sort our rows similarly.
-    rows.sort(key=lambda x: name_idx[x["name"]])
-    with open(grade_sheet_path, "w", newline='', encoding='utf-8') as f:
-        writer = DictWriter(f, fieldnames=final_headers, restval='MANUAL')
-        writer.writeheader()
-        writer.writerows(rows)
+        if self.rules is not None and self.rules.num_unscorable:
+            LOG.warning(f"There are [{self.rules.num_unscorable}] events without problems in grade log (logged by an older grader). Kept their points as is.")
+
+        # write the rows into csv
+        # NOTE: Courseworks outputs submissions ordered by name as seen in the uni_courseworks_id.csv
+        #       So, we gotta sort our rows similarly.
+        rows = sorted(self.rows.values(), key=lambda x: self.name_idx[x["name"]])
+        with open(self.grade_sheet_path, "w", newline='', encoding='utf-8') as f:
+            writer = DictWriter(f, fieldnames=self.final_headers, restval='MANUAL')
+            writer.writeheader()
+            writer.writerows(rows)
+
+        LOG.info(f"Done. See file: {self.grade_sheet_path}")
+
+
+def grade_sheet_path(week_num: int, uni: str, platform_name: str, rescored: bool = False) -> Path:
+    return CACHE_PATH.joinpath(prepare_file_name("grades" if not rescored else "grades_rescored", "csv", week_num, uni, platform_name))
+
+
+def calculate(week_num: int, uni: str, platform_name: str, rules_path: Path = None, overwrite: bool = False):
+    rules = ScoringRules.from_file(rules_path) if rules_path is not None else None
+    grade_sheet = grade_sheet_path(week_num, uni, platform_name, rules is not None)
+
+    grade_events_name = prepare_file_name("grading_events", "log", week_num, uni, platform_name)
+    grade_events_path = CACHE_PATH.joinpath(grade_events_name) #(f"grading_events_{week_num}.log")
+
+    if not grade_events_path.exists():
+        fail(f"Grading events file: [{grade_events_path}] does not exist", LOG)
 
-    LOG.info(f"Done. See file: {grade_sheet_path}")
+    check_overwrite(grade_sheet, overwrite)
 
-        
+    sheet = GradeSheet(grade_sheet, rules)
+    sheet.add_all(read_grading_events(grade_events_path))
+    sheet.close()
 
 
 
@@ -137,4 +196,4 @@ def calculate(week_num: int, uni: str, platform_name: str):
 
 if __name__ == "__main__":
     args = parse_args()
-    calculate(args.week_num, args.uni, args.platform_name)
\ No newline at end of file
+    calculate(args.week_num, args.uni, args.platform_name, args.rules_path, args.overwrite)
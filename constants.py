@@ -2,6 +2,7 @@ from datetime import datetime
 from datetime import timedelta
 import pytz
 from pathlib import Path
+import sys
 
 # Timezone constants
 UTC_TZINFO = pytz.timezone("UTC")
@@ -15,11 +16,11 @@ TIC_WEEK_1_START_DATE = datetime(2022, 1, 15, tzinfo=EST_TZINFO)
 TIC_WEEK_START_DATES = [TIC_WEEK_1_START_DATE + timedelta(days=7*i) for i in range(15)]
 LOG_MODE_DEBUG = True
 PROJECT_PATH = Path(".").resolve()
-CHROME_DRIVER_PATH = Path("./chromedriver.exe").resolve() # Download it from https://chromedriver.chromium.org/downloads
+CHROME_DRIVER_PATH = Path("./chromedriver.exe" if sys.platform.startswith("win") else "./chromedriver").resolve() # Download it from https://chromedriver.chromium.org/downloads
 PRACTICE_PROBLEM_MULTIPLIER=0.01
 CONTEST_PROBLEM_MULTIPLIER=1
 CACHE_PATH = Path("./cache").resolve() # Make sure this dir exists
 
 # Safety checks
-assert((CHROME_DRIVER_PATH is not None) and type(CHROME_DRIVER_PATH) == type(Path(".")) and CHROME_DRIVER_PATH.exists() and CHROME_DRIVER_PATH.is_file())
+# NOTE: CHROME_DRIVER_PATH is only checked when a scrape actually happens (see util/web.py), so that offline steps can run without it
 assert((CACHE_PATH is not None) and type(CACHE_PATH) == type(Path(".")) and CACHE_PATH.exists() and CACHE_PATH.is_dir())
\ No newline at end of file
@@ -1,12 +1,14 @@
-from typing import List
+from typing import Dict, List
 from model.submission import Submission
 from util.web import WebRequest
+from model.request_pattern import RequestPattern
 from util.log import get_logger
 from contest_platform.base import ContestPlatformBase, Grading, User, Contest
 from datetime import datetime, timedelta
 import requests as r
-from util.datetime import in_between_dt, to_dt_from_ts
+from util.datetime import in_between_dt, in_between_ts, to_dt_from_ts, to_ts_sec
 from constants import EST_TZINFO
+from util.cache import get_store
 from util.common import fail
 
 LOG = get_logger("Atcoder")
@@ -26,9 +28,11 @@ class Atcoder(ContestPlatformBase):
 
     PLATFORM = "Atcoder"
     CONTESTS_URL = "https://kenkoooo.com/atcoder/resources/contests.json"
+    USER_URL = "https://atcoder.jp/users/{user_id}" # 404 for users that don't exist
     SUBMISSIONS_URL = "https://kenkoooo.com/atcoder/atcoder-api/v3/user/submissions?user={user_id}&from_second={from_ts_sec}"
-    WR = WebRequest(rate_limit_millis=1000)
-    SUBMISSION_DATA_CACHE = dict()
+    WR = WebRequest(rate_limit_millis=1000, name="Atcoder")
+    REQUEST_PATTERN = RequestPattern(per_user_week=1) # Submissions are fetched (and cached) per user for the whole week
+    SUBMISSION_DATA_CACHE = get_store("Atcoder_submissions") # (from_ts_sec, handle) => submissions, in memory only
 
 
     def name(self):
@@ -54,17 +58,13 @@ class Atcoder(ContestPlatformBase):
                 ...
         """
 
-        contests = Atcoder.WR.get(Atcoder.CONTESTS_URL)
-        if (contests is None) or (len(contests) == 0):
-            fail(f"No contests found", LOG)
-
-        contests = [{**contest, "startDatetime": to_dt_from_ts(int(contest["start_epoch_second"])*1000)} for contest in contests]
-        contests = [contest for contest in contests if in_between_dt(contest["startDatetime"], gd.week_start_dt, gd.week_end_dt)]
+        # Filter on the raw epoch seconds while streaming so that only the contests in the grading week are ever built
+        contests = list(Atcoder.WR.get_items(Atcoder.CONTESTS_URL, "item", lambda contest: in_between_ts(int(contest["start_epoch_second"]), gd.week_start_ts_sec, gd.week_end_ts_sec)))
         LOG.debug(f"Contests: {contests}")
         ret_contests = []
         for contest in contests:
             contest_id = contest["id"]
-            contest_start_dt = contest["startDatetime"]
+            contest_start_dt = to_dt_from_ts(int(contest["start_epoch_second"])*1000)
             contest_end_dt = contest_start_dt + timedelta(seconds=int(contest["duration_second"]))
             ret_contests.append(Contest(contest_id, contest_start_dt, contest_end_dt)) # Need date info for filtering submissions
         return ret_contests
@@ -97,23 +97,28 @@ class Atcoder(ContestPlatformBase):
                 ...
         """
         usr_handle = usr.handle(self.name())
-        from_ts_sec = int(gd.week_start_dt.timestamp())
+        from_ts_sec = gd.week_start_ts_sec
         submissions_url = Atcoder.SUBMISSIONS_URL.format(user_id=usr_handle, from_ts_sec=from_ts_sec)
         LOG.debug(f"Submission url: {submissions_url}")
 
-        if submissions_url in Atcoder.SUBMISSION_DATA_CACHE:
-            LOG.debug(f"Submissions found in Cache with url: {submissions_url}")
-            submissions = Atcoder.SUBMISSION_DATA_CACHE[submissions_url]
-        else:
-            submissions = Atcoder.WR.get(submissions_url)
-            #LOG.debug(f"Submissions request response: {submissions}")
-        Atcoder.SUBMISSION_DATA_CACHE[submissions_url] = submissions
+        # Fetched once per user for all of the week's contests
+        submissions = Atcoder.SUBMISSION_DATA_CACHE.get((from_ts_sec, usr_handle), lambda: Atcoder.WR.get(submissions_url))
 
+        contest_start_ts_sec, contest_end_ts_sec = to_ts_sec(ct.contest_start_dt), to_ts_sec(ct.contest_end_dt)
         solved_questions = set()
+        solved_ts = dict()
         for submission in submissions:
-            curr_dt = to_dt_from_ts(int(submission["epoch_second"])*1000)
-            if submission["result"] == "AC" and submission["contest_id"] == ct.contest_id and in_between_dt(curr_dt, gd.week_start_dt, gd.week_end_dt) and in_between_dt(curr_dt, ct.contest_start_dt, ct.contest_end_dt):
+            curr_ts_sec = int(submission["epoch_second"])
+            if submission["result"] == "AC" and submission["contest_id"] == ct.contest_id and in_between_ts(curr_ts_sec, gd.week_start_ts_sec, gd.week_end_ts_sec) and in_between_ts(curr_ts_sec, contest_start_ts_sec, contest_end_ts_sec):
                 solved_questions.add(submission["problem_id"])
+                solved_ts[submission["problem_id"]] = min(solved_ts.get(submission["problem_id"], curr_ts_sec), curr_ts_sec)
 
         LOG.debug(f"User [{usr_handle}] in contest [{ct.contest_id}] solved these questions: [{solved_questions}]")
-        return Submission(solved_questions)
+        return Submission(solved_questions, solved_ts)
+
+
+    def validate_handles(self, handles: List[str]) -> Dict[str, bool]:
+        """
+            kenkoooo's API answers with an empty list for unknown users, so the user's page on atcoder itself is probed instead.
+        """
+        return Atcoder.WR.probe_handles(Atcoder.USER_URL, handles)
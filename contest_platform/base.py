@@ -1,11 +1,40 @@
-from typing import List
+from pathlib import Path
+from typing import Dict, List, Set
+from constants import CACHE_PATH
 from model.user import User
 from model.contest import Contest
 from model.grading import Grading
 from model.submission import Submission
+from model.request_pattern import RequestPattern
+from util.cache import CacheStore, get_store
+from util.datetime import in_between_dt
+from util.decode import loads
+from util.log import get_logger
+
+LOG = get_logger("ContestPlatformBase")
+
+
+class ContestNotReady(Exception):
+    """
+    Raised by pre_process_contest for an ended contest whose results aren't final yet (ex: Codeforces' system tests still running).
+    The preprocessor tries it again later, without counting it as a failed attempt.
+    """
+    pass
 
 
 class ContestPlatformBase:
+    # Whether a contest's data is fetched in bulk (for all participants at once) rather than per user. Bulk platforms are
+    # graded contest by contest for all users (see planner.py), and release each contest's data once it has been applied.
+    IS_BULK = False
+
+    # By default, one request per user per contest
+    REQUEST_PATTERN = RequestPattern(per_user_contest=1)
+
+    # Whether a contest's data can be fetched ahead of grading, as soon as it ends (see preprocessor.py)
+    PRE_PROCESSES = False
+    # Version of the format of pre-processed files. Bump it when it changes, so that bundles of older files are refused (see cache_bundle.py)
+    PRE_PROCESSED_VERSION = 1
+
     def name() -> str:
         raise Exception("Unimplemented name")
 
@@ -15,5 +44,105 @@ class ContestPlatformBase:
     def all_contests(self, gd: Grading) -> List[Contest]:
         raise Exception("Unimplemented get_contests")
 
+    def in_grading_week(self, gd: Grading, ct: Contest) -> bool:
+        """
+        Whether a contest (returned by all_contests) belongs to the grading week. By default, that's when it starts within the week.
+        """
+        return in_between_dt(ct.contest_start_dt, gd.week_start_dt, gd.week_end_dt)
+
     def successful_submissions(self, gd: Grading, ct: Contest, usr: User) -> Submission:
-        raise Exception("Unimplemented successful_submissions")
\ No newline at end of file
+        raise Exception("Unimplemented successful_submissions")
+
+    def prescreen(self, gd: Grading, contests: List[Contest], usrs: List[User]) -> Set[str]:
+        """
+        A cheap check (ex: a request per user, or one for all users) of who could have taken part in any of the contests, to skip the
+        per contest requests for everyone else. Returns the unis of users who may have been active, or None if the platform can't tell.
+
+        It must never leave out someone who was active. When in doubt, keep them.
+        """
+        return None
+
+    def validate_handles(self, handles: List[str]) -> Dict[str, bool]:
+        """
+        Checks that handles exist on the platform, in as few requests as possible. Returns {handle => whether it exists} for the
+        handles it could tell about, leaving out the rest. By default, it can't tell about any.
+        """
+        return dict()
+
+    def pre_process_contest(self, gd: Grading, ct: Contest, usrs: List[User]) -> None:
+        """
+        Fetches and caches (on disk) what's needed to grade all users for an ended contest, so that grading doesn't have to.
+        """
+        raise Exception("Unimplemented pre_process_contest")
+
+    def pre_processed_store(self) -> CacheStore:
+        """
+        Contests' data, under (week_num, contest_id): pre-processed (on disk), or loaded while grading (in memory only).
+        """
+        return get_store(f"{self.name()}_contests", self.PRE_PROCESSED_VERSION)
+
+    def pre_processed_path(self, gd: Grading, ct: Contest) -> Path:
+        return self.pre_processed_store().path((gd.week_num, ct.contest_id))
+
+    def __migrate_pre_processed(self, gd: Grading) -> None:
+        """
+        Moves the week's files pre-processed before the cache store (<platform>_<week_num>_<contest_id>.json) into it.
+        """
+        prefix = f"{self.name()}_{gd.week_num}_"
+        for path in CACHE_PATH.glob(f"{prefix}*.json"):
+            with open(path, "r", encoding='utf-8') as f:
+                self.pre_processed_store().put((gd.week_num, path.stem[len(prefix):]), loads(f.read()), persist=True)
+            path.unlink()
+            LOG.info(f"Moved: [{path.name}] into the cache store")
+
+    def pre_processed_contests(self, gd: Grading) -> List[str]:
+        """
+        Ids of the week's contests that were pre-processed.
+        """
+        if not self.PRE_PROCESSES:
+            return []
+        self.__migrate_pre_processed(gd)
+        return [key[1] for key in self.pre_processed_store().keys((gd.week_num,))]
+
+    def is_pre_processed(self, gd: Grading, ct: Contest) -> bool:
+        if not self.PRE_PROCESSES:
+            return False
+        self.__migrate_pre_processed(gd)
+        return self.pre_processed_store().on_disk((gd.week_num, ct.contest_id))
+
+    def get_pre_processed(self, gd: Grading, ct: Contest, remember: bool = True):
+        """
+        The contest's data (pre-processed, or put in the store while grading), or None if there's none.
+        """
+        store = self.pre_processed_store()
+        data = store.get((gd.week_num, ct.contest_id), remember=remember)
+        if data is None and self.PRE_PROCESSES and self.is_pre_processed(gd, ct):
+            data = store.get((gd.week_num, ct.contest_id), remember=remember)
+        return data
+
+    def num_pre_processed_records(self, data) -> int:
+        """
+        Number of users in a contest's pre-processed data (as loaded from its file).
+        """
+        return len(data)
+
+    def needs_preprocessing(self, gd: Grading, ct: Contest, num_users: int = 0) -> bool:
+        """
+        Whether the contest has to be pre-processed (see preprocessor.py) before it can be graded, for num_users users.
+        """
+        return False
+
+    def load(self, gd: Grading, ct: Contest, usrs: List[User]) -> None:
+        """
+        Loads the contest's data for all users at once, before successful_submissions is called for each of them. Only called for bulk
+        platforms, which release it afterwards.
+        """
+        pass
+
+    def release(self, gd: Grading, ct: Contest) -> None:
+        """
+        Frees whatever data was held for the contest. Only called for bulk platforms, after all users were graded for it.
+        By default, its data is dropped from memory (see pre_processed_store).
+        """
+        if self.pre_processed_store().evict((gd.week_num, ct.contest_id)):
+            LOG.debug(f"Released data of contest: [{ct.contest_id}] of platform: [{self.name()}]")
\ No newline at end of file
@@ -1,11 +1,12 @@
-from typing import List
+from typing import Dict, List, Set
 from model.submission import Submission
 from util.web import WebRequest
+from model.request_pattern import RequestPattern
 from util.log import get_logger
 from contest_platform.base import ContestPlatformBase, Grading, User, Contest
 from datetime import datetime, timedelta
 import requests as r
-from util.datetime import in_between_dt, to_dt_from_ts
+from util.datetime import in_between_dt, to_dt_from_ts, to_dt_from_fmt, to_ts_sec
 from constants import EST_TZINFO, IST_TZINFO
 from util.common import fail
 
@@ -37,7 +38,13 @@ class Codechef(ContestPlatformBase):
     # https://www.codechef.com/api/contests/COOK127?v=1643691157039
     # https://www.codechef.com/api/rankings/START22A?sortBy=rank&order=asc&search=jo3kerr&page=1&itemsPerPage=25
     SUBMISSIONS_URL = "https://www.codechef.com/rankings/{child_contest_id}?order=asc&search={user_id}&sortBy=rank"
-    WR = WebRequest(rate_limit_millis=2000)
+    USER_URL = "https://www.codechef.com/users/{user_id}" # Redirects away for users that don't exist
+    WR = WebRequest(rate_limit_millis=2000, name="Codechef")
+    EXPECTED_SOLVED_PER_CONTEST = 2
+    REQUEST_PATTERN = RequestPattern(per_user_contest=1 + EXPECTED_SOLVED_PER_CONTEST, is_scrape=True) # Rankings page, plus a solution page per solved problem
+
+    # Recent activity reports coarse times (ex: '2 hours ago'), so look a bit further back than the first contest's start
+    PRESCREEN_SLACK_SECS = 2*60*60
 
 
     def name(self):
@@ -45,10 +52,7 @@ class Codechef(ContestPlatformBase):
 
 
     def __get_dt(self, text: str) -> datetime:
-        dt = datetime.strptime(text, "%d-%m-%Y %H:%M:%S")
-        dt = dt.replace(tzinfo=IST_TZINFO)
-        dt = dt.astimezone(EST_TZINFO)
-        return dt
+        return to_dt_from_fmt(text, "%d-%m-%Y %H:%M:%S", IST_TZINFO)
 
 
     def all_contests(self, gd: Grading) -> List[Contest]:
@@ -126,7 +130,7 @@ class Codechef(ContestPlatformBase):
         for parent_contest in parent_contests:
             parent_contest_code = parent_contest["contest_code"]
             child_contests_url = Codechef.CHILD_CONTESTS_URL.format(contest_code=parent_contest_code)
-            child_contests_resp = Codechef.WR.get(child_contests_url)
+            child_contests_resp = Codechef.WR.get(child_contests_url, endpoint=Codechef.CHILD_CONTESTS_URL)
 
             if (child_contests_resp is None) or (child_contests_resp["status"] != "success"):
                 fail(f"No child contests found for parent contest: {parent_contest_code}", LOG)
@@ -134,7 +138,7 @@ class Codechef(ContestPlatformBase):
             for child_contest_obj in child_contests_resp["child_contests"].values():
                 child_contest_code = child_contest_obj["contest_code"]
                 child_contest_url = Codechef.CHILD_CONTESTS_URL.format(contest_code=child_contest_code)
-                child_contest_resp = Codechef.WR.get(child_contest_url)
+                child_contest_resp = Codechef.WR.get(child_contest_url, endpoint=Codechef.CHILD_CONTESTS_URL)
 
                 if (child_contest_resp is None) or (child_contest_resp['status'] != "success"):
                     fail(f"Child contests details not found: {child_contest_code}", LOG)
@@ -145,13 +149,20 @@ class Codechef(ContestPlatformBase):
                     child_contests.append({**parent_contest, "child_contest_code": child_contest_code})
 
 
-        contests = [{**contest, "startDatetime": datetime.fromisoformat(contest["contest_end_date_iso"])} for contest in child_contests]
+        contests = [{**contest, "startDatetime": datetime.fromisoformat(contest["contest_start_date_iso"]), "endDatetime": datetime.fromisoformat(contest["contest_end_date_iso"])} for contest in child_contests]
         # Already filtered more accurately above (parent contests), so need for the following line.
         # contests = [contest for contest in contests if in_between_dt(contest["startDatetime"], gd.week_start_dt, gd.week_end_dt)]
         LOG.debug(f"Contests: {[c['child_contest_code'] for c in contests]}")
-        return [Contest(str(contest["child_contest_code"])) for contest in contests]
+        return [Contest(str(contest["child_contest_code"]), contest["startDatetime"], contest["endDatetime"]) for contest in contests]
         
 
+    def in_grading_week(self, gd: Grading, ct: Contest) -> bool:
+        """
+        Same filter as all_contests, long contests may span (and belong to) more than one grading week.
+        """
+        return in_between_dt(ct.contest_start_dt, gd.week_start_dt, gd.week_end_dt) or in_between_dt(ct.contest_end_dt, gd.week_start_dt, gd.week_end_dt) or in_between_dt(gd.week_start_dt, ct.contest_start_dt, ct.contest_end_dt)
+
+
     def successful_submissions(self, gd: Grading, ct: Contest, usr: User) -> Submission:
         """
             This bit it odd. Despite the clear and simple undocumented API, this api needs
@@ -166,7 +177,7 @@ class Codechef(ContestPlatformBase):
         LOG.debug(f"Submission url: {submissions_url}")
 
 
-        driver = Codechef.WR.scrape(submissions_url)
+        driver = Codechef.WR.scrape(submissions_url, Codechef.SUBMISSIONS_URL)
 
         # Get user's accepted solutions
         # Need to filter these trs a little more because codechef returns prefix matches along with exact matches for username
@@ -220,6 +231,8 @@ class Codechef(ContestPlatformBase):
         LOG.debug(f"problem names: {problem_names}")
 
         solved_questions = set()
+        solved_ts = dict()
+        excluded_ts = dict()
         for i, val in enumerate(td_vals):
             LOG.debug(f"[MAJOR*****] val: {val.text}")
             has_answered = val.find_elements_by_css_selector("a")
@@ -241,8 +254,10 @@ class Codechef(ContestPlatformBase):
                 solution_dt = self.__get_dt(li.text)
                 if in_between_dt(solution_dt, gd.week_start_dt, gd.week_end_dt):
                     solved_questions.add(problem_names[i])
+                    solved_ts[problem_names[i]] = to_ts_sec(solution_dt)
                 else:
                     LOG.debug(f"Problem: [{problem_names[i]}] was submitted at [{solution_dt}] which is not within the current grading week: [{gd.week_num}], so not counting it.")
+                    excluded_ts[problem_names[i]] = to_ts_sec(solution_dt)
 
                 if driver2 is not None:
                     driver2.quit()
@@ -251,4 +266,32 @@ class Codechef(ContestPlatformBase):
             driver.quit()
 
         LOG.debug(f"User [{usr_handle}] in contest [{ct.contest_id}] solved these questions: [{solved_questions}]")
-        return Submission(solved_questions)
+        return Submission(solved_questions, solved_ts, excluded_ts=excluded_ts)
+
+
+    def prescreen(self, gd: Grading, contests: List[Contest], usrs: List[User]) -> Set[str]:
+        """
+            The user's recent activity (the same feed practice grading pages through) lists submissions newest first. Its first page is a
+            single json request, as opposed to a scrape of the rankings (and solutions) per contest. Someone with no submission since the
+            first contest started couldn't have solved anything in any of them.
+        """
+        from practice_platform.codechef import CodechefPractice
+        since_ts_sec = min([to_ts_sec(ct.contest_start_dt) for ct in contests]) - Codechef.PRESCREEN_SLACK_SECS
+        active_unis = set()
+        for usr in usrs:
+            if usr.usr_id_map.get(self.name()) is None:
+                continue
+            try:
+                if next(CodechefPractice().iter_submissions(usr, since_ts_sec), None) is not None:
+                    active_unis.add(usr.uni)
+            except Exception as e:
+                LOG.warning(f"Unable to prescreen user: [{usr.uni}], keeping them. {e}")
+                active_unis.add(usr.uni)
+        return active_unis
+
+
+    def validate_handles(self, handles: List[str]) -> Dict[str, bool]:
+        """
+            A plain request for the user's profile page, no scrape needed to tell whether it's there.
+        """
+        return Codechef.WR.probe_handles(Codechef.USER_URL, handles)
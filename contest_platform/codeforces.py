@@ -1,12 +1,16 @@
-from typing import List
+import re
+from typing import Dict, List, Set
 from util.web import WebRequest
 from model.submission import Submission
 from util.log import get_logger
-from contest_platform.base import ContestPlatformBase, Grading, User, Contest
+from contest_platform.base import ContestPlatformBase, ContestNotReady, Grading, User, Contest
 from datetime import datetime
 import requests as r
-from util.datetime import in_between_dt, to_dt_from_ts
+from util.datetime import in_between_dt, in_between_ts, to_dt_from_ts, to_ts_sec
+from util.cache import get_store
 from util.common import fail
+from util.circuit_breaker import UserFailure
+from util.decode import dumps
 
 LOG = get_logger("Codeforces")
 
@@ -14,7 +18,13 @@ class Codeforces(ContestPlatformBase):
     PLATFORM = "Codeforces"
     CONTESTS_URL = "https://codeforces.com/api/contest.list"
     SUBMISSIONS_URL = "https://codeforces.com/api/contest.status?contestId={contest_id}&handle={user_id}"
-    WR = WebRequest(rate_limit_millis=1000)
+    USER_INFO_URL = "https://codeforces.com/api/user.info?handles={handles}"
+    USER_INFO_BATCH_SIZE = 300 # handles per user.info request, keeps the url short enough
+    HANDLE_NOT_FOUND_PATTERN = r"User with handle (\S+) not found"
+    STANDINGS_URL = "https://codeforces.com/api/contest.standings?contestId={contest_id}&handles={handles}&showUnofficial=false"
+    PRE_PROCESSES = True # Optional, users missing from a pre-processed contest's standings are fetched while grading
+    STANDINGS_CACHE = get_store("Codeforces_standings") # Pre-processed standings, with handles as a set, in memory only
+    WR = WebRequest(rate_limit_millis=1000, name="Codeforces")
 
 
     def name(self):
@@ -43,19 +53,96 @@ class Codeforces(ContestPlatformBase):
                 ...
         """
 
-        contests = Codeforces.WR.get(Codeforces.CONTESTS_URL)
-        if (contests is None) or ("result" not in contests):
-            fail(f"No contests found", LOG)
-
-        contests = contests["result"]
-        contests = [{**contest, "startDatetime": to_dt_from_ts(int(contest["startTimeSeconds"])*1000)} for contest in contests]
-        contests = [contest for contest in contests if in_between_dt(contest["startDatetime"], gd.week_start_dt, gd.week_end_dt)]
+        # Filter on the raw epoch seconds while streaming so that only the contests in the grading week are ever built
+        contests = list(Codeforces.WR.get_items(Codeforces.CONTESTS_URL, "result.item", lambda contest: in_between_ts(int(contest["startTimeSeconds"]), gd.week_start_ts_sec, gd.week_end_ts_sec)))
         LOG.debug(f"Contests: {contests}")
-        return [Contest(str(contest["id"])) for contest in contests]
+        return [Contest(str(contest["id"]), to_dt_from_ts(int(contest["startTimeSeconds"])*1000), to_dt_from_ts((int(contest["startTimeSeconds"]) + int(contest["durationSeconds"]))*1000)) for contest in contests]
         
 
+    def pre_process_contest(self, gd: Grading, ct: Contest, usrs: List[User]) -> None:
+        """
+            contest.standings takes many handles at once, so the official standings of all users are fetched in a request per batch
+            of handles, instead of a request per user while grading. Only finished contests (system tests done) are pre-processed.
+
+            Cached as {"handles": [handles asked for], "solved": {handle => {question => epoch seconds it was solved at}}}, handles in lower case.
+
+            Sample json:
+            {
+                "status": "OK",
+                "result": {
+                    "contest": {"id": 566, "phase": "FINISHED", "startTimeSeconds": 1438273200, ...},
+                    "problems": [{"contestId": 566, "index": "A", "name": "Matching Names", ...}, ...],
+                    "rows": [
+                        {
+                        "party": {"contestId": 566, "members": [{"handle": "tourist"}], "participantType": "CONTESTANT", "startTimeSeconds": 1438273200, ...},
+                        "problemResults": [{"points": 1.0, "rejectedAttemptCount": 0, "type": "FINAL", "bestSubmissionTimeSeconds": 1385}, ...],
+                        ...
+                        },
+                    ...
+        """
+        handles = sorted(set([usr.handle(self.name()) for usr in usrs if usr.usr_id_map.get(self.name()) is not None]))
+        cache_dict = {"handles": [], "solved": dict()}
+        for i in range(0, len(handles), Codeforces.USER_INFO_BATCH_SIZE):
+            batch = handles[i:i + Codeforces.USER_INFO_BATCH_SIZE]
+            while len(batch) > 0:
+                standings = Codeforces.WR.get(Codeforces.STANDINGS_URL.format(contest_id=ct.contest_id, handles=";".join(batch)))
+                if (standings is not None) and (standings.get("status") == "OK"):
+                    break
+
+                # A handle that doesn't exist fails the whole batch. It's left out, and graded (as an exception) per user.
+                not_found = re.search(Codeforces.HANDLE_NOT_FOUND_PATTERN, (standings or dict()).get("comment", ""))
+                if not_found is None:
+                    fail(f"Unable to fetch standings for contest: [{ct.contest_id}]. response: {standings}", LOG)
+                batch = [handle for handle in batch if handle.lower() != not_found.group(1).lower()]
+            if len(batch) == 0:
+                continue
+
+            if standings["result"]["contest"]["phase"] != "FINISHED":
+                fail(f"Contest: [{ct.contest_id}] isn't finished yet, its phase is: [{standings['result']['contest']['phase']}]", LOG, ContestNotReady)
+
+            problems = standings["result"]["problems"]
+            cache_dict["handles"] += [handle.lower() for handle in batch]
+            for row in standings["result"]["rows"]:
+                if row["party"]["participantType"] != "CONTESTANT":
+                    continue
+                start_ts_sec = row["party"].get("startTimeSeconds", standings["result"]["contest"]["startTimeSeconds"])
+                solved_ts = dict()
+                for problem, result in zip(problems, row["problemResults"]):
+                    if result["points"] > 0 and "bestSubmissionTimeSeconds" in result:
+                        solved_ts[problem["name"] + " -- " + problem["index"]] = start_ts_sec + result["bestSubmissionTimeSeconds"]
+                for member in row["party"]["members"]:
+                    cache_dict["solved"][member["handle"].lower()] = solved_ts
+
+        self.pre_processed_store().put((gd.week_num, ct.contest_id), cache_dict, persist=True)
+        LOG.info(f"Cached standings of: [{len(cache_dict['handles'])}] users for week: [{gd.week_num}] and contest: [{ct.contest_id}]")
+
+
+    def num_pre_processed_records(self, data) -> int:
+        return len(data["handles"])
+
+
+    def __get_pre_processed(self, gd: Grading, ct: Contest, usr_handle: str) -> Submission:
+        """
+            The user's result from the pre-processed standings, or None if the contest wasn't pre-processed for them.
+        """
+        cache_dict = Codeforces.STANDINGS_CACHE.get((gd.week_num, ct.contest_id))
+        if cache_dict is None:
+            if not self.is_pre_processed(gd, ct):
+                return None
+            standings = self.get_pre_processed(gd, ct, remember=False)
+            cache_dict = {"handles": set(standings["handles"]), "solved": standings["solved"]}
+            Codeforces.STANDINGS_CACHE.put((gd.week_num, ct.contest_id), cache_dict, size=len(dumps(standings)))
+        if usr_handle.lower() not in cache_dict["handles"]:
+            return None
+        solved_ts = cache_dict["solved"].get(usr_handle.lower(), dict())
+        LOG.debug(f"User [{usr_handle}] in contest [{ct.contest_id}] solved these questions (pre-processed): [{set(solved_ts)}]")
+        return Submission(set(solved_ts), solved_ts)
+
+
     def successful_submissions(self, gd: Grading, ct: Contest, usr: User) -> Submission:
         """
+            Uses the pre-processed standings of the contest when there are some for the user, otherwise asks for the user's submissions.
+
             Sample json:
             {
                 "status": "OK",
@@ -98,6 +185,10 @@ class Codeforces(ContestPlatformBase):
                     },
         """
         usr_handle = usr.handle(self.name())
+        pre_processed = self.__get_pre_processed(gd, ct, usr_handle)
+        if pre_processed is not None:
+            return pre_processed
+
         submissions_url = Codeforces.SUBMISSIONS_URL.format(contest_id=ct.contest_id, user_id=usr_handle)
         LOG.debug(f"Submission url: {submissions_url}")
 
@@ -110,12 +201,81 @@ class Codeforces(ContestPlatformBase):
                 LOG.error(f"Submissions not found for [{usr_handle}] in [{ct.contest_id}]. Returning 0 submissions.")
                 return Submission([])
             else:
-                fail(f"Error for user: [{usr_handle}] in contest: [{ct.contest_id}].", LOG)
+                fail(f"Error for user: [{usr_handle}] in contest: [{ct.contest_id}].", LOG, UserFailure)
 
         solved_questions = set()
+        solved_ts = dict()
         for submission in submissions["result"]:
             if submission["verdict"] == "OK" and submission["author"]["participantType"] == "CONTESTANT":
-                solved_questions.add(submission["problem"]["name"] + " -- " + submission["problem"]["index"] )
+                question = submission["problem"]["name"] + " -- " + submission["problem"]["index"]
+                solved_questions.add(question)
+                solved_ts[question] = min(solved_ts.get(question, submission["creationTimeSeconds"]), submission["creationTimeSeconds"])
 
         LOG.debug(f"User [{usr_handle}] in contest [{ct.contest_id}] solved these questions: [{solved_questions}]")
-        return Submission(solved_questions)
+        return Submission(solved_questions, solved_ts)
+
+
+    def prescreen(self, gd: Grading, contests: List[Contest], usrs: List[User]) -> Set[str]:
+        """
+            user.info takes many handles at once and reports when each user was last online. Someone who hasn't been online since
+            the first contest started couldn't have taken part in any of them.
+
+            If a batch fails (ex: a handle that doesn't exist fails the whole request), its users are kept as active.
+
+            Sample json:
+            {
+                "status": "OK",
+                "result": [
+                    {
+                    "handle": "tourist",
+                    "lastOnlineTimeSeconds": 1643934162,
+                    "registrationTimeSeconds": 1265987288,
+                    ...
+                    },
+                ...
+        """
+        first_start_ts_sec = min([to_ts_sec(ct.contest_start_dt) for ct in contests])
+        usrs = [usr for usr in usrs if usr.usr_id_map.get(self.name()) is not None]
+        active_unis = set()
+        for i in range(0, len(usrs), Codeforces.USER_INFO_BATCH_SIZE):
+            batch = usrs[i:i + Codeforces.USER_INFO_BATCH_SIZE]
+            user_info_url = Codeforces.USER_INFO_URL.format(handles=";".join([usr.handle(self.name()) for usr in batch]))
+            user_infos = Codeforces.WR.get(user_info_url)
+            if (user_infos is None) or (user_infos.get("status") != "OK") or (len(user_infos["result"]) != len(batch)):
+                LOG.warning(f"Unable to prescreen a batch of: [{len(batch)}] users. Keeping them all. response: {user_infos}")
+                active_unis.update([usr.uni for usr in batch])
+                continue
+
+            # Results are in the same order as the handles requested
+            for usr, user_info in zip(batch, user_infos["result"]):
+                if int(user_info.get("lastOnlineTimeSeconds", first_start_ts_sec)) >= first_start_ts_sec:
+                    active_unis.add(usr.uni)
+        return active_unis
+
+
+    def validate_handles(self, handles: List[str]) -> Dict[str, bool]:
+        """
+            Handles are checked in batches with user.info. A handle that doesn't exist fails the whole batch, naming it:
+            {"status": "FAILED", "comment": "handles: User with handle xyz not found"}
+            so it's marked as invalid, dropped from the batch, and the rest of the batch is asked again.
+        """
+        validity = dict()
+        for i in range(0, len(handles), Codeforces.USER_INFO_BATCH_SIZE):
+            batch = handles[i:i + Codeforces.USER_INFO_BATCH_SIZE]
+            while len(batch) > 0:
+                user_infos = Codeforces.WR.get(Codeforces.USER_INFO_URL.format(handles=";".join(batch)))
+                if (user_infos is not None) and (user_infos.get("status") == "OK"):
+                    # Handles are case insensitive, results carry the canonical one
+                    found = set([user_info["handle"].lower() for user_info in user_infos["result"]])
+                    validity.update({handle: handle.lower() in found for handle in batch})
+                    break
+
+                not_found = re.search(Codeforces.HANDLE_NOT_FOUND_PATTERN, (user_infos or dict()).get("comment", ""))
+                missing = [handle for handle in batch if not_found is not None and handle.lower() == not_found.group(1).lower()]
+                if len(missing) == 0:
+                    LOG.warning(f"Unable to validate a batch of: [{len(batch)}] handles. response: {user_infos}")
+                    break
+                LOG.debug(f"Handle: [{missing[0]}] not found")
+                validity[missing[0]] = False
+                batch = [handle for handle in batch if handle != missing[0]]
+        return validity
@@ -1,6 +1,7 @@
-from typing import List
+from typing import Dict, List
 from model.submission import Submission
 from util.web import WebRequest
+from model.request_pattern import RequestPattern
 from util.log import get_logger
 from contest_platform.base import ContestPlatformBase, Grading, User, Contest
 from datetime import datetime, timedelta
@@ -25,15 +26,26 @@ class Dmoj(ContestPlatformBase):
     # Only rated contests
     CONTESTS_URL = "https://dmoj.ca/api/v2/contests?is_rated=True"
     SUBMISSIONS_URL = "https://dmoj.ca/api/v2/contest/{contest_id}"
+    USER_URL = "https://dmoj.ca/api/v2/user/{user_id}" # 404 for users that don't exist
     
-    WR = WebRequest(rate_limit_millis=1000)
-    POINTS_CACHE = dict()
+    WR = WebRequest(rate_limit_millis=1000, name="Dmoj")
+    IS_BULK = True # The contest payload has everyone's rankings
+    REQUEST_PATTERN = RequestPattern(per_contest=1)
+    PRE_PROCESSES = True # Optional, a contest that wasn't pre-processed is fetched while grading
 
 
     def name(self):
         return Dmoj.PLATFORM
 
 
+    def pre_process_contest(self, gd: Grading, ct: Contest, usrs: List[User]) -> None:
+        """
+        Caches the contest's points data (see successful_submissions) on disk. It has everyone, so usrs isn't needed.
+        """
+        self.pre_processed_store().put((gd.week_num, ct.contest_id), self.__fetch_points(ct), persist=True)
+        LOG.info(f"Cached points data for week: [{gd.week_num}] and contest: [{ct.contest_id}] at: [{self.pre_processed_path(gd, ct)}]")
+
+
     def all_contests(self, gd: Grading) -> List[Contest]:
         """
             Dmoj's API shows all contests at once. We'll need to filter the list on our end.
@@ -81,31 +93,32 @@ class Dmoj(ContestPlatformBase):
         for contest in contests:
             curr_dt = datetime.fromisoformat(contest["start_time"])
             if in_between_dt(curr_dt, gd.week_start_dt, gd.week_end_dt):
-                curr_contests.append({**contest, "startDatetime": curr_dt})
+                curr_contests.append({**contest, "startDatetime": curr_dt, "endDatetime": datetime.fromisoformat(contest["end_time"])})
 
             if curr_dt < gd.week_start_dt:
                 LOG.debug(f"Breaking because contest: [{contest['key'] + ' -- ' + contest['name']}] started at: [{curr_dt}] and is older than: [{gd.week_start_dt}]")
                 break
                 
         LOG.debug(f"Contests: {[contest['key'] + ' -- ' + contest['name'] for contest in curr_contests]}")
-        return [Contest(str(contest['key'])) for contest in curr_contests]
+        return [Contest(str(contest['key']), contest["startDatetime"], contest["endDatetime"]) for contest in curr_contests]
 
 
-    def __get_points(self, usr: User, ct: Contest) -> Submission:
+    def __get_points(self, usr: User, ct: Contest, points: Dict[str, Dict]) -> Submission:
         usr_handle = usr.handle(self.name())
-        if usr_handle not in Dmoj.POINTS_CACHE[ct.contest_id]:
+        if usr_handle not in points:
             LOG.info(f"user: [{usr_handle}] not found in points cache for contest: [{ct.contest_id}]")
             return Submission()
 
-        val = Dmoj.POINTS_CACHE[ct.contest_id][usr_handle]
+        val = points[usr_handle]
         if val["is_disqualified"]:
             LOG.warn(f"user: [{usr_handle}] is disqualified in [{ct.contest_id}], returning 0 points")
             return Submission()
 
         LOG.debug(f"user: [{usr_handle}] in contest: [{ct.contest_id}] solved these questions: [{val['solved_questions']}]")
         if len(val["partially_solved_questions"]) > 0:
-            LOG.warn(f"user: [{usr_handle}] in contest: [{ct.contest_id}] has a partially solved questions: [{val['partially_solved_questions']}], ignoring it for now.")
-        return Submission(set(val['solved_questions']))
+            LOG.warn(f"user: [{usr_handle}] in contest: [{ct.contest_id}] has a partially solved questions: [{val['partially_solved_questions']}], not counting them (they're logged for re-scoring).")
+        partial_credit = {question["problem"]: question["points_obtained"]/question["points_total"] for question in val["partially_solved_questions"]}
+        return Submission(set(val['solved_questions']), partial_credit=partial_credit)
         
 
     def successful_submissions(self, gd: Grading, ct: Contest, usr: User) -> Submission:
@@ -117,7 +130,8 @@ class Dmoj(ContestPlatformBase):
             We can also make this part of a pre-processing step as soon as a grading week ends. For now, going with the
             cache route.
 
-            NOTE: HAVEN"T FULLY THOUGHT ABOUT PARTIAL POINTS PROBLEMS AND HOW TO GRADE THEM. For now it'll just get logged.
+            NOTE: HAVEN"T FULLY THOUGHT ABOUT PARTIAL POINTS PROBLEMS AND HOW TO GRADE THEM. For now they aren't counted, but the fraction
+            of points obtained is logged with the grading event so that calculate_points can re-score them (see --rescore).
 
             Sample json:
             {
@@ -185,15 +199,25 @@ class Dmoj(ContestPlatformBase):
                             ...
         """
 
-        # Returned cached values if present
-        if ct.contest_id in Dmoj.POINTS_CACHE:
-            return self.__get_points(usr, ct)
+        # Returned cached values if present, or pre-processed ones
+        points = self.get_pre_processed(gd, ct)
+        if points is None:
+            # To prevent any failures mid-way from leaving behind a partially formed cache
+            points = self.__fetch_points(ct)
+            self.pre_processed_store().put((gd.week_num, ct.contest_id), points)
+            LOG.info(f"Cached points data for contest: [{ct.contest_id}]")
+
+        return self.__get_points(usr, ct, points)
 
-        # Process and cache results
+
+    def __fetch_points(self, ct: Contest) -> Dict[str, Dict]:
+        """
+        The contest's payload, processed into {user => solved, partially solved questions and whether they were disqualified}.
+        """
         submissions_url = Dmoj.SUBMISSIONS_URL.format(contest_id=ct.contest_id)
         LOG.debug(f"Fetching contest info for: [{submissions_url}]")
 
-        contest_data = Dmoj.WR.get(submissions_url)
+        contest_data = Dmoj.WR.get(submissions_url, endpoint=Dmoj.SUBMISSIONS_URL)
         if (contest_data is None) or ("data" not in contest_data) or ("object" not in contest_data["data"]) or ("problems" not in contest_data["data"]["object"]) or ("rankings" not in contest_data["data"]["object"]):
             fail(f"No submission data found for: [{ct.contest_id}] at: {[submissions_url]}", LOG)
 
@@ -220,10 +244,8 @@ class Dmoj(ContestPlatformBase):
             
             cache_dict[user_name] = {"solved_questions": solved_questions, "partially_solved_questions": partially_solved_questions, "is_disqualified": disq}
 
-        # To prevent any failures mid-way from leaving behind a partially formed cache
-        Dmoj.POINTS_CACHE[ct.contest_id] = cache_dict
-        LOG.info(f"Cached points data for contest: [{ct.contest_id}]")
+        return cache_dict
 
-        return self.__get_points(usr, ct)
 
-        
+    def validate_handles(self, handles: List[str]) -> Dict[str, bool]:
+        return Dmoj.WR.probe_handles(Dmoj.USER_URL, handles)
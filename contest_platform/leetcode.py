@@ -1,13 +1,15 @@
-from typing import List
+from typing import Dict, List
 from model.submission import Submission
 from util.web import WebRequest
+from model.request_pattern import RequestPattern
 from util.log import get_logger
 from contest_platform.base import ContestPlatformBase, Grading, User, Contest
 from datetime import datetime, timedelta
 import requests as r
-from util.datetime import in_between_dt, to_dt_from_ts
+from util.datetime import in_between_dt, in_between_ts, to_dt_from_ts, to_ts_sec
 from constants import EST_TZINFO, CACHE_PATH
 from util.common import fail
+from util.circuit_breaker import UserFailure
 from math import ceil
 import json
 from pathlib import Path
@@ -34,15 +36,44 @@ class Leetcode(ContestPlatformBase):
     RANKINGS_URL = "https://leetcode.com/contest/api/ranking/{contest_id}/?pagination={page_num}&region=global"
     RANKINGS_URL_HEADERS = {"Content-type": "application/json"}
     RANKINGS_PER_PAGE = 25
-    WR = WebRequest(rate_limit_millis=2000)
+    EXPECTED_RANKING_PAGES = 500 # pages of rankings that matter (i.e at least 1 successful submission) in a typical contest
+    USERS_PER_QUERY = 50 # users looked up per (aliased) graphql query
+    CONTEST_USERS_PER_QUERY = 25 # users looked up per (aliased) graphql query for contest results, which asks for two fields per user
+    CONTEST_INFO_URL = "https://leetcode.com/contest/api/info/{contest_id}/"
+    RECENT_AC_LIMIT = 20 # the most recent accepted submissions leetcode shows for a user
 
-    POINTS_CACHE = dict()
+    # How contest results are looked up: a scrape of all rankings (pre-processed), lookups per user, or whichever takes fewer requests
+    SCRAPE = "scrape"
+    PER_USER = "per-user"
+    AUTO = "auto"
+    LOOKUP_MODE = AUTO
+    WR = WebRequest(rate_limit_millis=2000, name="Leetcode")
+
+    IS_BULK = True # Rankings are pre-processed per contest, for everyone
+    REQUEST_PATTERN = RequestPattern(per_contest=1, per_user_contest=1/CONTEST_USERS_PER_QUERY) # Contest info, then users in batches. Nothing when pre-processed.
+    PRE_PROCESSES = True
 
 
     def name(self):
         return Leetcode.PLATFORM
 
 
+    def needs_preprocessing(self, gd: Grading, ct: Contest, num_users: int = 0) -> bool:
+        return (gd.week_num, ct.contest_id) not in self.pre_processed_store() and not self.is_pre_processed(gd, ct) and self.lookup_mode(num_users) == Leetcode.SCRAPE
+
+
+    def lookup_mode(self, num_users: int) -> str:
+        """
+        Per user lookups take a request for the contest's info and one per CONTEST_USERS_PER_QUERY users, the scrape about
+        EXPECTED_RANKING_PAGES requests regardless of how many users there are. So small cohorts are looked up per user.
+        """
+        if Leetcode.LOOKUP_MODE != Leetcode.AUTO:
+            return Leetcode.LOOKUP_MODE
+        if num_users > 0 and 1 + ceil(num_users/Leetcode.CONTEST_USERS_PER_QUERY) < Leetcode.EXPECTED_RANKING_PAGES:
+            return Leetcode.PER_USER
+        return Leetcode.SCRAPE
+
+
     def all_contests(self, gd: Grading) -> List[Contest]:
         """
             Leetcode's GraphQL API shows all contests at once. We'll need to filter them.
@@ -85,7 +116,7 @@ class Leetcode(ContestPlatformBase):
                 break
                 
         LOG.debug(f"Contests: {[contest['title'] for contest in curr_contests]}")
-        return [Contest(str(contest["titleSlug"])) for contest in curr_contests]
+        return [Contest(str(contest["titleSlug"]), contest["startDatetime"], contest["startDatetime"] + timedelta(seconds=int(contest["duration"]))) for contest in curr_contests]
 
 
     def pre_process(self, gd: Grading) -> None:
@@ -130,65 +161,185 @@ class Leetcode(ContestPlatformBase):
         """
         all_contests = self.all_contests(gd)
         for ct in all_contests:
-            LOG.info(f"Pre-processing contest: [{ct.contest_id}]")
-            cache_file_name = f"{Leetcode.PLATFORM}_{gd.week_num}_{ct.contest_id}.json"
-            cache_file_path = CACHE_PATH.joinpath(cache_file_name)
-
-            if cache_file_path.exists():
-                LOG.info(f"Cache exists for contest: [{ct.contest_id}] for week: [{gd.week_num}] at: [{cache_file_path}]. Skipping..")
+            if self.is_pre_processed(gd, ct):
+                LOG.info(f"Cache exists for contest: [{ct.contest_id}] for week: [{gd.week_num}] at: [{self.pre_processed_path(gd, ct)}]. Skipping..")
                 continue
+            self.pre_process_contest(gd, ct, [])
 
-            page_num_total = float('inf')
-            page_num = 1
-            cache_dict = dict()
-            short_circuit = False
-            while (not short_circuit) and (page_num <= page_num_total):     
-                rankings_url = Leetcode.RANKINGS_URL.format(contest_id=ct.contest_id, page_num=page_num)
-                LOG.debug(f"Rankings url is: [{rankings_url}]")
 
-                rankings = Leetcode.WR.get(rankings_url)
-                if (rankings is None) or ("submissions" not in rankings) or ("total_rank" not in rankings):
-                    fail(f"No rankings/submissions found for url: [{rankings_url}]", LOG)
+    def pre_process_contest(self, gd: Grading, ct: Contest, usrs: List[User]) -> None:
+        """
+        Looks up the users' results (see lookup_mode), or scrapes all of a contest's rankings (see pre_process). The scrape has
+        everyone, so it's also done without users.
 
-                if (len(rankings["submissions"]) == 0) or (len(rankings["total_rank"]) == 0):
-                    LOG.debug(f"Empty submissions/total_rank found for url: [{rankings_url}]")
+        Cached as {"handles": [handles looked up], "solved": {handle => ["<question_id> -- <title>", ...]}} when looked up per user,
+        and as {handle => [...]} for everyone on the rankings when scraped.
+        """
+        LOG.info(f"Pre-processing contest: [{ct.contest_id}]")
+        if self.lookup_mode(len(usrs)) == Leetcode.PER_USER:
+            handles = self.__handles(usrs)
+            cache_dict = self.__lookup_per_user(ct, handles)
+            unresolved = sorted(set(handles) - set(cache_dict["handles"]))
+            if len(unresolved) == 0:
+                self.pre_processed_store().put((gd.week_num, ct.contest_id), cache_dict, persist=True)
+                LOG.info(f"Cached results of: [{len(cache_dict['handles'])}] users for week: [{gd.week_num}] and contest: [{ct.contest_id}]")
+                return
+            LOG.warning(f"Unable to look up: [{len(unresolved)}] users: [{unresolved}] for contest: [{ct.contest_id}] per user. The rankings have to be scraped.")
+
+        page_num_total = float('inf')
+        page_num = 1
+        cache_dict = dict()
+        short_circuit = False
+        while (not short_circuit) and (page_num <= page_num_total):     
+            rankings_url = Leetcode.RANKINGS_URL.format(contest_id=ct.contest_id, page_num=page_num)
+            LOG.debug(f"Rankings url is: [{rankings_url}]")
+
+            rankings = Leetcode.WR.get(rankings_url, endpoint=Leetcode.RANKINGS_URL)
+            if (rankings is None) or ("submissions" not in rankings) or ("total_rank" not in rankings):
+                fail(f"No rankings/submissions found for url: [{rankings_url}]", LOG)
+
+            if (len(rankings["submissions"]) == 0) or (len(rankings["total_rank"]) == 0):
+                LOG.debug(f"Empty submissions/total_rank found for url: [{rankings_url}]")
+                short_circuit = True
+                break
+            
+            submissions = rankings["submissions"]
+            ranks = rankings["total_rank"]
+            questions = {str(question["question_id"]): question["title"] for question in rankings["questions"]}
+
+            if page_num_total == float('inf'):
+                page_num_total = ceil(rankings["user_num"]/Leetcode.RANKINGS_PER_PAGE)
+
+            for i, rank in enumerate(ranks):
+                user_name = rank["username"]
+                solved_questions = [str(question_id) + " -- " + questions[str(question_id)] for question_id, submission in submissions[i].items()]
+                LOG.debug(f"user: [{user_name}] solved these questions: [{solved_questions}] page_num: [{page_num}]")
+                cache_dict[user_name] = solved_questions
+
+                # Short circuit if user had 0 submissions, as that is simply 0 points
+                if len(submissions[i]) == 0:
+                    LOG.debug(f"Short circuiting at page_num: [{page_num}] with url: [{rankings_url}] from user: [{user_name}] because 0 submissions have started.")
                     short_circuit = True
                     break
-                
-                submissions = rankings["submissions"]
-                ranks = rankings["total_rank"]
-                questions = {str(question["question_id"]): question["title"] for question in rankings["questions"]}
-
-                if page_num_total == float('inf'):
-                    page_num_total = ceil(rankings["user_num"]/Leetcode.RANKINGS_PER_PAGE)
-
-                for i, rank in enumerate(ranks):
-                    user_name = rank["username"]
-                    solved_questions = [str(question_id) + " -- " + questions[str(question_id)] for question_id, submission in submissions[i].items()]
-                    LOG.debug(f"user: [{user_name}] solved these questions: [{solved_questions}] page_num: [{page_num}]")
-                    cache_dict[user_name] = solved_questions
-
-                    # Short circuit if user had 0 submissions, as that is simply 0 points
-                    if len(submissions[i]) == 0:
-                        LOG.debug(f"Short circuiting at page_num: [{page_num}] with url: [{rankings_url}] from user: [{user_name}] because 0 submissions have started.")
-                        short_circuit = True
-                        break
-
-                page_num += 1
-            
-            
-            with open(cache_file_path, "w", encoding='utf-8') as f:
-                f.write(json.dumps(cache_dict))
-                LOG.info(f"Cached results for week: [{gd.week_num}] and contest: [{ct.contest_id}] at: [{cache_file_name}]")
+
+            page_num += 1
+        
+        
+        # Written atomically, so that a half written cache is never picked up by grading
+        self.pre_processed_store().put((gd.week_num, ct.contest_id), cache_dict, persist=True)
+        LOG.info(f"Cached results for week: [{gd.week_num}] and contest: [{ct.contest_id}] at: [{self.pre_processed_path(gd, ct)}]")
         
     
-    def __get_points(self, usr: User, ct: Contest) -> Submission:
+    def __graphql(self, query: str) -> Dict:
+        response = Leetcode.WR.post(Leetcode.CONTESTS_URL, data=json.dumps({"query": query}), headers=Leetcode.CONTESTS_URL_HEADERS)
+        if (response is None) or (response.get("data") is None):
+            fail(f"Graphql query failed. response: {response}", LOG)
+        return response["data"]
+
+
+    def __handles(self, usrs: List[User]) -> List[str]:
+        return sorted(set([usr.handle(self.name()) for usr in usrs if usr.usr_id_map.get(self.name()) is not None]))
+
+
+    def __is_per_user(self, data: Dict) -> bool:
+        """
+        Whether the contest's data was looked up per user, and only has the users it was looked up for (see pre_process_contest).
+        The scrape's values are all lists, so it never has a dict under "solved".
+        """
+        return isinstance(data.get("solved"), dict)
+
+
+    def num_pre_processed_records(self, data) -> int:
+        return len(data["handles"]) if self.__is_per_user(data) else len(data)
+
+
+    def __lookup_per_user(self, ct: Contest, handles: List[str]) -> Dict:
+        """
+        Looks up the users' results for the contest, as {"handles": [handles looked up], "solved": {handle => ["<question_id> -- <title>", ...]}}.
+        Users whose results couldn't be told apart this way are left out of both (the scrape is needed for them).
+
+        The contest's questions come from its info, and each user's from a graphql query with two aliased fields per user:
+        { u0_history: userContestRankingHistory(username: "abc") { attended problemsSolved contest { startTime } }
+          u0_ac: recentAcSubmissionList(username: "abc", limit: 20) { titleSlug timestamp } ... }
+
+        The ranking history says whether the user took part and how many questions they solved, and the accepted submissions made
+        during the contest say which. If the user has accepted more than RECENT_AC_LIMIT submissions since, some of the contest's
+        may not be among them anymore, so they can't be told apart.
+
+        Sample json:
+        {
+            "data": {
+                "u0_history": [{"attended": true, "problemsSolved": 2, "contest": {"startTime": 1643513400}}, ...],
+                "u0_ac": [{"titleSlug": "two-sum", "timestamp": "1643514918"}, ...],
+                ...
+            }
+        }
+        """
+        contest_info = Leetcode.WR.get(Leetcode.CONTEST_INFO_URL.format(contest_id=ct.contest_id), endpoint=Leetcode.CONTEST_INFO_URL)
+        if (contest_info is None) or ("questions" not in contest_info):
+            fail(f"No questions found for contest: [{ct.contest_id}]", LOG)
+        questions = {question["title_slug"]: str(question["question_id"]) + " -- " + question["title"] for question in contest_info["questions"]}
+
+        start_ts_sec, end_ts_sec = to_ts_sec(ct.contest_start_dt), to_ts_sec(ct.contest_end_dt)
+        cache_dict = {"handles": [], "solved": dict()}
+        for i in range(0, len(handles), Leetcode.CONTEST_USERS_PER_QUERY):
+            batch = handles[i:i + Leetcode.CONTEST_USERS_PER_QUERY]
+            query = "{ " + " ".join([f"u{j}_history: userContestRankingHistory(username: {json.dumps(handle)}) {{ attended problemsSolved contest {{ startTime }} }} "
+                f"u{j}_ac: recentAcSubmissionList(username: {json.dumps(handle)}, limit: {Leetcode.RECENT_AC_LIMIT}) {{ titleSlug timestamp }}" for j, handle in enumerate(batch)]) + " }"
+            results = self.__graphql(query)
+
+            for j, handle in enumerate(batch):
+                history = [entry for entry in (results.get(f"u{j}_history") or []) if int(entry["contest"]["startTime"]) == start_ts_sec]
+                if len(history) == 0 or not history[0]["attended"]:
+                    cache_dict["handles"].append(handle)
+                    continue
+
+                solved_questions = set([questions[submission["titleSlug"]] for submission in (results.get(f"u{j}_ac") or [])
+                    if submission["titleSlug"] in questions and in_between_ts(int(submission["timestamp"]), start_ts_sec, end_ts_sec)])
+                if len(solved_questions) != int(history[0]["problemsSolved"]):
+                    LOG.warning(f"user: [{handle}] solved: [{history[0]['problemsSolved']}] questions in contest: [{ct.contest_id}], but only: [{len(solved_questions)}] are among their recent submissions")
+                    continue
+                cache_dict["handles"].append(handle)
+                cache_dict["solved"][handle] = sorted(solved_questions)
+
+        LOG.info(f"Looked up: [{len(cache_dict['handles'])}] of: [{len(handles)}] users for contest: [{ct.contest_id}] per user")
+        return cache_dict
+
+
+    def load(self, gd: Grading, ct: Contest, usrs: List[User]) -> None:
+        """
+        Loads the pre-processed results, and looks up the users they don't cover (all of them when the contest wasn't pre-processed,
+        or those it wasn't looked up for, ex: users who registered since) at once (see lookup_mode). What's looked up while grading is
+        kept in memory only. Users that couldn't be looked up fail (see successful_submissions), until the contest is pre-processed.
+        """
+        data = self.get_pre_processed(gd, ct)
+        if data is not None and not self.__is_per_user(data):
+            return # The scrape has everyone
+        covered = set(data["handles"]) if data is not None else set()
+        missing = [handle for handle in self.__handles(usrs) if handle not in covered]
+        if len(missing) == 0 or self.lookup_mode(len(missing)) != Leetcode.PER_USER:
+            return
+        cache_dict = self.__lookup_per_user(ct, missing)
+        unresolved = sorted(set(missing) - set(cache_dict["handles"]))
+        if len(unresolved) > 0:
+            LOG.warning(f"Unable to look up: [{len(unresolved)}] users: [{unresolved}] for contest: [{ct.contest_id}] per user, their results will be exceptions. "
+                        f"Run: python3 preprocessor.py -w {gd.week_num} first to scrape the rankings.")
+        if data is not None:
+            cache_dict = {"handles": data["handles"] + cache_dict["handles"], "solved": {**data["solved"], **cache_dict["solved"]}}
+        self.pre_processed_store().put((gd.week_num, ct.contest_id), cache_dict)
+
+
+    def __get_points(self, usr: User, ct: Contest, points: Dict) -> Submission:
         usr_handle = usr.handle(self.name())
-        if usr_handle not in Leetcode.POINTS_CACHE[ct.contest_id]:
+        if self.__is_per_user(points):
+            if usr_handle not in points["handles"]:
+                fail(f"user: [{usr_handle}] wasn't looked up for contest: [{ct.contest_id}] (too many accepted submissions since, or not among the users it was looked up for). Please perform pre-processing first for this platform", LOG, UserFailure)
+            points = points["solved"]
+        if usr_handle not in points:
             LOG.info(f"user: [{usr_handle}] not found in points cache for contest: [{ct.contest_id}].")
             return Submission()
         
-        val = Leetcode.POINTS_CACHE[ct.contest_id][usr_handle]
+        val = points[usr_handle]
         LOG.debug(f"user: [{usr_handle}] in contest: [{ct.contest_id}] solved these questions: [{val}]")
         return Submission(set(val))
         
@@ -208,16 +359,37 @@ class Leetcode(ContestPlatformBase):
             Going the pre-processing route for now.
 
             NOTE: With rate-limiting pre-processing can take a lot of time here, so best to pre-process even earlier
+
+            For a small cohort, the users' results can be looked up directly instead (see load), which pre-processing does as well.
         """
 
-        if ct.contest_id not in Leetcode.POINTS_CACHE:
-            cache_file_name = f"{Leetcode.PLATFORM}_{gd.week_num}_{ct.contest_id}.json"
-            cache_file_path = CACHE_PATH.joinpath(cache_file_name)
-            if not cache_file_path.exists():
-                fail(f"Pre-processed cache missing for contest: [{ct.contest_id}] for week: [{gd.week_num}]. Please perform pre-processing first for this platform", LOG)
-            with open(cache_file_path, "r", encoding='utf-8') as f:
-                Leetcode.POINTS_CACHE[ct.contest_id] = json.loads(f.read())
+        points = self.get_pre_processed(gd, ct)
+        if points is None:
+            fail(f"Pre-processed cache missing for contest: [{ct.contest_id}] for week: [{gd.week_num}], and users couldn't be looked up one by one. Please perform pre-processing first for this platform", LOG)
+        return self.__get_points(usr, ct, points)
 
-        return self.__get_points(usr, ct)
 
-        
+    def validate_handles(self, handles: List[str]) -> Dict[str, bool]:
+        """
+        A graphql query can look up many users at once, with an alias per user:
+        { u0: matchedUser(username: "abc") { username } u1: matchedUser(username: "xyz") { username } }
+
+        Sample json (users that don't exist come back as null, along with an error per such user):
+        {
+            "data": {
+                "u0": {"username": "abc"},
+                "u1": null
+            },
+            "errors": [{"message": "That user does not exist.", "path": ["u1"], ...}]
+        }
+        """
+        validity = dict()
+        for i in range(0, len(handles), Leetcode.USERS_PER_QUERY):
+            batch = handles[i:i + Leetcode.USERS_PER_QUERY]
+            query = "{ " + " ".join([f"u{j}: matchedUser(username: {json.dumps(handle)}) {{ username }}" for j, handle in enumerate(batch)]) + " }"
+            users = Leetcode.WR.post(Leetcode.CONTESTS_URL, data=json.dumps({"query": query}), headers=Leetcode.CONTESTS_URL_HEADERS)
+            if (users is None) or (users.get("data") is None):
+                LOG.warning(f"Unable to validate a batch of: [{len(batch)}] handles. response: {users}")
+                continue
+            validity.update({handle: users["data"].get(f"u{j}") is not None for j, handle in enumerate(batch)})
+        return validity
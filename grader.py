@@ -2,42 +2,57 @@ import argparse
 from datetime import datetime
 from datetime import timedelta
 from pathlib import Path
-from typing import Dict, List, Set
+from typing import Dict, Iterator, List, Set, Tuple
 from contest_platform.base import ContestPlatformBase
 from practice_platform.base import PracticePlatformBase
 from util.datetime import get_curr_dt_est
-from practice_platform.topcoder import TopcoderPractice
-from contest_platform.topcoder import Topcoder
-from practice_platform.atcoder import AtcoderPractice
 from contest_platform.base import Grading, User, Contest
 from constants import PRACTICE_PROBLEM_MULTIPLIER, CONTEST_PROBLEM_MULTIPLIER, CACHE_PATH
-from contest_platform.codeforces import Codeforces
-from contest_platform.atcoder import Atcoder
-from contest_platform.codechef import Codechef
-from contest_platform.leetcode import Leetcode
-from contest_platform.dmoj import Dmoj
-from practice_platform.uva import UvaPractice
-from practice_platform.spoj import SpojPractice
-from practice_platform.codeforces import CodeforcesPractice
-from practice_platform.codechef import CodechefPractice
+from platform_registry import CONTEST, PRACTICE, load_platforms
 from util.datetime import get_course_week
 from util.log import get_logger
+import time
 import traceback
 from collections import defaultdict
-from csv import DictReader
+from csv import DictReader, DictWriter
 from pprint import pformat
-from util.common import star, fail
+from util.common import star, fail, parse_week_nums
+from util.circuit_breaker import CircuitBreaker, CircuitOpenException
+from util.submission_store import SubmissionStore
+from util import cache, metrics, trace
+from model.submission import Submission, SubmissionRecord
+from model.grading_event import GradingEvent
+from calculate_points import GradeSheet, check_overwrite, grade_sheet_path
+from planner import ExecutionPlan, log_estimates
+import handle_validator
 
 LOG = get_logger("Grader")
 
 # Main constants
-# NOTE: Can't move to constants.py cuz circular dependency
-CONTEST_PLATFORMS = [Codeforces(), Atcoder(), Codechef(), Dmoj(), Leetcode()]
-PRACTICE_PLATFORMS = [CodeforcesPractice(), AtcoderPractice(), CodechefPractice(), SpojPractice(), UvaPractice()]
+# NOTE: Platforms are listed in platform_registry.py, and only imported/instantiated here
+CONTEST_PLATFORMS = load_platforms(CONTEST)
+PRACTICE_PLATFORMS = load_platforms(PRACTICE)
 
+# One circuit breaker per (platform, event_type), so that a dead platform is skipped instead of being retried for every user
+CIRCUIT_BREAKERS: Dict[str, CircuitBreaker] = dict()
+# Units of grading (week_num, uni, platform_name, event_type, event_name) that were skipped because their platform was unavailable
+SKIPPED_UNITS: List[Dict[str, str]] = []
 
-def get_users() -> List[User]:
+
+def get_circuit_breaker(platform, event_type: str) -> CircuitBreaker:
+    key = f"{platform.name()}_{event_type}"
+    if key not in CIRCUIT_BREAKERS:
+        CIRCUIT_BREAKERS[key] = CircuitBreaker(key)
+    return CIRCUIT_BREAKERS[key]
+
+
+def get_users(skip_invalid: bool = True) -> List[User]:
+    """
+    Registered users from handles.csv. Unless 'skip_invalid' is unset, handles that were found not to exist (see --validate-handles)
+    are set to None, same as missing ones, so that no requests are made for them.
+    """
     users = []
+    handle_validity = handle_validator.load_handle_validity() if skip_invalid else dict()
     with open(CACHE_PATH.joinpath("handles.csv"), "r", encoding='utf-8') as f:
         reader = DictReader(f)
         for row in reader:
@@ -71,111 +86,271 @@ def get_users() -> List[User]:
                 elif " " in value:
                     LOG.error(f"User: [{name}] with uni: [{uni}] has an invalid id: [{value}] for platform: [{platform_name}]. Setting it to None for now. Needs fixing.")
                     value = None
+                elif handle_validator.is_known_invalid(handle_validity, platform_name.strip(), value):
+                    LOG.error(f"User: [{name}] with uni: [{uni}] has an id: [{value}] that doesn't exist on platform: [{platform_name}]. Setting it to None for now. Needs fixing.")
+                    value = None
                 usr_id_map[platform_name.strip()] = value
 
             users.append(User(name, uni, usr_id_map))
     return users
 
 
-EVENT_STR_TEMPLATE = r'"curr_dt": "{curr_dt}", "week_num": {week_num}, "uni": "{uni}", "platform_name": "{platform_name}", "is_exception": {is_exception}, "points": {points}, "event_type": "{event_type}", "event_name": "{event_name}"'
-def save_grade_event(grade_file_path: Path, gd: Grading, usr: User, platform, is_exception: bool, points: int, event_type: str, event_name: str) -> None:
-    event_str = EVENT_STR_TEMPLATE.format(
-        curr_dt=get_curr_dt_est().isoformat(),
-        week_num=gd.week_num,
-        uni=usr.user_id,
-        platform_name=platform.name(),
-        is_exception='true' if is_exception else 'false',
-        points=points,
-        event_type=event_type,
-        event_name=event_name)
+def save_grade_event(grade_file_path: Path, gd: Grading, usr: User, platform, is_exception: bool, points: int, event_type: str, event_name: str, is_unavailable: bool = False,
+                     problems: Dict[str, int] = None, partial_problems: Dict[str, float] = None, excluded_problems: Dict[str, int] = None) -> GradingEvent:
+    """
+    Appends the event to the grading events log (kept for audit and for calculate_points) and returns it.
+    """
+    event = GradingEvent(get_curr_dt_est().isoformat(), gd.week_num, usr.user_id, platform.name(), is_exception, points, event_type, event_name, is_unavailable,
+        problems if problems is not None else dict(), partial_problems if partial_problems is not None else dict(), excluded_problems if excluded_problems is not None else dict())
 
     with open(grade_file_path, "a", encoding='utf-8') as f:
-        f.write("{" + event_str + "}" + "\n")
+        f.write(event.to_log_line())
+    return event
+
 
 
+def practice_solved_problems(gd: Grading, usr: User, platform: PracticePlatformBase, contest_solved_questions_map: Dict[str, Set[str]], store: SubmissionStore = None, records: List[SubmissionRecord] = None) -> Dict[str, int]:
+    """
+    Practice problems solved during the grading week, {problem => epoch seconds first solved at}.
+
+    With a submission store, only new submissions are fetched and the grading week becomes a local query.
+    Platforms that can't list submissions fall back to their own solved_problems.
 
-def grade_practice(gd: Grading, usr: User, platform: PracticePlatformBase, contest_solved_questions_map: Dict[str, Set[str]], grade_file_path: Path):
+    If records were already fetched (ex: for several weeks at once) they're simply filtered for this week.
+
+    If the platform's load already worked out the problems for all users at once, those are used. The store is still synced,
+    from what was loaded.
+    """
+    solved = platform.loaded_problems(gd, usr, contest_solved_questions_map)
+    if solved is not None:
+        if records is None and store is not None and type(platform).iter_submissions is not PracticePlatformBase.iter_submissions:
+            store.sync(platform, usr, gd.week_start_ts_sec)
+        return solved
+
+    if records is not None:
+        return platform.practice_problems(records, gd, contest_solved_questions_map)
+
+    if store is None or type(platform).iter_submissions is PracticePlatformBase.iter_submissions:
+        return platform.solved_problems(gd, usr, contest_solved_questions_map)
+
+    store.sync(platform, usr, gd.week_start_ts_sec)
+    records = store.query(platform.name(), usr.handle(platform.name()), gd.week_start_ts_sec, gd.week_end_ts_sec)
+    return platform.practice_problems(records, gd, contest_solved_questions_map)
+
+
+
+def grade_practice(gd: Grading, usr: User, platform: PracticePlatformBase, contest_solved_questions_map: Dict[str, Set[str]], grade_file_path: Path, store: SubmissionStore = None, records: List[SubmissionRecord] = None) -> GradingEvent:
     practice_points = 0
+    practice_problems = dict()
     is_exception = True
+    is_unavailable = False
     try:
         if usr.handle(platform.name()) is None:
             raise Exception(f"user: [{usr.user_id}] handle for [{platform.name()}] is None")
 
         LOG.debug(f"Obtained [{contest_solved_questions_map}] for platform: [{platform.name()}]")
-        practice_points = (PRACTICE_PROBLEM_MULTIPLIER * platform.successfull_submissions(gd, usr, contest_solved_questions_map))
+        with metrics.timed(platform.name(), 'grading/practice'), trace.span(f"{platform.name()} practice", 'practice', uni=usr.uni, week_num=gd.week_num):
+            practice_problems = get_circuit_breaker(platform, 'practice').call(practice_solved_problems, gd, usr, platform, contest_solved_questions_map, store, records, key=usr.uni)
+        practice_points = (PRACTICE_PROBLEM_MULTIPLIER * len(practice_problems))
         is_exception = False
+    except CircuitOpenException as e:
+        is_unavailable = True
+        LOG.warning(f"Skipping practice for user: [{usr.user_id}]. {e}")
+        SKIPPED_UNITS.append({"week_num": gd.week_num, "uni": usr.uni, "platform_name": platform.name(), "event_type": 'practice', "event_name": ''})
+        metrics.count(platform.name(), 'grading/practice', metrics.SHORT_CIRCUITED)
     except Exception as e:
         traceback.print_exc()
         LOG.error(f"Exception for {platform.name()} ^")
+        metrics.count_exception(platform.name(), 'grading/practice', e)
 
-    save_grade_event(grade_file_path, gd, usr, platform, is_exception, practice_points, 'practice', '')
+    event = save_grade_event(grade_file_path, gd, usr, platform, is_exception, practice_points, 'practice', '', is_unavailable, practice_problems)
     LOG.debug(f"User: [{usr.user_id}] for platform: [{platform.name()}] for practice, has points: [{practice_points}]")
+    return event
 
 
 
-def grade_contest(gd: Grading, usr: User, platform: ContestPlatformBase, ct: Contest, grade_file_path: Path) -> Set[str]:
+def grade_contest(gd: Grading, usr: User, platform: ContestPlatformBase, ct: Contest, grade_file_path: Path, prefetched = None) -> Tuple[Set[str], GradingEvent]:
+    """
+    If the user's result was already prefetched (see prefetch_contest_major) it's used as is, be it a Submission or the exception raised for it.
+    """
+    contest_submission = Submission()
     contest_solved_questions = set()
     contest_points = 0
     is_exception = True
+    is_unavailable = False
     try:
         if usr.handle(platform.name()) is None:
             raise Exception(f"user: [{usr.user_id}] handle for [{platform.name()}] is None")
-        contest_submission = platform.successful_submissions(gd, ct, usr)
+        if prefetched is None:
+            with metrics.timed(platform.name(), 'grading/contest'), trace.span(f"{platform.name()} {ct.contest_id}", 'contest', uni=usr.uni, week_num=gd.week_num):
+                contest_submission = get_circuit_breaker(platform, 'contest').call(platform.successful_submissions, gd, ct, usr, key=usr.uni)
+        elif isinstance(prefetched, Exception):
+            raise prefetched
+        else:
+            contest_submission = prefetched
         contest_solved_questions = contest_submission.solved_questions
         contest_points = (CONTEST_PROBLEM_MULTIPLIER * len(contest_solved_questions))
         is_exception = False
+    except CircuitOpenException as e:
+        is_unavailable = True
+        LOG.warning(f"Skipping contest: [{ct.contest_id}] for user: [{usr.user_id}]. {e}")
+        SKIPPED_UNITS.append({"week_num": gd.week_num, "uni": usr.uni, "platform_name": platform.name(), "event_type": 'contest', "event_name": ct.contest_id})
+        metrics.count(platform.name(), 'grading/contest', metrics.SHORT_CIRCUITED)
     except Exception as e:
         traceback.print_exc()
         LOG.error(f"Exception for platform: [{platform.name()}] for contest: [{ct.contest_id}] ^")
+        metrics.count_exception(platform.name(), 'grading/contest', e)
 
-    save_grade_event(grade_file_path, gd, usr, platform, is_exception, contest_points, 'contest', ct.contest_id)
+    event = save_grade_event(grade_file_path, gd, usr, platform, is_exception, contest_points, 'contest', ct.contest_id, is_unavailable,
+        {question: contest_submission.solved_ts.get(question) for question in contest_solved_questions}, contest_submission.partial_credit, contest_submission.excluded_ts)
     LOG.debug(f"User: [{usr.user_id}] for platform: [{platform.name()}] for contest: [{ct.contest_id}] has points: [{contest_points}] <----------------------------------- THIS ---------") # For ease of spotting in the logs
-    return contest_solved_questions
+    return contest_solved_questions, event
 
 
 
-def grade(week_num: int, force: bool, uni: str, platform_name: str):
+def prefetch_contest_major(plan: ExecutionPlan, gds: List[Grading], users: List[User]) -> Dict[Tuple[int, str, str, str], object]:
     """
-    This method will iterate over all registered users for each contest based platform and practice based platform and collect the number of correct submissions
-    and gather points.
+    Runs the plan's contest-major units. Each contest is loaded once, applied to all users and released right after, so that
+    at most one contest's data is held at a time.
 
-    It will save each point decision made as an event in the log file that methods/programs later can use to build out more stats and finalize grades.
+    Returns {(week_num, platform_name, contest_id, uni) => Submission, or the exception raised for it}.
+    """
+    week_gds = {gd.week_num: gd for gd in gds}
+    prefetched = dict()
+    for week_num, platform, ct in plan.contest_major_units():
+        LOG.info(f"Grading contest: [{ct.contest_id}] of platform: [{platform.name()}] for week: [{week_num}] for all users")
+        try:
+            try:
+                with metrics.timed(platform.name(), 'grading/load'), trace.span(f"{platform.name()} {ct.contest_id} load", 'load', week_num=week_num):
+                    platform.load(week_gds[week_num], ct, users)
+            except Exception as e:
+                traceback.print_exc()
+                LOG.error(f"Unable to load contest: [{ct.contest_id}] of platform: [{platform.name()}] for all users ^. Grading them one by one.")
+                metrics.count_exception(platform.name(), 'grading/load', e)
+
+            for usr in users:
+                if usr.usr_id_map.get(platform.name()) is None:
+                    continue # grade_contest will log it
+                try:
+                    with metrics.timed(platform.name(), 'grading/contest'), trace.span(f"{platform.name()} {ct.contest_id}", 'contest', uni=usr.uni, week_num=week_num):
+                        prefetched[(week_num, platform.name(), ct.contest_id, usr.uni)] = get_circuit_breaker(platform, 'contest').call(platform.successful_submissions, week_gds[week_num], ct, usr, key=usr.uni)
+                except Exception as e:
+                    prefetched[(week_num, platform.name(), ct.contest_id, usr.uni)] = e
+        finally:
+            platform.release(week_gds[week_num], ct)
+    return prefetched
+
+
+
+def prescreen_inactive(week_platform_contests_map: Dict[int, Dict[ContestPlatformBase, List[Contest]]], gds: List[Grading], users: List[User], prefetched: Dict[Tuple[int, str, str, str], object]) -> None:
+    """
+    Asks user-major platforms who could have been active during each week's contests (see ContestPlatformBase.prescreen). Users who
+    couldn't have are given an empty Submission for those contests in prefetched, so that they get 0 point events without the per
+    contest requests. If a platform can't prescreen, or prescreening fails, everyone is graded as usual.
+    """
+    week_gds = {gd.week_num: gd for gd in gds}
+    for week_num, platform_contests in week_platform_contests_map.items():
+        for platform, contests in platform_contests.items():
+            if platform.IS_BULK or len(contests) == 0:
+                continue
+            try:
+                active_unis = platform.prescreen(week_gds[week_num], contests, users)
+            except Exception as e:
+                traceback.print_exc()
+                LOG.error(f"Unable to prescreen users for platform: [{platform.name()}] for week: [{week_num}] ^. Grading everyone.")
+                continue
+            if active_unis is None:
+                continue
 
-    However, if 'uni' is provided it will only grade for that user. If 'platform' is provided it will only grade for that platform. Supplying both will cause both
-    filters to apply.
+            inactive_users = [usr for usr in users if usr.uni not in active_unis and usr.usr_id_map.get(platform.name()) is not None]
+            LOG.info(f"Prescreened platform: [{platform.name()}] for week: [{week_num}]. Skipping [{len(contests)}] contests for [{len(inactive_users)}] inactive users: [{[usr.uni for usr in inactive_users]}]")
+            for usr in inactive_users:
+                for ct in contests:
+                    prefetched.setdefault((week_num, platform.name(), ct.contest_id, usr.uni), Submission())
+
+
+
+def load_practice(span_gd: Grading, users: List[User]) -> None:
     """
-    global CONTEST_PLATFORMS, PRACTICE_PLATFORMS
+    Lets practice platforms fetch what they can for all users at once (see PracticePlatformBase.load). If that fails, users are
+    fetched one by one as usual.
+    """
+    for platform in PRACTICE_PLATFORMS:
+        try:
+            with metrics.timed(platform.name(), 'grading/load'), trace.span(f"{platform.name()} practice load", 'load'):
+                platform.load(span_gd, users)
+        except Exception as e:
+            traceback.print_exc()
+            LOG.error(f"Unable to load practice submissions for platform: [{platform.name()}] for all users ^. Fetching them one by one.")
+            metrics.count_exception(platform.name(), 'grading/load', e)
 
-    # Some globals
-    gd = Grading(week_num=week_num) # grading timeline
-    ALL_USERS = get_users()
 
-    # Filters
-    uni = uni.strip() if uni is not None else uni
-    platform_name = platform_name.strip() if platform_name is not None else platform_name
 
-    if uni is not None and uni != "":
-        uni = uni.strip()
-        LOG.info(f"Applying uni filter: [{uni}]")
-        ALL_USERS = [usr for usr in ALL_USERS if usr.uni == uni]
+def all_contests(gd: Grading, platform: ContestPlatformBase) -> List[Contest]:
+    """
+    Contest discovery for a platform that is down shouldn't take the whole run down with it. The platform
+    is graded without contests (and practice will still go through its own circuit breaker).
+    """
+    try:
+        with trace.span(f"{platform.name()} contests", 'discovery', week_num=gd.week_num):
+            return get_circuit_breaker(platform, 'contest').call(platform.all_contests, gd)
+    except Exception as e:
+        traceback.print_exc()
+        LOG.error(f"Unable to discover contests for platform: [{platform.name()}] ^. Skipping its contests.")
+        SKIPPED_UNITS.append({"week_num": gd.week_num, "uni": "", "platform_name": platform.name(), "event_type": 'contest', "event_name": ''})
+        return []
 
-    if platform_name is not None and platform_name != "":
-        platform_name = platform_name.strip()
-        LOG.info(f"Applying platform name filter: [{platform_name}]")
-        CONTEST_PLATFORMS = [pt for pt in CONTEST_PLATFORMS if pt.name() == platform_name]
-        PRACTICE_PLATFORMS = [pt for pt in PRACTICE_PLATFORMS if pt.name() == platform_name]
-    
-    LOG.info("\n\n")
-    star(f"Grading info", LOG, 100)
-    LOG.info(f"Grading week num: [{gd.week_num}], start: [{gd.week_start_dt}], end: [{gd.week_end_dt}]")
-    LOG.info(f"Num users: [{len(ALL_USERS)}]")
-    LOG.info(f"Contest platforms: [{[pt.name() for pt in CONTEST_PLATFORMS]}]")
-    LOG.info(f"Practice platforms: [{[pt.name() for pt in PRACTICE_PLATFORMS]}]")
-    star(f".", LOG, 100)
-    LOG.info("\n\n")
-    
 
-    # Create grade file if not present
+
+def report_skipped_units(grade_file_name: str) -> None:
+    """
+    Saves the skipped units next to the grading events log and logs the commands to resume each of them.
+    """
+    if len(SKIPPED_UNITS) == 0:
+        return
+
+    skipped_file_path = CACHE_PATH.joinpath(grade_file_name.replace("grading_events", "skipped_units").replace(".log", ".csv"))
+    with open(skipped_file_path, "w", newline='', encoding='utf-8') as f:
+        writer = DictWriter(f, fieldnames=["week_num", "uni", "platform_name", "event_type", "event_name"])
+        writer.writeheader()
+        writer.writerows(SKIPPED_UNITS)
+
+    star(f"Skipped units", LOG, 100)
+    LOG.error(f"[{len(SKIPPED_UNITS)}] units were skipped because their platform was unavailable. See file: [{skipped_file_path}]")
+    for breaker in CIRCUIT_BREAKERS.values():
+        if breaker.num_short_circuited > 0 or breaker.state != CircuitBreaker.CLOSED:
+            LOG.error(f"Circuit: [{breaker.name}] is: [{breaker.state}], short-circuited calls: [{breaker.num_short_circuited}]")
+    resume_keys = sorted(set((unit["week_num"], unit["uni"], unit["platform_name"]) for unit in SKIPPED_UNITS))
+    for week_num, uni, platform_name in resume_keys:
+        uni_option = f" -u {uni}" if uni != "" else ""
+        LOG.error(f"Resume with: python3 grader.py -w {week_num}{uni_option} -p {platform_name}")
+
+
+
+def report_metrics(grade_file_name: str, **extra) -> None:
+    """
+    Logs where the run's time went, per platform and endpoint (see util.metrics), and saves it as json next to the grading events log.
+    """
+    star(f"Request metrics", LOG, 100)
+    metrics.log_summary(LOG)
+    metrics.write_report(CACHE_PATH.joinpath(grade_file_name.replace("grading_events", "metrics").replace(".log", ".json")), **extra)
+
+
+
+def report_trace(grade_file_name: str) -> None:
+    """
+    With --trace (or --profile), logs the time spent per phase and saves the trace next to the grading events log (see util.trace).
+    """
+    if trace.is_enabled():
+        star(f"Trace", LOG, 100)
+        trace.report(CACHE_PATH.joinpath(grade_file_name.replace("grading_events", "trace").replace(".log", ".json")), LOG)
+
+
+
+def prepare_grade_file(gd: Grading, force: bool, uni: str, platform_name: str) -> Path:
+    """
+    Creates the grading events file for the week, moving an older one aside if force is set.
+    """
     grade_file_name = f"grading_events_{gd.week_num}"
     if uni is not None and uni != "":
         grade_file_name += f"_{uni}"
@@ -195,30 +370,113 @@ def grade(week_num: int, force: bool, uni: str, platform_name: str):
         grade_file_path.touch()
     else:
         fail(f"Grading file [{grade_file_path}] already exists. Use force to override the older file.")
+    return grade_file_path
+
 
-    
-    # Collect all contests
-    PLATFORM_CONTESTS_MAP = {platform: platform.all_contests(gd) for platform in CONTEST_PLATFORMS} # Map of each platform's contests during the grading week
-    print_str = pformat({platform.name(): [ct.contest_id for ct in contests] for platform, contests in PLATFORM_CONTESTS_MAP.items()}, indent=2)
-    LOG.info(f"Platform contests map: [\n{print_str}\n]")
+
+def fetch_practice_records(span_gd: Grading, usr: User, platform: PracticePlatformBase, store: SubmissionStore = None) -> List[SubmissionRecord]:
+    """
+    Fetches the user's submissions for all the grading weeks at once, or None if the platform can't list submissions.
+    """
+    if type(platform).iter_submissions is PracticePlatformBase.iter_submissions:
+        return None
+    if store is not None:
+        store.sync(platform, usr, span_gd.week_start_ts_sec)
+        return store.query(platform.name(), usr.handle(platform.name()), span_gd.week_start_ts_sec, span_gd.week_end_ts_sec)
+    return list(platform.iter_submissions(usr, span_gd.week_start_ts_sec))
+
+
+
+def apply_filters(uni: str, platform_name: str, skip_invalid: bool = True) -> List[User]:
+    """
+    Registered users, and platforms (CONTEST_PLATFORMS, PRACTICE_PLATFORMS), narrowed down to the uni and/or platform if provided.
+    """
+    global CONTEST_PLATFORMS, PRACTICE_PLATFORMS
+
+    users = get_users(skip_invalid)
+    if uni is not None and uni != "":
+        LOG.info(f"Applying uni filter: [{uni}]")
+        users = [usr for usr in users if usr.uni == uni]
+
+    if platform_name is not None and platform_name != "":
+        LOG.info(f"Applying platform name filter: [{platform_name}]")
+        CONTEST_PLATFORMS = [pt for pt in CONTEST_PLATFORMS if pt.name() == platform_name]
+        PRACTICE_PLATFORMS = [pt for pt in PRACTICE_PLATFORMS if pt.name() == platform_name]
+    return users
+
+
+
+def discover_contests(gds: List[Grading], span_gd: Grading) -> Dict[int, Dict[ContestPlatformBase, List[Contest]]]:
+    """
+    Discovers contests once for all of the weeks, and splits them per week.
+    """
+    span_platform_contests_map = {platform: all_contests(span_gd, platform) for platform in CONTEST_PLATFORMS}
+    week_platform_contests_map = {gd.week_num: {platform: [ct for ct in contests if platform.in_grading_week(gd, ct)] for platform, contests in span_platform_contests_map.items()} for gd in gds}
+    for gd in gds:
+        print_str = pformat({platform.name(): [ct.contest_id for ct in contests] for platform, contests in week_platform_contests_map[gd.week_num].items()}, indent=2)
+        LOG.info(f"Platform contests map for week: [{gd.week_num}]: [\n{print_str}\n]")
+    return week_platform_contests_map
+
+
+
+def plan(week_nums: List[int], uni: str, platform_name: str) -> None:
+    """
+    Estimates how many requests and how long grading would take per platform, without grading. Only contests are discovered.
+    """
+    gds = [Grading(week_num=week_num) for week_num in sorted(set(week_nums))]
+    span_gd = Grading.span(gds)
+    users = apply_filters(uni.strip() if uni is not None else uni, platform_name.strip() if platform_name is not None else platform_name)
+    week_platform_contests_map = discover_contests(gds, span_gd)
+
+    star(f"Grading plan for weeks: [{span_gd.week_nums}] with: [{len(users)}] users", LOG, 100)
+    ExecutionPlan(week_platform_contests_map).log()
+    log_estimates(gds, week_platform_contests_map, CONTEST_PLATFORMS, PRACTICE_PLATFORMS, users)
+
+
+
+def validate_handles(uni: str, platform_name: str, force: bool) -> None:
+    """
+    Pre-flight check that every handle exists on its platform, before paying for a grading run with bad ones. Writes a report, and
+    the validity of each handle which later grading runs use to skip the invalid ones. With 'force', valid handles are checked again too.
+    """
+    users = apply_filters(uni.strip() if uni is not None else uni, platform_name.strip() if platform_name is not None else platform_name, skip_invalid=False)
+    star(f"Validating handles of: [{len(users)}] users", LOG, 100)
+    handle_validator.validate(CONTEST_PLATFORMS + PRACTICE_PLATFORMS, users, force)
+
+
+
+def grade_users(gds: List[Grading], span_gd: Grading, users: List[User], week_platform_contests_map: Dict[int, Dict[ContestPlatformBase, List[Contest]]], grade_file_paths: Dict[int, Path],
+                store: SubmissionStore = None) -> Iterator[GradingEvent]:
+    """
+    Grades the users for the (already discovered) contests and for practice, appending each week's events to its file in grade_file_paths.
+    Events are yielded as they're made, all of a user's events (for all weeks) before the next user's.
+    """
+    # Bulk platforms are graded contest by contest for all users first, the rest user by user below
+    plan = ExecutionPlan(week_platform_contests_map)
+    plan.log()
+    prefetched = prefetch_contest_major(plan, gds, users)
+    prescreen_inactive(week_platform_contests_map, gds, users, prefetched)
+    load_practice(span_gd, users)
 
     # Begin creating grading events
-    for usr in ALL_USERS:
+    for usr in users:
         star(f"Grading user: [{usr.name}] with uni: [{usr.uni}]", LOG)
 
         # 1. First calculate for contests. They carry a lot more points and so in case of double counting (submission that appear as contest submissions and normal practice problems)
         #    points obtained for contests take precedence.
-        platform_contest_solved_questions_map = defaultdict(dict)
-        for platform, contests in PLATFORM_CONTESTS_MAP.items():
-            star(f"Grading contests for user: [{usr.name}] with uni: [{usr.uni}] for platform: [{platform.name()}]", LOG)
+        week_platform_contest_solved_questions_map = {gd.week_num: defaultdict(dict) for gd in gds}
+        for gd in gds:
+            for platform, contests in week_platform_contests_map[gd.week_num].items():
+                star(f"Grading contests for user: [{usr.name}] with uni: [{usr.uni}] for platform: [{platform.name()}] for week: [{gd.week_num}]", LOG)
 
-            contest_solved_questions_map = dict()
-            for ct in contests: 
-                # Iterate on contests in the inner most loop so that we don't get rate-limited for hitting too often (despite our internal rate-limiting controls)
-                contest_solved_questions = grade_contest(gd, usr, platform, ct, grade_file_path)
-                contest_solved_questions_map[ct.contest_id] = contest_solved_questions
-            
-            platform_contest_solved_questions_map[platform.name()] = contest_solved_questions_map
+                contest_solved_questions_map = dict()
+                for ct in contests: 
+                    # Iterate on contests in the inner most loop so that we don't get rate-limited for hitting too often (despite our internal rate-limiting controls)
+                    contest_solved_questions, event = grade_contest(gd, usr, platform, ct, grade_file_paths[gd.week_num], prefetched.pop((gd.week_num, platform.name(), ct.contest_id, usr.uni), None))
+                    contest_solved_questions_map[ct.contest_id] = contest_solved_questions
+                    yield event
+                
+                week_platform_contest_solved_questions_map[gd.week_num][platform.name()] = contest_solved_questions_map
 
 
         # 2. Once all contest calculations for a user are over, calculate for practice problems. 
@@ -226,19 +484,131 @@ def grade(week_num: int, force: bool, uni: str, platform_name: str):
         #    Ensure that the problem ids/names are consistent. i.e if a problem is called A on a contest, it better be called A as a practice problem too. Find such a common name and ensure to use that and pass that around
         for platform in PRACTICE_PLATFORMS:
             star(f"Grading practice for user: [{usr.name}] with uni: [{usr.uni}] for platform: [{platform.name()}]", LOG)
-            grade_practice(gd, usr, platform, platform_contest_solved_questions_map[platform.name()], grade_file_path)
+
+            # With multiple weeks, fetch the submissions once for all of them. If that fails, each week is graded on its own.
+            records = None
+            if len(gds) > 1 and usr.usr_id_map.get(platform.name()) is not None:
+                try:
+                    with trace.span(f"{platform.name()} practice", 'practice', uni=usr.uni):
+                        records = get_circuit_breaker(platform, 'practice').call(fetch_practice_records, span_gd, usr, platform, store, key=usr.uni)
+                except Exception as e:
+                    traceback.print_exc()
+                    LOG.error(f"Unable to fetch submissions for all weeks for {platform.name()} ^. Grading each week separately.")
+
+            for gd in gds:
+                yield grade_practice(gd, usr, platform, week_platform_contest_solved_questions_map[gd.week_num][platform.name()], grade_file_paths[gd.week_num], store, records)
+
+
+
+def grade_events(week_nums: List[int], force: bool, uni: str, platform_name: str, use_store: bool = False) -> Iterator[GradingEvent]:
+    """
+    This method will iterate over all registered users for each contest based platform and practice based platform and collect the number of correct submissions
+    and gather points.
+
+    It will save each point decision made as an event in the log file that methods/programs later can use to build out more stats and finalize grades.
+
+    However, if 'uni' is provided it will only grade for that user. If 'platform' is provided it will only grade for that platform. Supplying both will cause both
+    filters to apply.
+
+    If 'use_store' is set, practice submissions are synced incrementally into the local submission store and graded from there.
+
+    Several weeks can be graded in a single pass. Contests are discovered once for all of the weeks, each user's practice submissions
+    are fetched once for all of the weeks, and the results are split per week into each week's own event log.
+
+    Events are yielded as they're made, all of a user's events (for all weeks) before the next user's.
+    """
+    # Some globals
+    started_ts_sec = time.time()
+    gds = [Grading(week_num=week_num) for week_num in sorted(set(week_nums))] # grading timelines
+    span_gd = Grading.span(gds) # grading timeline covering all weeks
+    uni = uni.strip() if uni is not None else uni
+    platform_name = platform_name.strip() if platform_name is not None else platform_name
+    with trace.span("users", 'users'):
+        ALL_USERS = apply_filters(uni, platform_name)
+    
+    LOG.info("\n\n")
+    star(f"Grading info", LOG, 100)
+    for gd in gds:
+        LOG.info(f"Grading week num: [{gd.week_num}], start: [{gd.week_start_dt}], end: [{gd.week_end_dt}]")
+    LOG.info(f"Num users: [{len(ALL_USERS)}]")
+    LOG.info(f"Contest platforms: [{[pt.name() for pt in CONTEST_PLATFORMS]}]")
+    LOG.info(f"Practice platforms: [{[pt.name() for pt in PRACTICE_PLATFORMS]}]")
+    star(f".", LOG, 100)
+    LOG.info("\n\n")
+    
+
+    # Create grade files if not present
+    grade_file_paths = {gd.week_num: prepare_grade_file(gd, force, uni, platform_name) for gd in gds}
+
+    
+    # Collect all contests, once for all weeks, and split them per week
+    WEEK_PLATFORM_CONTESTS_MAP = discover_contests(gds, span_gd) # Map of each platform's contests during each grading week
+
+    store = SubmissionStore() if use_store else None
+    yield from grade_users(gds, span_gd, ALL_USERS, WEEK_PLATFORM_CONTESTS_MAP, grade_file_paths, store)
+
+    report_skipped_units(grade_file_paths[span_gd.week_num].name)
+    cache.log_metrics(LOG)
+    report_metrics(grade_file_paths[span_gd.week_num].name, week_nums=[gd.week_num for gd in gds], num_users=len(ALL_USERS), wall_secs=round(time.time() - started_ts_sec, 1))
+    report_trace(grade_file_paths[span_gd.week_num].name)
+
+
+
+def grade(week_nums: List[int], force: bool, uni: str, platform_name: str, use_store: bool = False, emit_grades: bool = False, num_shards: int = None) -> None:
+    """
+    Grades (see grade_events). If 'emit_grades' is set, each week's grade sheet (as calculate_points would make it) is also filled
+    in as users finish, instead of having to run calculate_points after the whole run. An existing grade sheet is only replaced with 'force'.
+
+    With 'num_shards', users are graded by that many worker processes, and any that join from other hosts (see sharding.coordinate).
+    """
+    grade_sheets = dict()
+    if emit_grades:
+        for week_num in sorted(set(week_nums)):
+            grade_sheet = grade_sheet_path(week_num, uni, platform_name)
+            check_overwrite(grade_sheet, force)
+            grade_sheets[week_num] = GradeSheet(grade_sheet)
+
+    if num_shards is not None:
+        import sharding # Imports the grader itself
+        events = sharding.coordinate(week_nums, force, uni, platform_name, num_shards, use_store)
+    else:
+        events = grade_events(week_nums, force, uni, platform_name, use_store)
+    for event in events:
+        if event.week_num in grade_sheets:
+            grade_sheets[event.week_num].add(event)
+
+    for grade_sheet in grade_sheets.values():
+        grade_sheet.close()
 
 
 
 def parse_args():
     parser = argparse.ArgumentParser(description='Grader for COMS-W4995-14 Tech Interview in C++, Spring 2022')
-    parser.add_argument('-w', '--week', help="Week number, ex: 5, or 6...", required=True, dest="week_num", type=int)
+    parser.add_argument('-w', '--week', help="Week number, ex: 5, or 6... Several weeks can be graded in one pass with a range or a list, ex: 3-7 or 3,5,7", required=True, dest="week_nums", type=parse_week_nums)
     parser.add_argument('-f', '--force', help="Flag to indicate to ignore older grading events and calculate afresh", dest="force", action="store_true")
     parser.add_argument('-u', '--uni', help="Grade a particular user by providing their uni (eg: ar4160, ak3232)", dest="uni")
     parser.add_argument('-p', '--platform', help="Grade a particular platform by providing the platform name (eg: Leetcode, Codeforces, Spoj)", dest="platform_name")
+    parser.add_argument('-s', '--store', help="Flag to sync practice submissions incrementally into the local submission store and grade from there", dest="use_store", action="store_true")
+    parser.add_argument('--plan', help="Flag to only estimate the requests and wall time per platform (after discovering contests), without grading", dest="plan", action="store_true")
+    parser.add_argument('--validate-handles', help="Flag to only check that all handles exist on their platforms (with -f, the ones already found valid too), without grading", dest="validate_handles", action="store_true")
+    parser.add_argument('--shards', help="Number of local worker processes to grade with, as the coordinator of a sharded run. With 0, only workers started on other hosts (with --worker) grade", dest="num_shards", type=int)
+    parser.add_argument('--worker', help="Flag to join the sharded run of the same weeks and filters as a worker, ex: from another host that shares the cache directory", dest="worker", action="store_true")
+    parser.add_argument('--trace', help="Flag to time the run's phases (users, contest discovery, contest and practice grading, cache loads), saved as a Chrome trace next to the events log", dest="trace", action="store_true")
+    parser.add_argument('--profile', help="Flag to also profile each phase with cProfile and tracemalloc (implies --trace). Slows the run down", dest="profile", action="store_true")
+    parser.add_argument('-e', '--emit-grades', help="Flag to also fill in the grade sheet (as calculate_points would) as users finish grading", dest="emit_grades", action="store_true")
     return parser.parse_args()
 
 
 if __name__ == "__main__":
     args = parse_args()
-    grade(args.week_num, args.force, args.uni, args.platform_name)
\ No newline at end of file
+    if args.trace or args.profile:
+        trace.enable(args.profile)
+    if args.plan:
+        plan(args.week_nums, args.uni, args.platform_name)
+    elif args.validate_handles:
+        validate_handles(args.uni, args.platform_name, args.force)
+    elif args.worker:
+        import sharding
+        sharding.work(args.week_nums, args.uni, args.platform_name, args.use_store)
+    else:
+        grade(args.week_nums, args.force, args.uni, args.platform_name, args.use_store, args.emit_grades, args.num_shards)
\ No newline at end of file
@@ -0,0 +1,102 @@
+from collections import defaultdict
+from csv import DictWriter
+from pathlib import Path
+from typing import Dict, List
+from constants import CACHE_PATH
+from util.common import write_atomically
+from util.decode import loads, dumps
+from util.log import get_logger
+
+LOG = get_logger("HandleValidator")
+
+# platform_name => {handle => whether it exists}, kept across runs. The grader treats handles known to be invalid as missing.
+HANDLE_VALIDITY_PATH = CACHE_PATH.joinpath("handle_validity.json")
+HANDLE_VALIDATION_REPORT_PATH = CACHE_PATH.joinpath("handle_validation.csv")
+
+VALID = "valid"
+INVALID = "invalid"
+UNCHECKED = "unchecked"
+MISSING = "missing"
+
+
+def load_handle_validity(path: Path = HANDLE_VALIDITY_PATH) -> Dict[str, Dict[str, bool]]:
+    if not path.exists():
+        return dict()
+    with open(path, "r", encoding='utf-8') as f:
+        return loads(f.read())
+
+
+def save_handle_validity(handle_validity: Dict[str, Dict[str, bool]], path: Path = HANDLE_VALIDITY_PATH) -> None:
+    write_atomically(path, dumps(handle_validity))
+
+
+def is_known_invalid(handle_validity: Dict[str, Dict[str, bool]], platform_name: str, handle: str) -> bool:
+    return handle_validity.get(platform_name, dict()).get(handle) is False
+
+
+def validate(platforms: List, users: List, force: bool = False) -> Dict[str, Dict[str, bool]]:
+    """
+    Checks that users' handles exist on each platform, in as few requests as each platform allows (see validate_handles).
+
+    Contest and practice platforms of the same name share handles, so handles are checked once per name: by the first of its
+    platforms, and whatever it couldn't tell about by the next. Handles already known to be valid aren't checked again, unless forced.
+    Invalid ones are, as they may have been fixed on the platform since.
+    """
+    platforms_by_name = defaultdict(list)
+    for platform in platforms:
+        platforms_by_name[platform.name()].append(platform)
+
+    handle_validity = load_handle_validity()
+    for platform_name, name_platforms in platforms_by_name.items():
+        known = handle_validity.setdefault(platform_name, dict())
+        handles = sorted(set([usr.usr_id_map.get(platform_name) for usr in users]) - set([None]))
+        to_check = [handle for handle in handles if force or known.get(handle) is not True]
+        LOG.info(f"Validating: [{len(to_check)}] of: [{len(handles)}] handles for: [{platform_name}]")
+
+        for platform in name_platforms:
+            if len(to_check) == 0:
+                break
+            try:
+                checked = platform.validate_handles(to_check)
+            except Exception as e:
+                LOG.error(f"Unable to validate handles with: [{type(platform).__name__}]. {e}")
+                checked = dict()
+            known.update(checked)
+            to_check = [handle for handle in to_check if handle not in checked]
+
+        if len(to_check) > 0:
+            LOG.warning(f"Couldn't validate: [{len(to_check)}] handles for: [{platform_name}]: [{to_check}]")
+        save_handle_validity(handle_validity)
+
+    report(handle_validity, list(platforms_by_name.keys()), users)
+    return handle_validity
+
+
+def report(handle_validity: Dict[str, Dict[str, bool]], platform_names: List[str], users: List, report_path: Path = HANDLE_VALIDATION_REPORT_PATH) -> None:
+    """
+    Writes a row per (user, platform) with the handle's status, and logs the ones that need fixing in handles.csv.
+    """
+    rows = []
+    for usr in users:
+        for platform_name in platform_names:
+            handle = usr.usr_id_map.get(platform_name)
+            if handle is None:
+                status = MISSING
+            else:
+                validity = handle_validity.get(platform_name, dict()).get(handle)
+                status = UNCHECKED if validity is None else (VALID if validity else INVALID)
+            rows.append({"uni": usr.uni, "name": usr.name, "platform_name": platform_name, "handle": handle, "status": status})
+
+    with open(report_path, "w", newline='', encoding='utf-8') as f:
+        writer = DictWriter(f, fieldnames=["uni", "name", "platform_name", "handle", "status"])
+        writer.writeheader()
+        writer.writerows(rows)
+
+    for row in rows:
+        if row["status"] == INVALID:
+            LOG.error(f"User: [{row['name']}] with uni: [{row['uni']}] has a handle: [{row['handle']}] that doesn't exist on: [{row['platform_name']}]. Needs fixing.")
+
+    num_statuses = defaultdict(int)
+    for row in rows:
+        num_statuses[row["status"]] += 1
+    LOG.info(f"Handles: [{dict(num_statuses)}]. See file: {report_path}")
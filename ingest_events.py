@@ -0,0 +1,58 @@
+import argparse
+from csv import DictWriter
+from pathlib import Path
+from typing import Dict, List
+from constants import CACHE_PATH
+from util.common import parse_week_nums
+from util.event_store import EventStore
+from util.log import get_logger
+
+LOG = get_logger("IngestEvents")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Compacts all grading events logs of the term into a single store, and queries it')
+    parser.add_argument('-g', '--group-by', help=f"Print totals grouped by these comma separated columns, out of: {EventStore.GROUP_BY_COLUMNS} (eg: uni,platform_name)", dest="group_by", type=lambda val: [col.strip() for col in val.split(",") if col.strip() != ""])
+    parser.add_argument('-e', '--events', help="Print the events themselves (with the log each one came from) instead of totals", dest="list_events", action="store_true")
+    parser.add_argument('-w', '--week', help="Only for these weeks, ex: 5, 3-7 or 3,5,7", dest="week_nums", type=parse_week_nums)
+    parser.add_argument('-u', '--uni', help="Only for a particular uni (eg: ar4160, ak3232)", dest="uni")
+    parser.add_argument('-p', '--platform', help="Only for a particular platform (eg: Leetcode, Codeforces, Spoj)", dest="platform_name")
+    parser.add_argument('-o', '--output', help="Path (incl. file name) to save the results as csv, instead of printing them", dest="output_path", type=Path)
+    parser.add_argument('-n', '--no-ingest', help="Flag to only query the store, without ingesting logs first", dest="no_ingest", action="store_true")
+    return parser.parse_args()
+
+
+def output(rows: List[Dict], output_path: Path = None) -> None:
+    if len(rows) == 0:
+        LOG.info("No results")
+        return
+
+    if output_path is None:
+        for row in rows:
+            LOG.info(row)
+        return
+
+    with open(output_path, "w", newline='', encoding='utf-8') as f:
+        writer = DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+    LOG.info(f"Done. See file: {output_path}")
+
+
+def run(group_by: List[str], list_events: bool, week_nums: List[int], uni: str, platform_name: str, output_path: Path, no_ingest: bool):
+    store = EventStore()
+    try:
+        if not no_ingest:
+            store.ingest_all(CACHE_PATH)
+
+        if list_events:
+            output(store.events(week_nums, uni, platform_name), output_path)
+        elif group_by is not None:
+            output(store.totals(group_by, week_nums, uni, platform_name), output_path)
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    run(args.group_by, args.list_events, args.week_nums, args.uni, args.platform_name, args.output_path, args.no_ingest)
@@ -1,8 +1,9 @@
 from calendar import week
 from datetime import datetime, timedelta
+from typing import List
 from util.log import get_logger
 from constants import EST_TZINFO
-from util.datetime import get_course_week, get_course_week_by_num
+from util.datetime import get_course_week, get_course_week_by_num, to_ts_sec, to_ts_ms
 from util.common import fail
 
 LOG = get_logger("Grading")
@@ -15,6 +16,9 @@ class Grading:
 
     But as of now, Week nums are 1-indexed starting from datetime(2022, 1, 15, tzinfo=EST_TZINFO)
 
+    The week's start and end are also precomputed as epoch seconds/millis (both inclusive) for hot loops that
+    filter submissions on raw timestamps.
+
     """
     def __init__(self, delta: timedelta = None, week_num: int = None) -> None:
         LOG.debug(f"[delta, week_num]: [{delta}, {week_num}]")
@@ -31,3 +35,20 @@ class Grading:
             self.week_start_dt, self.week_end_dt, self.week_num = get_course_week_by_num(week_num)
         else:
             fail(f"Unknown branch of execution", LOG)
+
+        self.week_start_ts_sec, self.week_end_ts_sec = to_ts_sec(self.week_start_dt), to_ts_sec(self.week_end_dt)
+        self.week_start_ts_ms, self.week_end_ts_ms = to_ts_ms(self.week_start_dt), to_ts_ms(self.week_end_dt)
+
+
+    @staticmethod
+    def span(gds: List["Grading"]) -> "Grading":
+        """
+        A grading timeline covering all of the given weeks, i.e from the earliest week's start to the latest week's end.
+        Its week_num is that of the earliest week, and week_nums lists all of them.
+        """
+        gds = sorted(gds, key=lambda gd: gd.week_num)
+        span_gd = Grading(week_num=gds[0].week_num)
+        span_gd.week_end_dt = gds[-1].week_end_dt
+        span_gd.week_end_ts_sec, span_gd.week_end_ts_ms = to_ts_sec(span_gd.week_end_dt), to_ts_ms(span_gd.week_end_dt)
+        span_gd.week_nums = [gd.week_num for gd in gds]
+        return span_gd
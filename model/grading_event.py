@@ -0,0 +1,61 @@
+from typing import Dict
+from util.decode import dumps, loads
+
+
+class GradingEvent:
+    """
+    A single point decision made by the grader, for a user on a platform for a contest or for practice during a grading week.
+
+    Each event is saved as one json line in the grading events log (grading_events_<week_num>.log). Besides the points,
+    events carry the problems behind them so that they can be re-scored offline (see util/scoring.py):
+    - problems: {problem => epoch seconds solved at, or None if unknown}
+    - partial_problems: {problem => fraction of points obtained}
+    - excluded_problems: {problem => epoch seconds}, solved but not counted
+
+    Events logged by older graders have no problems, which is kept as None.
+    """
+
+    LOG_LINE_TEMPLATE = r'"curr_dt": "{curr_dt}", "week_num": {week_num}, "uni": "{uni}", "platform_name": "{platform_name}", "is_exception": {is_exception}, "points": {points}, "event_type": "{event_type}", "event_name": "{event_name}", "is_unavailable": {is_unavailable}, "problems": {problems}, "partial_problems": {partial_problems}, "excluded_problems": {excluded_problems}'
+
+    def __init__(self, curr_dt: str, week_num: int, uni: str, platform_name: str, is_exception: bool, points: float, event_type: str, event_name: str, is_unavailable: bool = False,
+                 problems: Dict[str, int] = None, partial_problems: Dict[str, float] = None, excluded_problems: Dict[str, int] = None) -> None:
+        self.curr_dt = curr_dt
+        self.week_num = week_num
+        self.uni = uni
+        self.platform_name = platform_name
+        self.is_exception = is_exception
+        self.points = points
+        self.event_type = event_type
+        self.event_name = event_name
+        self.is_unavailable = is_unavailable
+        self.problems = problems
+        self.partial_problems = partial_problems
+        self.excluded_problems = excluded_problems
+
+
+    def to_log_line(self) -> str:
+        event_str = GradingEvent.LOG_LINE_TEMPLATE.format(
+            curr_dt=self.curr_dt,
+            week_num=self.week_num,
+            uni=self.uni,
+            platform_name=self.platform_name,
+            is_exception='true' if self.is_exception else 'false',
+            points=self.points,
+            event_type=self.event_type,
+            event_name=self.event_name,
+            is_unavailable='true' if self.is_unavailable else 'false',
+            problems=dumps(self.problems if self.problems is not None else dict()),
+            partial_problems=dumps(self.partial_problems if self.partial_problems is not None else dict()),
+            excluded_problems=dumps(self.excluded_problems if self.excluded_problems is not None else dict()))
+        return "{" + event_str + "}" + "\n"
+
+
+    @staticmethod
+    def from_log_line(line: str) -> "GradingEvent":
+        data = loads(line)
+        return GradingEvent(data["curr_dt"], data["week_num"], data["uni"], data["platform_name"], bool(data["is_exception"]), data["points"], data["event_type"], data["event_name"],
+            bool(data.get("is_unavailable", False)), data.get("problems"), data.get("partial_problems"), data.get("excluded_problems"))
+
+
+    def __repr__(self) -> str:
+        return f"GradingEvent({self.week_num}, {self.uni}, {self.platform_name}, {self.event_type}, {self.event_name}, {self.points})"
@@ -0,0 +1,18 @@
+class RequestPattern:
+    """
+    Roughly how many requests a platform makes to grade, used to estimate how long a grading run will take (see planner.py).
+
+    - per_contest: requests per contest, shared by all users (ex: a contest's full payload)
+    - per_user_contest: requests per user per contest
+    - per_user_week: requests per user per grading week, regardless of contests (ex: a page or two of recent submissions)
+    - is_scrape: whether the requests are selenium scrapes, which are a lot slower than api calls
+    """
+    def __init__(self, per_contest: float = 0, per_user_contest: float = 0, per_user_week: float = 0, is_scrape: bool = False) -> None:
+        self.per_contest = per_contest
+        self.per_user_contest = per_user_contest
+        self.per_user_week = per_user_week
+        self.is_scrape = is_scrape
+
+
+    def num_requests(self, num_contests: int, num_users: int, num_weeks: int) -> float:
+        return self.per_contest*num_contests + self.per_user_contest*num_users*num_contests + self.per_user_week*num_users*num_weeks
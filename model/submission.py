@@ -1,6 +1,37 @@
-from typing import List, Set
+from typing import Dict, List, Set
 
 
 class Submission:
-    def __init__(self, solved_questions: Set[str] = set()) -> None:
-        self.solved_questions = solved_questions
\ No newline at end of file
+    """
+    A user's result in a contest. Besides the solved questions, platforms that know more report it, so that it can be
+    logged with the grading event and re-scored offline later on:
+    - solved_ts: {question => epoch seconds it was solved at}
+    - partial_credit: {question => fraction of its points obtained}, for questions that were only partially solved
+    - excluded_ts: {question => epoch seconds}, for questions solved but not counted by the grading rules (ex: outside the grading week)
+    """
+    def __init__(self, solved_questions: Set[str] = set(), solved_ts: Dict[str, int] = None, partial_credit: Dict[str, float] = None, excluded_ts: Dict[str, int] = None) -> None:
+        self.solved_questions = solved_questions
+        self.solved_ts = solved_ts if solved_ts is not None else dict()
+        self.partial_credit = partial_credit if partial_credit is not None else dict()
+        self.excluded_ts = excluded_ts if excluded_ts is not None else dict()
+
+class SubmissionRecord:
+    """
+    A single submission made by a user on a practice platform, normalized across platforms.
+
+    problem_id and contest_id use the same naming that each platform uses for contest grading (ex: "<name> -- <index>"
+    for Codeforces), so that they can be compared against contest solved questions. contest_id is None for problems
+    that don't belong to a contest.
+    """
+    def __init__(self, platform: str, handle: str, submission_id: str, problem_id: str, contest_id: str, verdict: str, is_accepted: bool, ts_sec: int) -> None:
+        self.platform = platform
+        self.handle = handle
+        self.submission_id = submission_id
+        self.problem_id = problem_id
+        self.contest_id = contest_id
+        self.verdict = verdict
+        self.is_accepted = is_accepted
+        self.ts_sec = ts_sec
+
+    def __repr__(self) -> str:
+        return f"SubmissionRecord({self.platform}, {self.handle}, {self.submission_id}, {self.problem_id}, {self.contest_id}, {self.verdict}, {self.ts_sec})"
@@ -0,0 +1,127 @@
+from collections import defaultdict
+from typing import Dict, Iterator, List, Tuple
+from model.contest import Contest
+from util.log import get_logger
+
+LOG = get_logger("Planner")
+
+USER_MAJOR = "user-major"
+CONTEST_MAJOR = "contest-major"
+
+
+def loop_order(platform) -> str:
+    """
+    Bulk platforms (whose data is per contest, for everyone) are graded contest-major: a contest's data is loaded once, applied to
+    all users and then released. Everything else (per user APIs) is graded user-major.
+    """
+    return CONTEST_MAJOR if getattr(platform, "IS_BULK", False) else USER_MAJOR
+
+
+class ExecutionPlan:
+    """
+    The order in which the grader goes over (week, platform, contest, user) for contests.
+
+    Contest-major units are run first, before any user is graded, and only their (small) per user results are kept around. Grading
+    then goes user by user as before, using those results for bulk platforms and fetching for the rest. So events, and the order in
+    which they're logged, stay the same: all contests of a user before their practice, one user after the other.
+    """
+
+    def __init__(self, week_platform_contests_map: Dict[int, Dict[object, List[Contest]]]) -> None:
+        self.week_platform_contests_map = week_platform_contests_map
+
+
+    def contest_major_units(self) -> Iterator[Tuple[int, object, Contest]]:
+        """
+        (week_num, platform, contest) for contests of bulk platforms, in the order they should be loaded.
+        """
+        for week_num, platform_contests in self.week_platform_contests_map.items():
+            for platform, contests in platform_contests.items():
+                if loop_order(platform) != CONTEST_MAJOR:
+                    continue
+                for ct in contests:
+                    yield week_num, platform, ct
+
+
+    def log(self) -> None:
+        for week_num, platform_contests in self.week_platform_contests_map.items():
+            for platform, contests in platform_contests.items():
+                LOG.info(f"Week: [{week_num}], platform: [{platform.name()}] with: [{len(contests)}] contests is graded: [{loop_order(platform)}]")
+
+
+# Typical time a request takes by itself, rate limits aside. Selenium scrapes start a browser and render the page.
+REQUEST_LATENCY_MILLIS = 500
+SCRAPE_LATENCY_MILLIS = 6000
+
+
+class PlatformEstimate:
+    def __init__(self, platform, kind: str, num_contests: int, num_users: int, missing_unis: List[str], num_requests: float, wall_secs: float) -> None:
+        self.platform = platform
+        self.kind = kind
+        self.num_contests = num_contests
+        self.num_users = num_users
+        self.missing_unis = missing_unis
+        self.num_requests = num_requests
+        self.wall_secs = wall_secs
+
+
+def estimate_platform(platform, kind: str, num_weeks: int, contests: List[Contest], users: List) -> PlatformEstimate:
+    """
+    Estimates the requests and wall time a platform takes, from its REQUEST_PATTERN and rate limit. Users without a handle
+    for the platform don't cost anything (they're logged as exceptions right away).
+    """
+    missing_unis = [usr.uni for usr in users if usr.usr_id_map.get(platform.name()) is None]
+    num_users = len(users) - len(missing_unis)
+    pattern = platform.REQUEST_PATTERN
+    num_requests = pattern.num_requests(len(contests), num_users, num_weeks)
+    request_millis = platform.WR.rate_limiter.expected_request_millis(SCRAPE_LATENCY_MILLIS if pattern.is_scrape else REQUEST_LATENCY_MILLIS)
+    return PlatformEstimate(platform, kind, len(contests), num_users, missing_unis, num_requests, num_requests*request_millis/1000)
+
+
+def __fmt_secs(secs: float) -> str:
+    return f"{int(secs//3600)}h {int(secs%3600//60):02d}m {int(secs%60):02d}s"
+
+
+def log_estimates(gds: List, week_platform_contests_map: Dict[int, Dict[object, List[Contest]]], contest_platforms: List, practice_platforms: List, users: List) -> List[PlatformEstimate]:
+    """
+    Logs how many requests and how long a grading run would take per platform, the critical path and the cheapest wins.
+    """
+    estimates = []
+    for platform in contest_platforms:
+        contests = [ct for week_num in week_platform_contests_map for ct in week_platform_contests_map[week_num].get(platform, [])]
+        estimates.append(estimate_platform(platform, "contest", len(gds), contests, users))
+    for platform in practice_platforms:
+        estimates.append(estimate_platform(platform, "practice", len(gds), [], users))
+
+    LOG.info(f"{'Platform':<12}{'Kind':<10}{'Contests':>10}{'Users':>8}{'Requests':>10}{'Wall time':>14}")
+    for est in estimates:
+        LOG.info(f"{est.platform.name():<12}{est.kind:<10}{est.num_contests:>10}{est.num_users:>8}{int(est.num_requests):>10}{__fmt_secs(est.wall_secs):>14}")
+
+    # The grader goes over platforms one after the other, so the run takes as long as all of them together. Split across workers
+    # by platform (-p, which grades both contests and practice of that platform), it takes as long as the slowest platform.
+    total_secs = sum([est.wall_secs for est in estimates])
+    platform_secs = defaultdict(float)
+    for est in estimates:
+        platform_secs[est.platform.name()] += est.wall_secs
+    LOG.info(f"Estimated wall time: [{__fmt_secs(total_secs)}] for: [{int(sum([est.num_requests for est in estimates]))}] requests")
+    if len(platform_secs) > 0:
+        critical_platform = max(platform_secs, key=lambda name: platform_secs[name])
+        LOG.info(f"Critical path: [{critical_platform}] with: [{__fmt_secs(platform_secs[critical_platform])}]. With a worker per platform (-p), the run takes that long.")
+        for name, secs in sorted(platform_secs.items(), key=lambda item: -item[1]):
+            if total_secs > 0 and secs/total_secs >= 0.5 and len(platform_secs) > 1:
+                LOG.warning(f"Win: [{name}] is [{int(100*secs/total_secs)}%] of the run, grade it on its own worker with: -p {name}")
+
+    # Cheapest wins
+    for est in estimates:
+        if len(est.missing_unis) > 0:
+            LOG.warning(f"Win: [{len(est.missing_unis)}] users have no handle for: [{est.platform.name()}] ({est.kind}), their units will be exceptions: [{est.missing_unis}]")
+        if est.kind == "contest" and not est.platform.IS_BULK and est.platform.REQUEST_PATTERN.per_user_contest > 0 and est.num_contests > 0 and est.num_users > 1:
+            LOG.warning(f"Win: [{est.platform.name()}] makes [{int(est.platform.REQUEST_PATTERN.per_user_contest*est.num_users*est.num_contests)}] per user contest requests. "
+                        f"A bulk fetch per contest would take about [{est.num_contests}].")
+
+    week_gds = {gd.week_num: gd for gd in gds}
+    for week_num, platform_contests in week_platform_contests_map.items():
+        for platform, contests in platform_contests.items():
+            missing = [ct.contest_id for ct in contests if platform.needs_preprocessing(week_gds[week_num], ct, len(users))]
+            if len(missing) > 0:
+                LOG.warning(f"[{platform.name()}] contests: [{missing}] of week: [{week_num}] aren't pre-processed yet. Run: python3 preprocessor.py -w {week_num} first.")
+    return estimates
@@ -0,0 +1,66 @@
+from importlib import import_module
+from typing import Dict, List
+from util.common import fail
+from util.log import get_logger
+
+LOG = get_logger("PlatformRegistry")
+
+CONTEST = "contest"
+PRACTICE = "practice"
+
+
+class PlatformSpec:
+    """
+        Name and kind of a platform along with where its implementation lives.
+
+        The implementation (and with it selenium, bs4, requests etc.) is only imported when the platform
+        is actually loaded. So offline steps that only need platform names (calculate_points, populate_gradebook)
+        don't pay for it, and don't need chromedriver to be present.
+    """
+    def __init__(self, name: str, kind: str, module_name: str, class_name: str) -> None:
+        self.name = name
+        self.kind = kind
+        self.module_name = module_name
+        self.class_name = class_name
+        self.__instance = None
+
+    def load(self):
+        if self.__instance is None:
+            LOG.debug(f"Loading {self.kind} platform: [{self.name}] from [{self.module_name}.{self.class_name}]")
+            self.__instance = getattr(import_module(self.module_name), self.class_name)()
+        return self.__instance
+
+
+# NOTE: Order matters, it's the order in which platforms are graded
+PLATFORM_SPECS = [
+    PlatformSpec("Codeforces", CONTEST, "contest_platform.codeforces", "Codeforces"),
+    PlatformSpec("Atcoder", CONTEST, "contest_platform.atcoder", "Atcoder"),
+    PlatformSpec("Codechef", CONTEST, "contest_platform.codechef", "Codechef"),
+    PlatformSpec("Dmoj", CONTEST, "contest_platform.dmoj", "Dmoj"),
+    PlatformSpec("Leetcode", CONTEST, "contest_platform.leetcode", "Leetcode"),
+    PlatformSpec("Codeforces", PRACTICE, "practice_platform.codeforces", "CodeforcesPractice"),
+    PlatformSpec("Atcoder", PRACTICE, "practice_platform.atcoder", "AtcoderPractice"),
+    PlatformSpec("Codechef", PRACTICE, "practice_platform.codechef", "CodechefPractice"),
+    PlatformSpec("Spoj", PRACTICE, "practice_platform.spoj", "SpojPractice"),
+    PlatformSpec("Uva", PRACTICE, "practice_platform.uva", "UvaPractice"),
+    PlatformSpec("Leetcode", PRACTICE, "practice_platform.leetcode", "LeetcodePractice"),
+]
+
+
+def platform_specs(kind: str) -> List[PlatformSpec]:
+    return [spec for spec in PLATFORM_SPECS if spec.kind == kind]
+
+
+def platform_names(kind: str) -> List[str]:
+    return [spec.name for spec in platform_specs(kind)]
+
+
+def load_platforms(kind: str) -> List:
+    return [spec.load() for spec in platform_specs(kind)]
+
+
+def load_platform(kind: str, name: str):
+    specs = [spec for spec in platform_specs(kind) if spec.name == name]
+    if len(specs) != 1:
+        fail(f"Unknown {kind} platform: [{name}]", LOG)
+    return specs[0].load()
@@ -1,12 +1,67 @@
 from model.user import User
 from model.grading import Grading
 from model.contest import Contest
-from typing import Dict, List, Set
+from model.submission import SubmissionRecord
+from model.request_pattern import RequestPattern
+from typing import Dict, Iterable, Iterator, List, Set
 from collections import defaultdict
+from practice_platform import pipeline
 
 class PracticePlatformBase:
+    # By default, a page of recent submissions per user per grading week
+    REQUEST_PATTERN = RequestPattern(per_user_week=1)
+    # How far apart the times reported for the same submission can be from one fetch to the next (ex: '2 hours ago'). Such submissions'
+    # ids aren't stable either, so the submission store tells them apart by problem, verdict and time instead (see SubmissionStore.sync).
+    SUBMISSION_TIME_PRECISION_SECS = 0
+
     def name() -> str:
         raise Exception("Unimplemented name")
 
     def successfull_submissions(self, gd: Grading, usr: User, usr_cts_sq: Dict[str, Set[str]] = defaultdict(set)) -> int:
-        raise Exception("Unimplemented successful_submissions")
\ No newline at end of file
+        return len(self.solved_problems(gd, usr, usr_cts_sq))
+
+    def solved_problems(self, gd: Grading, usr: User, usr_cts_sq: Dict[str, Set[str]] = defaultdict(set)) -> Dict[str, int]:
+        """
+        The grading week's start is pushed down into iter_submissions, so fetching stops as soon as submissions are older than it.
+        Platforms that can't list submissions override this instead.
+        """
+        return self.practice_problems(self.iter_submissions(usr, gd.week_start_ts_sec), gd, usr_cts_sq)
+
+    def iter_submissions(self, usr: User, since_ts_sec: int, after_submission_id: str = None) -> Iterator[SubmissionRecord]:
+        """
+        Yields the user's submissions made at or after since_ts_sec (epoch seconds), fetching no more than needed for that.
+        Platforms that can resume from a submission id may also use after_submission_id to fetch only newer submissions.
+        """
+        raise Exception("Unimplemented iter_submissions")
+
+    def load(self, gd: Grading, usrs: List[User]) -> None:
+        """
+        Fetches what it can for all users at once (ex: in a few batched requests), before they're graded one by one. gd covers all the
+        weeks being graded.
+        """
+        pass
+
+    def loaded_problems(self, gd: Grading, usr: User, usr_cts_sq: Dict[str, Set[str]] = defaultdict(set)) -> Dict[str, int]:
+        """
+        The user's practice problems for the grading week (see practice_problems), if load already worked them out for all users
+        at once. None otherwise, which is the default.
+        """
+        return None
+
+    def validate_handles(self, handles: List[str]) -> Dict[str, bool]:
+        """
+        Checks that handles exist on the platform, in as few requests as possible. Returns {handle => whether it exists} for the
+        handles it could tell about, leaving out the rest. By default, it can't tell about any.
+        """
+        return dict()
+
+    def practice_problems(self, records: Iterable[SubmissionRecord], gd: Grading, usr_cts_sq: Dict[str, Set[str]] = defaultdict(set)) -> Dict[str, int]:
+        """
+        Distinct problems accepted within the grading week, excluding problems already solved during a contest the user
+        took part in (usr_cts_sq). Returned as {problem_key => epoch seconds it was first solved at}.
+        """
+        records = pipeline.in_window(pipeline.accepted(records), gd.week_start_ts_sec, gd.week_end_ts_sec)
+        return pipeline.flatten(pipeline.subtract_contest_solved(pipeline.distinct_problems(records), usr_cts_sq))
+
+    def count_practice(self, records: Iterable[SubmissionRecord], gd: Grading, usr_cts_sq: Dict[str, Set[str]] = defaultdict(set)) -> int:
+        return len(self.practice_problems(records, gd, usr_cts_sq))
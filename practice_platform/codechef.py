@@ -1,23 +1,32 @@
 from collections import defaultdict
 from os import link
-from typing import Dict, List, Set, Tuple
+from typing import Dict, Iterator, List, Set, Tuple
 from constants import EST_TZINFO, IST_TZINFO
-from model.submission import Submission
+from model.submission import Submission, SubmissionRecord
 from util.web import WebRequest
+from model.request_pattern import RequestPattern
 from util.log import get_logger
 from contest_platform.base import ContestPlatformBase, Grading, User, Contest
+from practice_platform.base import PracticePlatformBase
 from datetime import datetime, timedelta, tzinfo
 import requests as r
-from util.datetime import in_between_dt, to_dt_from_ts
+from util.datetime import in_between_dt, in_between_ts, to_dt_from_ts, to_dt_from_fmt, to_ts_sec
 from util.common import fail
 import re
-from bs4 import BeautifulSoup
 from util.datetime import get_curr_dt_est
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# lxml is optional, and parses recent activity pages a lot faster. Without it we fall back to the standard library parser.
+try:
+    import lxml
+    DEFAULT_HTML_PARSER = "lxml"
+except ImportError:
+    DEFAULT_HTML_PARSER = "html.parser"
 
 LOG = get_logger("CodechefPractice")
 
 
-class CodechefPractice(ContestPlatformBase):
+class CodechefPractice(PracticePlatformBase):
     """
         Codechef does not have an official API. Scraping is possible, but for things that matter
         codechef uses simple API calls to fetch data that seem to not need authentication.
@@ -31,7 +40,14 @@ class CodechefPractice(ContestPlatformBase):
     SUBMISSIONS_URL = "https://www.codechef.com/recent/user?page={page_num}&user_handle={user_id}"
     START_PAGE_NUM = 0
     TIME_PARSE_REGEX = re.compile("([0-9]+).*(min|sec|hour)")
-    WR = WebRequest(rate_limit_millis=2000)
+    # Time cell (the first one) of each row, read off the raw html to tell whether a page goes back past since_ts_sec before parsing it
+    ROW_TIME_REGEX = re.compile(r"""<tr[^>]*>\s*<td[^>]*\stitle=["']([^"']*)["']""")
+    HTML_PARSER = DEFAULT_HTML_PARSER # Any BeautifulSoup features, ex: 'lxml', 'html.parser'. Rows are extracted the same with all of them.
+    # Fetches the next page while the current one is parsed. A single worker, as pages come one after the other.
+    PREFETCHER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="CodechefPrefetch")
+    WR = WebRequest(rate_limit_millis=2000, name="CodechefPractice")
+    REQUEST_PATTERN = RequestPattern(per_user_week=2) # Recent activity pages are short, a week usually takes a couple
+    SUBMISSION_TIME_PRECISION_SECS = 61*60 # 'x hours ago' is off by up to an hour, absolute times by up to a minute
 
 
     def name(self):
@@ -43,19 +59,17 @@ class CodechefPractice(ContestPlatformBase):
         if len(matches) != 0:
             curr_dt = get_curr_dt_est()
             val = int(matches[0][0])
+            # Recent submissions are reported relative to now, ex: '2 min ago'
             if "min" in time_text:
-                return curr_dt + timedelta(minutes=val)
+                return curr_dt - timedelta(minutes=val)
             elif "hour" in time_text:
-                return curr_dt + timedelta(hours=val)
+                return curr_dt - timedelta(hours=val)
             elif "sec" in time_text:
-                return curr_dt + timedelta(seconds=val)
+                return curr_dt - timedelta(seconds=val)
             else:
                 fail(f"Unexpected path for time parsing: [{time_text}]", LOG)
         else:
-            curr_dt = datetime.strptime(time_text, "%I:%M %p %d/%m/%y")
-            curr_dt = curr_dt.replace(tzinfo=IST_TZINFO)
-            curr_dt = curr_dt.astimezone(EST_TZINFO)
-            return curr_dt
+            return to_dt_from_fmt(time_text, "%I:%M %p %d/%m/%y", IST_TZINFO)
 
 
     def __get_pb_ct(self, link_text: str) -> Tuple[str, str]:
@@ -74,80 +88,87 @@ class CodechefPractice(ContestPlatformBase):
             fail(f"Unexpected parts: [{parts}] for link: [{link_text}], expected: '/problems/HS08TEST' or '/START24C/problems/SPECIALSTR'", LOG)
         
 
-    def successfull_submissions(self, gd: Grading, usr: User, usr_cts_sq: Dict[str, Set[str]] = defaultdict(set)) -> int:
+    def __fetch_page(self, usr_handle: str, page_num: int) -> Dict:
+        submissions_url = CodechefPractice.SUBMISSIONS_URL.format(page_num=page_num, user_id=usr_handle)
+        LOG.debug(f"Submission url: [{submissions_url}]")
+
+        submission_data = CodechefPractice.WR.get(submissions_url)
+        if (submission_data is None) or ("max_page" not in submission_data) or ("content" not in submission_data ):
+            fail(f"Submission data not found for: [{submissions_url}]", LOG)
+        return submission_data
+
+
+    def __is_within(self, content: str, since_ts_sec: int) -> bool:
+        """
+        Whether all of the page's submissions are at or after since_ts_sec, i.e. the next page is needed too.
+        False if the page's rows can't be made out, which only costs the prefetch.
+        """
+        time_texts = CodechefPractice.ROW_TIME_REGEX.findall(content)
+        if len(time_texts) == 0 or time_texts[-1].strip() == "No Recent Activity":
+            return False
+        try:
+            return to_ts_sec(self.__get_dt(time_texts[-1].strip())) >= since_ts_sec
+        except Exception:
+            return False
+
+
+    def __iter_pages(self, usr_handle: str, since_ts_sec: int) -> Iterator[Dict]:
+        """
+        Yields the user's recent activity pages, from START_PAGE_NUM to max_page. While a page is being parsed, the next one is already
+        being fetched (within the rate limit, by PREFETCHER), but only when the page's oldest row is still at or after since_ts_sec.
+        When it isn't, parsing the page short-circuits, so nothing is fetched ahead of it.
+
+        NOTE: A prefetch that's already running isn't stopped when the caller stops early (ex: the Codechef prescreen closes it after
+        the first page), it's left to finish and its page is dropped. That's at most one request per user.
         """
-            The submissions url for a user returns a json that has html in it. So, we gotta parse
-            that html and extract submission data.
+        submission_data = self.__fetch_page(usr_handle, CodechefPractice.START_PAGE_NUM)
+        max_page_num = int(submission_data["max_page"])
+        for curr_page_num in range(CodechefPractice.START_PAGE_NUM, max_page_num + 1):
+            if submission_data is None:
+                submission_data = self.__fetch_page(usr_handle, curr_page_num)
+            next_page: Future = None
+            if curr_page_num < max_page_num and self.__is_within(submission_data["content"], since_ts_sec):
+                next_page = CodechefPractice.PREFETCHER.submit(self.__fetch_page, usr_handle, curr_page_num + 1)
+
+            yield submission_data
+
+            submission_data = next_page.result() if next_page is not None else None
 
-            Complications include recent timestamps being reported as '1 sec ago, '2 min ago', '12 hours ago',
-            some problems belonging to a contest and some belonging to other problem lists. We'll need to exclude
-            only those problems that are part of a contest that the user submitted successfully during the contest.
+
+    def iter_submissions(self, usr: User, since_ts_sec: int, after_submission_id: str = None) -> Iterator[SubmissionRecord]:
+        """
+        Pages through the user's recent activity (newest first) until submissions older than since_ts_sec show up.
+
+        The submissions url for a user returns a json that has html in it. So, we gotta parse that html and extract submission data.
+
+        Complications include recent timestamps being reported as '1 sec ago, '2 min ago', '12 hours ago',
+        some problems belonging to a contest and some belonging to other problem lists. Only those problems that are part of a contest
+        that the user submitted successfully during the contest are excluded later on (see usr_cts_sq).
+
+        Codechef doesn't expose submission ids here, so the id is made up of the submission's time, problem and status. Times relative
+        to now make it change from one fetch to the next, see SUBMISSION_TIME_PRECISION_SECS.
         """
         usr_handle = usr.handle(self.name())
-        short_circuit=False
-        max_page_num = float('inf')
-        curr_page_num = CodechefPractice.START_PAGE_NUM
-        separate_practice_problems = set()
-        contest_practice_problems = defaultdict(set)
-        while (not short_circuit) and (curr_page_num <= max_page_num):
-            submissions_url = CodechefPractice.SUBMISSIONS_URL.format(page_num=curr_page_num, user_id=usr_handle)
-            LOG.debug(f"Submission url: [{submissions_url}]")
-
-            submission_data = CodechefPractice.WR.get(submissions_url)
-            if (submission_data is None) or ("max_page" not in submission_data) or ("content" not in submission_data ):
-                fail(f"Submission data not found for: [{submissions_url}]", LOG)
-
-            if max_page_num == float("inf"):
-                max_page_num = int(submission_data["max_page"])
-
-            submission_html = submission_data["content"]
-            soup = BeautifulSoup(submission_html, features="html.parser")
-            tr_vals = soup.select("table[class='dataTable'] > tbody > tr")
-            LOG.debug(f"num tr_vals: [{len(tr_vals)}]")
-
-            for i, tr_val in enumerate(tr_vals):
-                td_vals = tr_val.select("td")
-                LOG.debug(f"\tnum td_vals: [{len(td_vals)}]")
-
-                if i == 0 and len(tr_vals) == 1 and len(td_vals) == 1 and td_vals[0].get('title').strip() == "No Recent Activity":
-                    LOG.debug(f"No activity found for user: [{usr_handle}]. Returning.")
-                    short_circuit = True
-                    break
-
-                time_text = td_vals[0].get("title").strip()
-                link_text = td_vals[1].select_one("a").get("href").strip()
-                status = td_vals[2].select_one("span").get("title").strip()
-                LOG.debug(f"\t{time_text} -- {link_text} -- {status}")
-                
-                curr_dt = self.__get_dt(time_text)
-                problem_id, contest_id = self.__get_pb_ct(link_text)
-
-                if status == "accepted" and in_between_dt(curr_dt, gd.week_start_dt, gd.week_end_dt):
-                    if contest_id is None:
-                        separate_practice_problems.add(problem_id)
-                    else:
-                        contest_practice_problems[contest_id].add(problem_id)
-                
-                if curr_dt < gd.week_start_dt:
-                    short_circuit = True
-                    break
-
-            curr_page_num += 1
-
-        real_practice_problems = dict()
-        for contest_id, problems in contest_practice_problems.items():
-            if contest_id in usr_cts_sq:
-                LOG.debug(f"User: [{usr_handle}] for contest: [{contest_id}] problems: [{problems}], contest_problems: [{usr_cts_sq[contest_id]}]")
-                separate_problems = problems - usr_cts_sq[contest_id]
-                LOG.debug(f"User: [{usr_handle}] already participared in contest: [{contest_id}]. Unsolved, i.e num practice problems are: [{len(separate_problems)}] which are: [{separate_problems}]")
-                real_practice_problems[contest_id] = separate_problems
-            else:
-                real_practice_problems[contest_id] = problems
-            
-        num_real_practice_problems = sum([len(problems) for problems in real_practice_problems.values()])
-        num_separate_practice_problems = len(separate_practice_problems)
-        LOG.debug(f"User: [{usr_handle}] has solved contest's problems as practice later: [{num_real_practice_problems}] questions: [{real_practice_problems}]")
-        LOG.debug(f"User: [{usr_handle}] has solved separate non-contest practice problems: [{num_separate_practice_problems}] questions: [{separate_practice_problems}]")
-        total =  num_real_practice_problems + num_separate_practice_problems
-        LOG.debug(f"User: [{usr_handle}] has total: [{total}] problems as practice")
-        return total
+        from bs4 import BeautifulSoup # Imported lazily, only needed when actually scraping
+        pages = self.__iter_pages(usr_handle, since_ts_sec)
+        try:
+            for submission_data in pages:
+                soup = BeautifulSoup(submission_data["content"], features=CodechefPractice.HTML_PARSER)
+                tr_vals = soup.select("table[class='dataTable'] > tbody > tr")
+                for i, tr_val in enumerate(tr_vals):
+                    td_vals = tr_val.select("td")
+                    if i == 0 and len(tr_vals) == 1 and len(td_vals) == 1 and td_vals[0].get('title').strip() == "No Recent Activity":
+                        LOG.debug(f"No activity found for user: [{usr_handle}]. Returning.")
+                        return
+
+                    time_text = td_vals[0].get("title").strip()
+                    link_text = td_vals[1].select_one("a").get("href").strip()
+                    status = td_vals[2].select_one("span").get("title").strip()
+
+                    curr_ts_sec = to_ts_sec(self.__get_dt(time_text))
+                    if curr_ts_sec < since_ts_sec:
+                        return
+                    problem_id, contest_id = self.__get_pb_ct(link_text)
+                    yield SubmissionRecord(self.name(), usr_handle, f"{curr_ts_sec}:{link_text}:{status}", problem_id, contest_id, status, status == "accepted", curr_ts_sec)
+        finally:
+            pages.close() # Cancels the prefetch of a page that's no longer needed
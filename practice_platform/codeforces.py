@@ -1,4 +1,5 @@
-from typing import Dict, List, Set
+from typing import Dict, Iterator, List, Set
+from model.submission import SubmissionRecord
 from util.datetime import to_dt_from_ts
 from model.user import User
 from model.grading import Grading
@@ -6,8 +7,9 @@ from model.contest import Contest
 from practice_platform.base import PracticePlatformBase
 from util.web import WebRequest
 from util.common import fail
+from util.circuit_breaker import UserFailure
 from util.log import get_logger
-from util.datetime import in_between_dt
+from util.datetime import in_between_dt, in_between_ts
 from collections import defaultdict
 
 LOG = get_logger("CodeforcesPractice")
@@ -18,6 +20,11 @@ class CodeforcesPractice(PracticePlatformBase):
     Codeforces has a well documented API, which is what we'll be using.
 
     Source: https://codeforces.com/apiHelp/methods
+
+    NOTE: Unlike Uva (see UvaPractice.load), there's no vectorized path. user.status is paged newest first and paging stops at the
+    grading week's start, so only a few pages per user are ever fetched, well below MIN_VECTORIZED_ROWS (util/vectorized.py). Rows are
+    json objects keyed by problem names, which would have to be copied into arrays first, and the time goes into the rate limited
+    requests, not into filtering them.
     """
 
     PLATFORM = "Codeforces"
@@ -28,20 +35,18 @@ class CodeforcesPractice(PracticePlatformBase):
     SUBMISSIONS_COUNT = 50
     START_FROM_COUNT = 1
 
-    WR = WebRequest(rate_limit_millis=1000)
+    WR = WebRequest(rate_limit_millis=1000, name="CodeforcesPractice")
 
     def name(self) -> str:
         return CodeforcesPractice.PLATFORM
 
 
-    def successfull_submissions(self, gd: Grading, usr: User, usr_cts_sq: Dict[str, Set[str]] = defaultdict(set)) -> int:
+    def iter_submissions(self, usr: User, since_ts_sec: int, after_submission_id: str = None) -> Iterator[SubmissionRecord]:
         """
-        Generally problems belong to various contests. We don't want to double count problems.
-        If a user solved it in a contest we do not want to add points for it again for problems.
+        Pages through user.status (newest first) until submissions older than since_ts_sec show up.
 
-        cts list is the list of contests that the user participated in and each of those contest
-        objects will have the solved questions. We'll be using that to disambiguate and prevent
-        double count.
+        Generally problems belong to various contests. Problem ids are the same as in contest grading, so that problems
+        a user solved during a contest are not counted again as practice problems.
 
         Sample json:
         {
@@ -72,52 +77,23 @@ class CodeforcesPractice(PracticePlatformBase):
                 ...
         """
         usr_handle = usr.handle(self.name())
-        short_circuit = False
-        separately_solved_questions = defaultdict(set) # {contest => set(problem_id)]}
-        curr_count = 1
-        while not short_circuit:
+        curr_count = CodeforcesPractice.START_FROM_COUNT
+        while True:
             submissions_url = CodeforcesPractice.SUBMISSIONS_URL.format(user_id=usr_handle, from_count=curr_count, submission_count=CodeforcesPractice.SUBMISSIONS_COUNT)
             LOG.debug(f"Submissions url: [{submissions_url}]")
-            
+
             submissions = CodeforcesPractice.WR.get(submissions_url)
             if (submissions is None) or ("status" not in submissions) or (submissions["status"] != "OK"):
-                fail(f"No submissions found for user: [{usr.user_id}] at [{submissions_url}]", LOG)
-
-            if (len(submissions["result"]) == 0):
-                short_circuit = True
-                break
-
-            # NOTE: Submissions are returned desc order of submission id, which normally changes linearly with submission time. So we can short-circuit
-            # when one of the submission is past the limits
-            submissions = submissions["result"]
-
-            for submission in submissions:
-                curr_dt = to_dt_from_ts(submission["creationTimeSeconds"]*1000)
-                verdict = submission["verdict"]
-                contest_id = str(submission["contestId"])
-                problem_id = submission["problem"]["name"] + " -- " + submission["problem"]["index"]
-                
-                if in_between_dt(curr_dt, gd.week_start_dt, gd.week_end_dt) and verdict == "OK":
-                    separately_solved_questions[contest_id].add(problem_id)
-
-                if curr_dt < gd.week_start_dt:
-                    LOG.debug(f"Curr dt: [{curr_dt}] is less than [{gd.week_start_dt}], so short circuiting.")
-                    short_circuit = True
-                    break
+                # Codeforces answers FAILED for the handle (ex: it doesn't exist), other answers are the platform's
+                fail(f"No submissions found for user: [{usr.user_id}] at [{submissions_url}]", LOG, UserFailure if (submissions or dict()).get("status") == "FAILED" else Exception)
+
+            if len(submissions["result"]) == 0:
+                return
+
+            for submission in submissions["result"]:
+                if submission["creationTimeSeconds"] < since_ts_sec:
+                    return
+                yield SubmissionRecord(self.name(), usr_handle, str(submission["id"]), submission["problem"]["name"] + " -- " + submission["problem"]["index"],
+                    str(submission["contestId"]), submission.get("verdict"), submission.get("verdict") == "OK", submission["creationTimeSeconds"])
 
             curr_count += CodeforcesPractice.SUBMISSIONS_COUNT
-        LOG.debug(f"Separately solved questions pre-filtering: [{separately_solved_questions}]")
-
-        # Regular points
-        REGULAR_POINTS = defaultdict(set)
-        for contest_id, problems in separately_solved_questions.items():
-            if contest_id in usr_cts_sq:
-                separate_problems = problems - usr_cts_sq[contest_id]
-                LOG.debug(f"User: [{usr_handle}] already participared in contest: [{contest_id}]. Unsolved, i.e num practice problems are: [{len(separate_problems)}] which are: [{separate_problems}]")
-                REGULAR_POINTS[contest_id] = separate_problems
-            else:
-                REGULAR_POINTS[contest_id] = problems
-            
-        num_practice_problems = sum([len(problems) for problems in REGULAR_POINTS.values()])
-        LOG.debug(f"User: [{usr_handle}] has solved: [{num_practice_problems}] questions: [{REGULAR_POINTS}]")
-        return num_practice_problems
\ No newline at end of file
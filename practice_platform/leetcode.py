@@ -1,15 +1,154 @@
+import json
 from practice_platform.base import PracticePlatformBase
 from model.user import User
 from model.grading import Grading
 from model.contest import Contest
-from typing import Dict, List, Set
+from model.submission import SubmissionRecord
+from model.request_pattern import RequestPattern
+from typing import Dict, Iterable, Iterator, List, Set
 from collections import defaultdict
+from constants import CACHE_PATH
+from util.web import WebRequest
+from util.cache import get_store
+from util.common import fail
+from util.circuit_breaker import UserFailure
+from util.decode import loads
+from util.log import get_logger
+
+LOG = get_logger("LeetcodePractice")
+
 
 class LeetcodePractice(PracticePlatformBase):
+    """
+    Leetcode's GraphQL API (the same one contests use) lists a user's most recent accepted submissions. A single query can ask
+    for many users at once, with an alias per user, so all users' submissions are loaded in a few requests before grading (see load).
+
+    NOTE: Only the RECENT_AC_LIMIT most recent accepted submissions are listed. For someone who solved more than that since the grading
+    week started (incl. after it ended), iter_submissions fails rather than grading them short.
+    """
+
     PLATFORM = "Leetcode"
 
-    def name() -> str:
+    GRAPHQL_URL = "https://leetcode.com/graphql"
+    GRAPHQL_HEADERS = {"Content-type": "application/json"}
+    RECENT_AC_LIMIT = 20
+    USERS_PER_QUERY = 50
+    QUESTIONS_PER_QUERY = 50
+
+    # titleSlug => "<question_id> -- <title>", the same key contest rankings use (see Leetcode.pre_process). Kept across runs.
+    QUESTION_CACHE = get_store("Leetcode_questions")
+    QUESTIONS_KEY = ("questions",)
+    LEGACY_QUESTION_CACHE_PATH = CACHE_PATH.joinpath("leetcode_questions.json") # From before the cache store, moved into it
+
+    # (handle,) => recent accepted submissions, loaded for all users at once
+    RECENT_AC_CACHE = get_store("Leetcode_recent_ac")
+
+    WR = WebRequest(rate_limit_millis=2000, name="LeetcodePractice")
+    REQUEST_PATTERN = RequestPattern(per_user_week=1/USERS_PER_QUERY) # Users' submissions in batches, plus the occasional batch of new questions
+
+    def name(self) -> str:
         return LeetcodePractice.PLATFORM
 
-    def successfull_submissions(self, gd: Grading, usr: User, usr_cts_sq: Dict[str, Set[str]] = defaultdict(set)) -> int:
-        raise Exception("Unimplemented successful_submissions")
\ No newline at end of file
+
+    def __graphql(self, query: str) -> Dict:
+        response = LeetcodePractice.WR.post(LeetcodePractice.GRAPHQL_URL, data=json.dumps({"query": query}), headers=LeetcodePractice.GRAPHQL_HEADERS)
+        if (response is None) or (response.get("data") is None):
+            fail(f"Graphql query failed. response: {response}", LOG)
+        return response["data"]
+
+
+    def __fetch_recent_ac(self, handles: List[str]) -> Dict[str, List[Dict]]:
+        """
+        Sample json:
+        {
+            "data": {
+                "u0": [{"id": "630653930", "title": "Two Sum", "titleSlug": "two-sum", "timestamp": "1643514918"}, ...],
+                "u1": null,
+                ...
+            }
+        }
+        """
+        recent_ac = dict()
+        for i in range(0, len(handles), LeetcodePractice.USERS_PER_QUERY):
+            batch = handles[i:i + LeetcodePractice.USERS_PER_QUERY]
+            query = "{ " + " ".join([f"u{j}: recentAcSubmissionList(username: {json.dumps(handle)}, limit: {LeetcodePractice.RECENT_AC_LIMIT}) {{ id title titleSlug timestamp }}"
+                for j, handle in enumerate(batch)]) + " }"
+            results = self.__graphql(query)
+            for j, handle in enumerate(batch):
+                # Users that don't exist come back as null. They're left out, and fail on their own when graded.
+                if results.get(f"u{j}") is not None:
+                    recent_ac[handle] = results[f"u{j}"]
+        return recent_ac
+
+
+    def __load_questions(self, title_slugs: Iterable[str]) -> Dict[str, str]:
+        """
+        Question ids of the title slugs, looked up (in batches) only for questions that weren't seen before.
+        """
+        questions = LeetcodePractice.QUESTION_CACHE.get(LeetcodePractice.QUESTIONS_KEY, self.__load_legacy_questions, persist=True)
+
+        new_title_slugs = sorted(set(title_slugs) - set(questions))
+        for i in range(0, len(new_title_slugs), LeetcodePractice.QUESTIONS_PER_QUERY):
+            batch = new_title_slugs[i:i + LeetcodePractice.QUESTIONS_PER_QUERY]
+            query = "{ " + " ".join([f"q{j}: question(titleSlug: {json.dumps(title_slug)}) {{ questionId title }}" for j, title_slug in enumerate(batch)]) + " }"
+            results = self.__graphql(query)
+            for j, title_slug in enumerate(batch):
+                if results.get(f"q{j}") is not None:
+                    questions[title_slug] = str(results[f"q{j}"]["questionId"]) + " -- " + results[f"q{j}"]["title"]
+
+        if len(new_title_slugs) > 0:
+            LeetcodePractice.QUESTION_CACHE.put(LeetcodePractice.QUESTIONS_KEY, questions, persist=True)
+        return questions
+
+
+    def __load_legacy_questions(self) -> Dict[str, str]:
+        if not LeetcodePractice.LEGACY_QUESTION_CACHE_PATH.exists():
+            return dict()
+        with open(LeetcodePractice.LEGACY_QUESTION_CACHE_PATH, "r", encoding='utf-8') as f:
+            questions = loads(f.read())
+        LeetcodePractice.LEGACY_QUESTION_CACHE_PATH.unlink()
+        return questions
+
+
+    def load(self, gd: Grading, usrs: List[User]) -> None:
+        handles = sorted([handle for handle in set([usr.handle(self.name()) for usr in usrs if usr.usr_id_map.get(self.name()) is not None])
+            if (handle,) not in LeetcodePractice.RECENT_AC_CACHE])
+        if len(handles) == 0:
+            return
+        recent_ac = self.__fetch_recent_ac(handles)
+        for handle, submissions in recent_ac.items():
+            LeetcodePractice.RECENT_AC_CACHE.put((handle,), submissions)
+        self.__load_questions([submission["titleSlug"] for submissions in recent_ac.values() for submission in submissions])
+        LOG.info(f"Loaded recent accepted submissions of: [{len(recent_ac)}] users")
+
+
+    def iter_submissions(self, usr: User, since_ts_sec: int, after_submission_id: str = None) -> Iterator[SubmissionRecord]:
+        """
+        Submissions loaded for all users (see load), or fetched for the user alone otherwise.
+        """
+        usr_handle = usr.handle(self.name())
+        if (usr_handle,) not in LeetcodePractice.RECENT_AC_CACHE:
+            self.load(None, [usr])
+        submissions = LeetcodePractice.RECENT_AC_CACHE.get((usr_handle,))
+        if submissions is None:
+            fail(f"No submissions found for user: [{usr_handle}]", LOG, UserFailure)
+        questions = self.__load_questions([submission["titleSlug"] for submission in submissions])
+
+        if len(submissions) == LeetcodePractice.RECENT_AC_LIMIT and min([int(submission["timestamp"]) for submission in submissions]) > since_ts_sec:
+            # Grading only the most recent ones would grade the user short, so it's an exception instead (as for contests' per-user lookups)
+            fail(f"User: [{usr_handle}] has more than: [{LeetcodePractice.RECENT_AC_LIMIT}] accepted submissions since: [{since_ts_sec}], which can't all be listed", LOG, UserFailure)
+
+        for submission in submissions:
+            if int(submission["timestamp"]) < since_ts_sec:
+                continue
+            problem_id = questions.get(submission["titleSlug"], submission["titleSlug"])
+            yield SubmissionRecord(self.name(), usr_handle, str(submission["id"]), problem_id, None, "Accepted", True, int(submission["timestamp"]))
+
+
+    def practice_problems(self, records: Iterable[SubmissionRecord], gd: Grading, usr_cts_sq: Dict[str, Set[str]] = defaultdict(set)) -> Dict[str, int]:
+        """
+        Submissions don't say which contest a question was solved in, and a question is the same one everywhere. So questions solved
+        during any of the user's contests are removed.
+        """
+        contest_solved = set([question for questions in usr_cts_sq.values() for question in questions])
+        return {problem: ts_sec for problem, ts_sec in super().practice_problems(records, gd, usr_cts_sq).items() if problem not in contest_solved}
@@ -0,0 +1,78 @@
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, Iterator, Set
+from model.submission import SubmissionRecord
+from util.log import get_logger
+
+LOG = get_logger("PracticePipeline")
+
+# Stages shared by all practice platforms. Each platform only yields normalized SubmissionRecords (see
+# PracticePlatformBase.iter_submissions), lazily and no further back than the grading week's start. These stages
+# then turn them into the number of practice problems:
+#
+#   iter_submissions -> [tee] -> accepted -> in_window -> distinct_problems -> subtract_contest_solved -> flatten/count
+
+
+def tee(records: Iterable[SubmissionRecord], sink: Callable[[SubmissionRecord], None]) -> Iterator[SubmissionRecord]:
+    """
+    Passes records through as they are, handing each one to sink on the way (ex: to feed a cache or a store).
+    """
+    for record in records:
+        sink(record)
+        yield record
+
+
+def accepted(records: Iterable[SubmissionRecord]) -> Iterator[SubmissionRecord]:
+    return (record for record in records if record.is_accepted)
+
+
+def in_window(records: Iterable[SubmissionRecord], start_ts_sec: int, end_ts_sec: int) -> Iterator[SubmissionRecord]:
+    """
+    Records made within [start_ts_sec, end_ts_sec] (inclusive).
+    """
+    return (record for record in records if start_ts_sec <= record.ts_sec <= end_ts_sec)
+
+
+def distinct_problems(records: Iterable[SubmissionRecord]) -> Dict[str, Dict[str, int]]:
+    """
+    Distinct problems per contest along with when each was first solved, {contest_id => {problem_id => ts_sec}}.
+    Problems without a contest are under None.
+    """
+    contest_problems = defaultdict(dict)
+    for record in records:
+        problems = contest_problems[record.contest_id]
+        problems[record.problem_id] = min(problems.get(record.problem_id, record.ts_sec), record.ts_sec)
+    return contest_problems
+
+
+def subtract_contest_solved(contest_problems: Dict[str, Dict[str, int]], usr_cts_sq: Dict[str, Set[str]]) -> Dict[str, Dict[str, int]]:
+    """
+    Removes problems that the user already solved during a contest they took part in, so that they aren't counted twice.
+    """
+    practice_problems = dict()
+    for contest_id, problems in contest_problems.items():
+        if contest_id is not None and contest_id in usr_cts_sq:
+            separate_problems = {problem_id: ts_sec for problem_id, ts_sec in problems.items() if problem_id not in usr_cts_sq[contest_id]}
+            LOG.debug(f"Already participated in contest: [{contest_id}]. Unsolved, i.e num practice problems are: [{len(separate_problems)}] which are: [{set(separate_problems)}]")
+            practice_problems[contest_id] = separate_problems
+        else:
+            practice_problems[contest_id] = problems
+    return practice_problems
+
+
+def problem_key(contest_id: str, problem_id: str) -> str:
+    """
+    Identifies a problem across contests, ex: '566/Logistical Questions -- C'. Contest grading events use the same key
+    (with the event's contest id), so that problems can be matched across events later on.
+    """
+    return problem_id if contest_id is None else f"{contest_id}/{problem_id}"
+
+
+def flatten(contest_problems: Dict[str, Dict[str, int]]) -> Dict[str, int]:
+    """
+    {problem_key => ts_sec} for all of the contests' problems.
+    """
+    return {problem_key(contest_id, problem_id): ts_sec for contest_id, problems in contest_problems.items() for problem_id, ts_sec in problems.items()}
+
+
+def count(contest_problems: Dict[str, Dict[str, int]]) -> int:
+    return sum([len(problems) for problems in contest_problems.values()])
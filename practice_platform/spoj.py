@@ -1,16 +1,18 @@
 from collections import defaultdict
 from distutils.log import debug
 from re import sub
-from typing import Dict, List, Set
+from typing import Dict, Iterator, List, Set
+from model.submission import SubmissionRecord
 from webbrowser import get
 from constants import UTC_TZINFO
-from util.datetime import to_dt_from_ts
+from util.datetime import to_dt_from_ts, to_ts_sec
 from datetime import datetime
 from model.user import User
 from model.grading import Grading
 from model.contest import Contest
 from practice_platform.base import PracticePlatformBase
 from util.web import WebRequest
+from model.request_pattern import RequestPattern
 from util.common import fail
 from util.log import get_logger
 from util.datetime import in_between_dt
@@ -29,68 +31,55 @@ class SpojPractice(PracticePlatformBase):
     # so we can short-circuit
     SUBMISSIONS_PER_PAGE_LIMIT = 20
     SUBMISSIONS_URL = "https://www.spoj.com/status/{user_id}/all/start={submission_count}"
+    USER_URL = "https://www.spoj.com/users/{user_id}/" # Redirects away for users that don't exist
 
-    WR = WebRequest(rate_limit_millis=1000)
+    WR = WebRequest(rate_limit_millis=1000, name="SpojPractice")
+    REQUEST_PATTERN = RequestPattern(per_user_week=1, is_scrape=True)
 
     def name(self) -> str:
         return SpojPractice.PLATFORM
 
 
-    def successfull_submissions(self, gd: Grading, usr: User, usr_cts_sq: Dict[str, Set[str]] = defaultdict(set)) -> int:
+    def iter_submissions(self, usr: User, since_ts_sec: int, after_submission_id: str = None) -> Iterator[SubmissionRecord]:
         """
-        We use the submissions url to fetch as many submissions as there are within a time frame.
+        Scrapes the status pages (newest first) until submissions older than since_ts_sec show up.
         """
         usr_handle = usr.handle(self.name())
-        short_circuit = False
         submission_count = 0
-        solved_questions = set()
-        while not short_circuit:
+        while True:
             submissions_url = SpojPractice.SUBMISSIONS_URL.format(user_id=usr_handle, submission_count=submission_count)
             LOG.debug(f"Submissions url: [{submissions_url}]")
-        
-            driver = SpojPractice.WR.scrape(submissions_url)
-            tr_vals = driver.find_elements_by_css_selector("table > tbody > tr")
-            LOG.debug(f"len tr_vals: [{len(tr_vals)}]")
 
+            driver = SpojPractice.WR.scrape(submissions_url, SpojPractice.SUBMISSIONS_URL)
+            try:
+                tr_vals = driver.find_elements_by_css_selector("table > tbody > tr")
+                for tr_val in tr_vals:
+                    td_vals = tr_val.find_elements_by_css_selector("td")
+
+                    # For some reason Spoj sometimes returns a global site wide list of submissions
+                    # when a wrong user id/user with no submission history is provided instead of returning an empty page
+                    if len(td_vals) > 7:
+                        return
+
+                    # NOTE: It is one hour UTC apparently, but shouldn't be that bad an idea to just assume UTC for now
+                    curr_ts_sec = to_ts_sec(datetime.fromisoformat(td_vals[1].find_element_by_css_selector("span").text).replace(tzinfo=UTC_TZINFO))
+                    if curr_ts_sec < since_ts_sec:
+                        return
+                    submission_id = td_vals[0].text.strip()
+                    problem_id = td_vals[2].find_element_by_css_selector("a").get_attribute("title")
+                    status = str(td_vals[3].get_attribute("status"))
+                    yield SubmissionRecord(self.name(), usr_handle, submission_id if submission_id != "" else f"{curr_ts_sec}:{problem_id}:{status}", problem_id, None, status, status == "15", curr_ts_sec)
+            finally:
+                driver.quit()
+
+            # For some reason Spoj keeps showing the same submissions even if we request with a larger start number in the next iteration.
+            # So, we need to stop after the current page as soon as we see less than expected submissions.
             if len(tr_vals) > SpojPractice.SUBMISSIONS_PER_PAGE_LIMIT:
                 LOG.warn(f"more tr_vals found: [{len(tr_vals)}] than expected: [{SpojPractice.SUBMISSIONS_PER_PAGE_LIMIT}]")
             elif len(tr_vals) < SpojPractice.SUBMISSIONS_PER_PAGE_LIMIT:
-                # For some reason Spoj keeps showing the same submissions even if we request with a larger start number in the next iteration.
-                # So, we need to stop after the current iteration as soon as we see less than expected submissions.
-                LOG.debug(f"less that [{SpojPractice.SUBMISSIONS_PER_PAGE_LIMIT}] tr_vals found. So, short circuit.")
-                short_circuit = True
-            elif len(tr_vals) == 0:
-                LOG.debug(f"No tr_vals found. So, that's the end of submissions.")
-                short_circuit = True
-                break
-
-            for i, tr_val in enumerate(tr_vals):
-                td_vals = tr_val.find_elements_by_css_selector("td")
-                LOG.debug(f"i={i}, num td_vals: {len(td_vals)}")
-
-                # For some reason Spoj sometimes returns a global site wide list of submissions
-                # when a wrong user id/user with no submission history is provided instead of returning an empty page
-                if len(td_vals) > 7:
-                    short_circuit = True
-                    break
-
-                # NOTE: It is one hour UTC apparently, but shouldn't be that bad an idea to just assume UTC for now
-                curr_dt = datetime.fromisoformat(td_vals[1].find_element_by_css_selector("span").text).replace(tzinfo=UTC_TZINFO)
-                problem_id = td_vals[2].find_element_by_css_selector("a").get_attribute("title")
-                status = str(td_vals[3].get_attribute("status"))
-
-                if in_between_dt(curr_dt, gd.week_start_dt, gd.week_end_dt) and status == "15":
-                    solved_questions.add(problem_id)
+                return
+            submission_count += SpojPractice.SUBMISSIONS_PER_PAGE_LIMIT
 
-                if curr_dt < gd.week_start_dt:
-                    LOG.debug(f"Breaking because {curr_dt} is older that {gd.week_start_dt}")
-                    short_circuit = True
-                    break
 
-            if driver is not None:
-                driver.quit()
-
-            submission_count += SpojPractice.SUBMISSIONS_PER_PAGE_LIMIT
-        
-        LOG.debug(f"User: [{usr_handle}] has solved: [{len(solved_questions)}] questions: [{solved_questions}]")
-        return len(solved_questions)
\ No newline at end of file
+    def validate_handles(self, handles: List[str]) -> Dict[str, bool]:
+        return SpojPractice.WR.probe_handles(SpojPractice.USER_URL, handles)
@@ -1,7 +1,8 @@
 from collections import defaultdict
 from distutils.log import debug
 from re import sub
-from typing import Dict, List, Set
+from typing import Dict, Iterable, Iterator, List, Set
+from model.submission import SubmissionRecord
 from webbrowser import get
 from util.datetime import to_dt_from_ts
 from model.user import User
@@ -9,9 +10,15 @@ from model.grading import Grading
 from model.contest import Contest
 from practice_platform.base import PracticePlatformBase
 from util.web import WebRequest
+from util.decode import loads
+from constants import CACHE_PATH
+from model.request_pattern import RequestPattern
+from util.cache import get_store
 from util.common import fail
+from util.circuit_breaker import UserFailure
 from util.log import get_logger
-from util.datetime import in_between_dt
+from util.datetime import in_between_dt, in_between_ts
+from util.vectorized import HAS_NUMPY, should_vectorize, first_solved, first_solved_batch
 
 LOG = get_logger("Uva")
 
@@ -30,49 +37,185 @@ class UvaPractice(PracticePlatformBase):
     # NOTE: This allows for options to limit the number of submissions or filter based on minimum submission id. 
     # The latter looks promising, but it would carrying state across grading weeks. For now, all submissions are fetched.
     SUBMISSIONS_URL = "https://uhunt.onlinejudge.org/api/subs-user/{uid}"
+    NEW_SUBMISSIONS_URL = "https://uhunt.onlinejudge.org/api/subs-user/{uid}/{min_sid}"
 
-    WR = WebRequest(rate_limit_millis=1000)
+    # Columns of a submission array and the accepted verdict
+    SUBMISSION_ID_COL = 0
+    PROBLEM_COL = 1
+    VERDICT_COL = 2
+    TS_COL = 4
+    VERDICT_ACCEPTED = 90
+
+    # uname => uid, kept across runs
+    UID_CACHE = get_store("Uva_uids")
+    UIDS_KEY = ("uids",)
+    LEGACY_UID_CACHE_PATH = CACHE_PATH.joinpath("uva_uids.json") # From before the cache store, moved into it
+    UNKNOWN_UID = "0"
+
+    # Loaded for all users at once (see load). (handle,) => {"since_ts_sec", "subs"} and (handle, week start, week end) => {problem => ts_sec}
+    SUBMISSIONS_CACHE = get_store("Uva_submissions")
+    SOLVED_CACHE = get_store("Uva_solved")
+
+    WR = WebRequest(rate_limit_millis=1000, name="UvaPractice")
+    REQUEST_PATTERN = RequestPattern(per_user_week=1) # The submissions, uids are cached after their first lookup
 
     def name(self) -> str:
         return UvaPractice.PLATFORM
 
     
-    def __get_uid(self, usr: User) -> str:
-        usr_handle = usr.handle(self.name())
-        uid_url = UvaPractice.USERID_TO_UID_URL.format(user_id=usr_handle)
-        LOG.debug(f"Fecthing uid for user: [{usr_handle}] at: [{uid_url}]")
+    def __load_legacy_uids(self) -> Dict[str, str]:
+        if not UvaPractice.LEGACY_UID_CACHE_PATH.exists():
+            return dict()
+        with open(UvaPractice.LEGACY_UID_CACHE_PATH, "r", encoding='utf-8') as f:
+            uids = loads(f.read())
+        UvaPractice.LEGACY_UID_CACHE_PATH.unlink()
+        return uids
 
-        return str(UvaPractice.WR.get(uid_url, is_json=True))
 
+    def __load_uids(self) -> Dict[str, str]:
+        return UvaPractice.UID_CACHE.get(UvaPractice.UIDS_KEY, self.__load_legacy_uids, persist=True)
 
-    def successfull_submissions(self, gd: Grading, usr: User, usr_cts_sq: Dict[str, Set[str]] = defaultdict(set)) -> int:
+
+    def __get_uid_of(self, usr_handle: str) -> str:
         """
-        Uva API works with numeric uid. For that, Uva user id has to be converted to uid.
+        A user's uid never changes, so it's only looked up once and cached. uHunt answers 0 for users that don't exist, which isn't cached.
         """
-        usr_handle = usr.handle(self.name())
+        uids = self.__load_uids()
+        if usr_handle in uids:
+            return uids[usr_handle]
+
+        uid_url = UvaPractice.USERID_TO_UID_URL.format(user_id=usr_handle)
+        LOG.debug(f"Fecthing uid for user: [{usr_handle}] at: [{uid_url}]")
+        uid = str(UvaPractice.WR.get(uid_url, is_json=True, endpoint=UvaPractice.USERID_TO_UID_URL))
+        if uid != UvaPractice.UNKNOWN_UID:
+            uids[usr_handle] = uid
+            UvaPractice.UID_CACHE.put(UvaPractice.UIDS_KEY, uids, persist=True)
+        return uid
+
+
+    def __get_uid(self, usr: User) -> str:
+        return self.__get_uid_of(usr.handle(self.name()))
+
+
+    def validate_handles(self, handles: List[str]) -> Dict[str, bool]:
+        return {handle: self.__get_uid_of(handle) != UvaPractice.UNKNOWN_UID for handle in handles}
+
+
+    def __get_submissions_url(self, usr: User) -> str:
         uid = self.__get_uid(usr)
+        if uid == UvaPractice.UNKNOWN_UID:
+            fail(f"Unknown user: [{usr.handle(self.name())}]", LOG, UserFailure)
         submissions_url = UvaPractice.SUBMISSIONS_URL.format(uid=uid)
         LOG.debug(f"Submissions url: [{submissions_url}]")
-        
-        submissions = UvaPractice.WR.get(submissions_url)
+        return submissions_url
+
+
+    def __is_solved(self, gd: Grading, submission: List[int]) -> bool:
+        return int(submission[UvaPractice.VERDICT_COL]) == UvaPractice.VERDICT_ACCEPTED and in_between_ts(int(submission[UvaPractice.TS_COL]), gd.week_start_ts_sec, gd.week_end_ts_sec)
+
+
+    def __get_all_submissions(self, usr: User) -> List[List[int]]:
+        submissions = UvaPractice.WR.get(self.__get_submissions_url(usr))
         if (submissions is None) or ("subs" not in submissions):
-            fail(f"No submissions found for user: [{usr_handle}] at [{uid}]", LOG)
+            fail(f"No submissions found for user: [{usr.handle(self.name())}]", LOG)
+        return submissions["subs"]
+
+
+    def solved_problems(self, gd: Grading, usr: User, usr_cts_sq: Dict[str, Set[str]] = defaultdict(set)) -> Dict[str, int]:
+        """
+        Uva API works with numeric uid. For that, Uva user id has to be converted to uid.
+
+        uHunt returns the user's full history as [sid, pid, verdict, runtime, ts, ...] arrays. With NumPy available the
+        whole history is filtered in bulk, otherwise it's streamed and only accepted submissions within the grading week are kept.
+        """
+        usr_handle = usr.handle(self.name())
+
+        if HAS_NUMPY:
+            submissions = self.__get_all_submissions(usr)
+            if should_vectorize(len(submissions)):
+                problem_ts = first_solved(submissions, UvaPractice.PROBLEM_COL, UvaPractice.VERDICT_COL, UvaPractice.TS_COL, UvaPractice.VERDICT_ACCEPTED, gd.week_start_ts_sec, gd.week_end_ts_sec)
+            else:
+                problem_ts = self.__first_solved(submission for submission in submissions if self.__is_solved(gd, submission))
+        else:
+            submissions = UvaPractice.WR.get_items(self.__get_submissions_url(usr), "subs.item", lambda submission: self.__is_solved(gd, submission))
+            problem_ts = self.__first_solved(submissions)
         
-        if len(submissions["subs"]) == 0:
-            return 0
+        LOG.debug(f"User: [{usr_handle}] has solved: [{len(problem_ts)}] questions: [{set(problem_ts)}]")
+        return {str(problem_id): ts_sec for problem_id, ts_sec in problem_ts.items()}
 
-        # NOTE: We could take advantage of the ordering, but if we choose to pursue other alternative to 
-        # reduce the number of submissions returned in the first place, we may not need this. So, for now,
-        # we'll ignore the ordering and process the full list.
-        submissions = submissions["subs"]
 
-        problem_ids = set()
+    def __first_solved(self, submissions: Iterable[List[int]]) -> Dict[int, int]:
+        problem_ts = dict()
         for submission in submissions:
-            problem_id = int(submission[1])
-            verdict = int(submission[2])
-            submission_dt = to_dt_from_ts(int(submission[4])*1000)
-            if verdict == 90 and in_between_dt(submission_dt, gd.week_start_dt, gd.week_end_dt):
-                problem_ids.add(problem_id)
-        
-        LOG.debug(f"User: [{usr_handle}] has solved: [{len(problem_ids)}] questions: [{problem_ids}]")
-        return len(problem_ids)
\ No newline at end of file
+            problem_id, ts_sec = int(submission[UvaPractice.PROBLEM_COL]), int(submission[UvaPractice.TS_COL])
+            problem_ts[problem_id] = min(problem_ts.get(problem_id, ts_sec), ts_sec)
+        return problem_ts
+
+
+    def load(self, gd: Grading, usrs: List[User]) -> None:
+        """
+        uHunt has no endpoint for many users, so histories are still fetched one request per user. They're masked together though:
+        the problems every user solved in each of the grading weeks are worked out in one pass (see loaded_problems). Submissions
+        since the first week's start are kept too, so that iter_submissions doesn't fetch them again.
+
+        Unknown users are left out, and fail on their own when graded.
+        """
+        histories = dict()
+        for usr in usrs:
+            if usr.usr_id_map.get(self.name()) is None or (usr.handle(self.name()),) in UvaPractice.SUBMISSIONS_CACHE:
+                continue
+            try:
+                histories[usr.handle(self.name())] = self.__get_all_submissions(usr)
+            except UserFailure:
+                continue
+        if len(histories) == 0:
+            return
+
+        gds = [Grading(week_num=week_num) for week_num in gd.week_nums] if hasattr(gd, "week_nums") else [gd]
+        windows = [(week_gd.week_start_ts_sec, week_gd.week_end_ts_sec) for week_gd in gds]
+        if should_vectorize(sum([len(submissions) for submissions in histories.values()])):
+            window_solved = first_solved_batch(histories, UvaPractice.PROBLEM_COL, UvaPractice.VERDICT_COL, UvaPractice.TS_COL, UvaPractice.VERDICT_ACCEPTED, windows)
+        else:
+            window_solved = {(week_gd.week_start_ts_sec, week_gd.week_end_ts_sec): {handle: self.__first_solved(submission for submission in submissions if self.__is_solved(week_gd, submission))
+                for handle, submissions in histories.items()} for week_gd in gds}
+
+        for handle, submissions in histories.items():
+            UvaPractice.SUBMISSIONS_CACHE.put((handle,), {"since_ts_sec": gd.week_start_ts_sec,
+                "subs": [submission for submission in submissions if int(submission[UvaPractice.TS_COL]) >= gd.week_start_ts_sec]})
+            for (start_ts_sec, end_ts_sec), solved in window_solved.items():
+                UvaPractice.SOLVED_CACHE.put((handle, start_ts_sec, end_ts_sec), {str(problem_id): ts_sec for problem_id, ts_sec in solved[handle].items()})
+        LOG.info(f"Loaded submissions of: [{len(histories)}] users for weeks: [{[week_gd.week_num for week_gd in gds]}]")
+
+
+    def loaded_problems(self, gd: Grading, usr: User, usr_cts_sq: Dict[str, Set[str]] = defaultdict(set)) -> Dict[str, int]:
+        if usr.usr_id_map.get(self.name()) is None:
+            return None
+        return UvaPractice.SOLVED_CACHE.get((usr.handle(self.name()), gd.week_start_ts_sec, gd.week_end_ts_sec))
+
+
+    def iter_submissions(self, usr: User, since_ts_sec: int, after_submission_id: str = None) -> Iterator[SubmissionRecord]:
+        """
+        uHunt can return only the submissions after a submission id, so with after_submission_id only new submissions are fetched.
+        Nothing is fetched for users whose submissions were loaded (see load) far back enough.
+        """
+        usr_handle = usr.handle(self.name())
+        loaded = UvaPractice.SUBMISSIONS_CACHE.get((usr_handle,))
+        if loaded is not None and loaded["since_ts_sec"] <= since_ts_sec:
+            submissions = (submission for submission in loaded["subs"] if int(submission[UvaPractice.TS_COL]) >= since_ts_sec
+                and (after_submission_id is None or int(submission[UvaPractice.SUBMISSION_ID_COL]) > int(after_submission_id)))
+        else:
+            submissions = self.__fetch_submissions(usr, since_ts_sec, after_submission_id)
+
+        for submission in submissions:
+            verdict = int(submission[UvaPractice.VERDICT_COL])
+            yield SubmissionRecord(self.name(), usr_handle, str(submission[UvaPractice.SUBMISSION_ID_COL]), str(submission[UvaPractice.PROBLEM_COL]), None,
+                str(verdict), verdict == UvaPractice.VERDICT_ACCEPTED, int(submission[UvaPractice.TS_COL]))
+
+
+    def __fetch_submissions(self, usr: User, since_ts_sec: int, after_submission_id: str = None) -> Iterator[List[int]]:
+        if after_submission_id is not None:
+            submissions_url = UvaPractice.NEW_SUBMISSIONS_URL.format(uid=self.__get_uid(usr), min_sid=after_submission_id)
+        else:
+            submissions_url = self.__get_submissions_url(usr)
+
+        return UvaPractice.WR.get_items(submissions_url, "subs.item", lambda submission: int(submission[UvaPractice.TS_COL]) >= since_ts_sec)
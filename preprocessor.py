@@ -1,19 +1,194 @@
-from contest_platform.leetcode import Leetcode
-from model.grading import Grading
 import argparse
+import time
+from pathlib import Path
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+from constants import CACHE_PATH
+from contest_platform.base import ContestNotReady
+from model.contest import Contest
+from model.grading import Grading
+from model.user import User
+from platform_registry import CONTEST, load_platforms
+from util import cache, metrics, trace
+from util.common import fail, parse_week_nums, star
+from util.datetime import get_curr_dt_est
+from util.job_store import JobStore
+from util.log import get_logger
+import cache_bundle
+
+LOG = get_logger("Preprocessor")
+
+# Contest platforms whose contests can be fetched ahead of grading (Leetcode rankings, Dmoj payloads, Codeforces standings).
+# NOTE: Codechef isn't one of them. Its rankings don't say when problems were solved, that takes a scrape of each user's solutions.
+PRE_PROCESS_PLATFORMS = [platform for platform in load_platforms(CONTEST) if platform.PRE_PROCESSES]
+
+# When serving, contests are looked up this often. Jobs are checked on every tick.
+POLL_SECS = 15*60
+TICK_SECS = 5
 
-PRE_PROCESS_PLATFORMS = [Leetcode()]
 
 def parse_args():
     parser = argparse.ArgumentParser(description='Grading preprocessor.')
-    parser.add_argument('-w', '--week', help="Week number, ex: 5, or 6...", required=True, dest="week_num", type=int)
+    parser.add_argument('-w', '--week', help="Week number, ex: 5, or 6... or several, ex: 3-7 or 3,5,7. Required unless serving, which defaults to the current (and previous) week", dest="week_nums", type=parse_week_nums)
+    parser.add_argument('-s', '--serve', help="Flag to keep running, pre-processing contests as soon as they end", dest="serve", action="store_true")
+    parser.add_argument('--per-host', help="Number of jobs run at once per platform (they still share its rate limit)", dest="per_host", type=int, default=1)
+    parser.add_argument('-e', '--export', help="Flag to pack the weeks' pre-processed files into a bundle (see -o) to share, instead of pre-processing", dest="export", action="store_true")
+    parser.add_argument('-o', '--output', help="Path of the exported bundle. Defaults to preprocessed_<week_nums>.tar.gz in the cache directory", dest="output_path", type=Path)
+    parser.add_argument('-i', '--import', help="Path of a bundle (see -e) whose pre-processed files to verify and install, instead of pre-processing", dest="import_path", type=Path)
+    parser.add_argument('-f', '--force', help="Flag to replace existing pre-processed files with the imported ones", dest="force", action="store_true")
+    parser.add_argument('--trace', help="Flag to time the run's phases (users, contest discovery, pre-processing jobs, cache loads), saved as a Chrome trace in the cache directory", dest="trace", action="store_true")
+    parser.add_argument('--profile', help="Flag to also profile each phase with cProfile and tracemalloc (implies --trace). Slows the run down", dest="profile", action="store_true")
     return parser.parse_args()
 
-def preprocess(gd: Grading) -> None:
-    for platform in PRE_PROCESS_PLATFORMS:
-        platform.pre_process(gd)
+
+class Scheduler:
+    """
+    Runs a pre-processing job (pre_process_contest) per ended contest of the platforms.
+
+    Platforms are different hosts, so their jobs run concurrently, each platform with its own pool of per_host workers. A platform's
+    jobs share its rate limiter, so a site never gets more requests than it would from a single job. Jobs are kept in a JobStore,
+    so they are retried when they fail, and carry over restarts.
+    """
+
+    def __init__(self, platforms: List, users: List[User], per_host: int = 1, store: JobStore = None) -> None:
+        self.platforms = {platform.name(): platform for platform in platforms}
+        self.users = users
+        self.store = store if store is not None else JobStore()
+        self.executors = {name: ThreadPoolExecutor(max_workers=per_host, thread_name_prefix=name) for name in self.platforms}
+        self.gds: Dict[int, Grading] = dict()
+        self.contests: Dict[Tuple[str, int, str], Contest] = dict() # (platform_name, week_num, contest_id) => contest, of ended contests
+        self.running: Dict[Tuple[str, int, str], Future] = dict()
+
+
+    def discover(self, gds: List[Grading]) -> None:
+        """
+        Looks up the contests of the weeks, and queues a job for each one that ended and isn't pre-processed yet.
+        """
+        now_dt = get_curr_dt_est()
+        for gd in gds:
+            self.gds[gd.week_num] = gd
+            for name, platform in self.platforms.items():
+                try:
+                    with trace.span(f"{name} contests", 'discovery', week_num=gd.week_num):
+                        contests = [ct for ct in platform.all_contests(gd) if platform.in_grading_week(gd, ct)]
+                except Exception as e:
+                    LOG.error(f"Unable to look up contests of: [{name}] for week: [{gd.week_num}]. {e}")
+                    continue
+
+                for ct in contests:
+                    if ct.contest_end_dt is None or ct.contest_end_dt > now_dt:
+                        continue
+                    key = (name, gd.week_num, ct.contest_id)
+                    self.contests[key] = ct
+                    if not platform.is_pre_processed(gd, ct):
+                        self.store.add(*key)
+
+
+    def __pending(self) -> List[Tuple[str, int, str, int]]:
+        # Jobs queued by an earlier run for contests that weren't looked up this time can't be run, so they're left alone
+        return [job for job in self.store.pending() if job[:3] in self.contests and job[:3] not in self.running]
+
+
+    def tick(self) -> None:
+        """
+        Records the jobs that finished, and starts the ones that are due.
+        """
+        for key, future in list(self.running.items()):
+            if not future.done():
+                continue
+            del self.running[key]
+            if future.exception() is None:
+                LOG.info(f"Pre-processed: [{key}]")
+                self.store.finish(*key)
+            elif isinstance(future.exception(), ContestNotReady):
+                self.store.defer(*key, str(future.exception()))
+            else:
+                self.store.fail(*key, str(future.exception()))
+
+        now_ts_sec = int(time.time())
+        for name, week_num, contest_id, next_attempt_ts_sec in self.__pending():
+            if next_attempt_ts_sec > now_ts_sec:
+                continue
+            key = (name, week_num, contest_id)
+            LOG.info(f"Starting: [{key}]")
+            self.store.start(*key)
+            self.running[key] = self.executors[name].submit(self.__pre_process, key)
+
+
+    def __pre_process(self, key: Tuple[str, int, str]) -> None:
+        name, week_num, contest_id = key
+        with trace.span(f"{name} {contest_id}", 'preprocess', week_num=week_num):
+            self.platforms[name].pre_process_contest(self.gds[week_num], self.contests[key], self.users)
+
+
+    def is_idle(self) -> bool:
+        return len(self.running) == 0 and len(self.__pending()) == 0
+
+
+    def run(self, get_gds: Callable[[], List[Grading]], serve: bool = False) -> None:
+        """
+        Pre-processes the contests of the weeks (get_gds) until there's nothing left to do, or forever when serving,
+        looking up contests again every POLL_SECS.
+        """
+        last_discovery_ts_sec = None
+        try:
+            while True:
+                if last_discovery_ts_sec is None or (serve and time.time() - last_discovery_ts_sec >= POLL_SECS):
+                    self.discover(get_gds())
+                    last_discovery_ts_sec = time.time()
+                    LOG.info(f"Jobs: [{self.store.summary()}], running: [{len(self.running)}]")
+
+                self.tick()
+                if not serve and self.is_idle():
+                    break
+                time.sleep(TICK_SECS)
+        finally:
+            for executor in self.executors.values():
+                executor.shutdown(wait=False, cancel_futures=True)
+            LOG.info(f"Jobs: [{self.store.summary()}]")
+            self.store.close()
+
+
+def current_gds() -> List[Grading]:
+    """
+    The current week, and the previous one (for contests that ended after it did, or while the preprocessor wasn't running).
+    """
+    gd = Grading()
+    return [Grading(week_num=gd.week_num - 1), gd] if gd.week_num > 1 else [gd]
+
+
+def trace_path(week_nums: List[int]) -> Path:
+    run_name = "_".join([str(week_num) for week_num in sorted(set(week_nums))]) if week_nums is not None else "serve"
+    return CACHE_PATH.joinpath(f"trace_preprocess_{run_name}.json")
+
+
+def preprocess(week_nums: List[int], serve: bool = False, per_host: int = 1) -> None:
+    if week_nums is None and not serve:
+        fail("Week number(s) are required, unless serving", LOG)
+
+    from grader import get_users # Codeforces standings are fetched for the users' handles
+    with trace.span("users", 'users'):
+        users = get_users()
+    star(f"Pre-processing: [{[platform.name() for platform in PRE_PROCESS_PLATFORMS]}] for: [{len(users)}] users", LOG, 100)
+
+    get_gds = (lambda: [Grading(week_num=week_num) for week_num in sorted(set(week_nums))]) if week_nums is not None else current_gds
+    try:
+        Scheduler(PRE_PROCESS_PLATFORMS, users, per_host).run(get_gds, serve)
+    finally:
+        cache.log_metrics(LOG)
+        metrics.log_summary(LOG)
+        trace.report(trace_path(week_nums), LOG) # When serving, once it's stopped
 
 
 if __name__ == "__main__":
     args = parse_args()
-    preprocess(Grading(week_num=args.week_num))
\ No newline at end of file
+    if args.trace or args.profile:
+        trace.enable(args.profile)
+    if args.export:
+        if args.week_nums is None:
+            fail("Week number(s) are required to export", LOG)
+        cache_bundle.export_bundle(PRE_PROCESS_PLATFORMS, args.week_nums, args.output_path)
+    elif args.import_path is not None:
+        cache_bundle.import_bundle(PRE_PROCESS_PLATFORMS, args.import_path, args.force)
+    else:
+        preprocess(args.week_nums, args.serve, args.per_host)
@@ -0,0 +1,312 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List
+from constants import CACHE_PATH
+from model.contest import Contest
+from model.grading import Grading
+from model.grading_event import GradingEvent
+from model.user import User
+from util import cache, metrics, trace
+from util.common import fail, star, write_atomically
+from util.datetime import get_curr_dt_est
+from util.decode import loads, dumps
+from util.log import get_logger
+from util.submission_store import SubmissionStore
+from util.work_queue import WorkQueue, DONE
+import grader
+
+LOG = get_logger("Sharding")
+
+# A sharded run keeps its queue, contests and the workers' event logs here, in a directory per run (weeks and filters)
+SHARDS_PATH = CACHE_PATH.joinpath("shards")
+GRADER_PATH = Path(__file__).parent.joinpath("grader.py")
+
+USERS_PER_LEASE = 10 # Bulk contests are loaded (from the pre-processed store, see pre_process_bulk) once per lease, so leases aren't single users
+HEARTBEAT_SECS = 30
+POLL_SECS = 10
+MAX_WORKER_RESTARTS = 3 # Per local worker, for workers that die without a unit to blame (units have their own MAX_ATTEMPTS)
+
+
+def run_path(week_nums: List[int], uni: str, platform_name: str) -> Path:
+    """
+    The run's directory. The coordinator and its workers are started with the same weeks and filters, which is how they find each other.
+    """
+    run_name = "weeks_" + "_".join([str(week_num) for week_num in sorted(set(week_nums))])
+    if uni is not None and uni != "":
+        run_name += f"_{uni}"
+    if platform_name is not None and platform_name != "":
+        run_name += f"_{platform_name}"
+    return SHARDS_PATH.joinpath(run_name)
+
+
+def lease_file_path(path: Path, lease_id: int, week_num: int) -> Path:
+    return path.joinpath(f"lease_{lease_id}_{week_num}.log")
+
+
+def save_contests(path: Path, week_platform_contests_map: Dict) -> None:
+    """
+    Contests are discovered once, by the coordinator, so that all workers grade the same ones.
+    """
+    to_iso = lambda dt: dt.isoformat() if dt is not None else None
+    contests = {str(week_num): {platform.name(): [[ct.contest_id, to_iso(ct.contest_start_dt), to_iso(ct.contest_end_dt)] for ct in contests] for platform, contests in platform_contests.items()}
+        for week_num, platform_contests in week_platform_contests_map.items()}
+    write_atomically(path.joinpath("contests.json"), dumps(contests))
+
+
+def load_contests(path: Path) -> Dict:
+    from_iso = lambda text: datetime.fromisoformat(text) if text is not None else None
+    platforms = {platform.name(): platform for platform in grader.CONTEST_PLATFORMS}
+    with open(path.joinpath("contests.json"), "r", encoding='utf-8') as f:
+        contests = loads(f.read())
+    return {int(week_num): {platforms[platform_name]: [Contest(contest_id, from_iso(start), from_iso(end)) for contest_id, start, end in platform_contests]
+        for platform_name, platform_contests in week_contests.items() if platform_name in platforms} for week_num, week_contests in contests.items()}
+
+
+def pre_process_bulk(week_platform_contests_map: Dict, gds: List[Grading], users: List[User]) -> None:
+    """
+    Workers load bulk contests (see grader.prefetch_contest_major) for every lease. So that a contest that wasn't pre-processed isn't
+    fetched again for each lease, the coordinator pre-processes it once, before leasing, and workers read it from the pre-processed store.
+    users must be all registered users, as what's pre-processed is used for everyone from then on.
+    Contests that only the preprocessor can fetch (ex: Leetcode's rankings scrape) aren't fetched while grading, their units fail fast.
+    Contests that haven't ended are left to the workers, a snapshot of them shouldn't pass for pre-processed.
+    """
+    week_gds = {gd.week_num: gd for gd in gds}
+    now_dt = get_curr_dt_est()
+    for week_num, platform_contests in sorted(week_platform_contests_map.items()):
+        gd = week_gds[week_num]
+        for platform, contests in platform_contests.items():
+            if not (platform.IS_BULK and platform.PRE_PROCESSES):
+                continue
+            for ct in contests:
+                if platform.is_pre_processed(gd, ct):
+                    continue
+                if platform.needs_preprocessing(gd, ct, len(users)):
+                    LOG.error(f"[{platform.name()}] contest: [{ct.contest_id}] of week: [{week_num}] isn't pre-processed, its units will be exceptions. Run: python3 preprocessor.py -w {week_num} first.")
+                    continue
+                if ct.contest_end_dt is None or ct.contest_end_dt > now_dt:
+                    LOG.warning(f"[{platform.name()}] contest: [{ct.contest_id}] of week: [{week_num}] hasn't ended, it's loaded once per lease")
+                    continue
+                try:
+                    with metrics.timed(platform.name(), 'grading/load'), trace.span(f"{platform.name()} {ct.contest_id} pre-process", 'load', week_num=week_num):
+                        platform.pre_process_contest(gd, ct, users)
+                except Exception as e:
+                    traceback.print_exc()
+                    LOG.error(f"Unable to pre-process contest: [{ct.contest_id}] of platform: [{platform.name()}] ^. It's loaded once per lease.")
+                    metrics.count_exception(platform.name(), 'grading/load', e)
+                finally:
+                    platform.release(gd, ct)
+
+
+def worker_command(week_nums: List[int], uni: str, platform_name: str, use_store: bool) -> List[str]:
+    command = [sys.executable, str(GRADER_PATH), "-w", ",".join([str(week_num) for week_num in sorted(set(week_nums))]), "--worker"]
+    if uni is not None and uni != "":
+        command += ["-u", uni]
+    if platform_name is not None and platform_name != "":
+        command += ["-p", platform_name]
+    if use_store:
+        command += ["-s"]
+    if trace.is_profiling():
+        command += ["--profile"]
+    elif trace.is_enabled():
+        command += ["--trace"]
+    return command
+
+
+def heartbeat(queue: WorkQueue, lease_id: int, stop: threading.Event) -> None:
+    while not stop.wait(HEARTBEAT_SECS):
+        if not queue.heartbeat(lease_id):
+            LOG.warning(f"Lost lease: [{lease_id}]. Its events won't count.")
+            return
+
+
+def work(week_nums: List[int], uni: str, platform_name: str, use_store: bool = False) -> None:
+    """
+    Joins the sharded run of the weeks (see coordinate) as a worker: leases users, grades them into the lease's own event logs, and
+    finishes the lease, until no users are left. Any number of workers can join, on any host that sees the run's directory.
+    """
+    path = run_path(week_nums, uni, platform_name)
+    if not path.joinpath("queue.db").exists():
+        fail(f"No sharded run at: [{path}]. Start its coordinator first (--shards)", LOG)
+
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    gds = [Grading(week_num=week_num) for week_num in sorted(set(week_nums))]
+    span_gd = Grading.span(gds)
+    users = {usr.uni: usr for usr in grader.apply_filters(uni, platform_name)}
+    week_platform_contests_map = load_contests(path)
+    store = SubmissionStore() if use_store else None
+    queue = WorkQueue(path.joinpath("queue.db"))
+    star(f"Worker: [{worker_id}] joined run: [{path.name}]", LOG, 100)
+
+    num_leases = 0
+    while True:
+        leased = queue.lease(worker_id, USERS_PER_LEASE)
+        if leased is None:
+            if queue.is_finished():
+                break
+            time.sleep(POLL_SECS) # Others hold the remaining units, which come back if their workers die
+            continue
+
+        lease_id, unis = leased
+        LOG.info(f"Worker: [{worker_id}] leased: [{lease_id}] with users: [{unis}]")
+        stop = threading.Event()
+        heartbeat_thread = threading.Thread(target=heartbeat, args=(queue, lease_id, stop), daemon=True)
+        heartbeat_thread.start()
+        try:
+            missing = [lease_uni for lease_uni in unis if lease_uni not in users]
+            if len(missing) > 0:
+                fail(f"Users: [{missing}] aren't registered on worker: [{worker_id}]. Is its handles.csv the coordinator's?", LOG)
+            grade_file_paths = {gd.week_num: lease_file_path(path, lease_id, gd.week_num) for gd in gds}
+            for grade_file_path in grade_file_paths.values():
+                grade_file_path.write_text("", encoding='utf-8')
+
+            num_skipped = len(grader.SKIPPED_UNITS)
+            for event in grader.grade_users(gds, span_gd, [users[lease_uni] for lease_uni in unis], week_platform_contests_map, grade_file_paths, store):
+                pass
+            if queue.finish(lease_id, grader.SKIPPED_UNITS[num_skipped:]):
+                num_leases += 1
+            else:
+                LOG.warning(f"Lease: [{lease_id}] expired before it was finished. Its users are graded again elsewhere.")
+        except Exception as e:
+            traceback.print_exc()
+            LOG.error(f"Worker: [{worker_id}] failed lease: [{lease_id}] ^. Releasing it.")
+            queue.release(lease_id, str(e))
+        finally:
+            stop.set()
+            heartbeat_thread.join()
+
+    LOG.info(f"Worker: [{worker_id}] is done after: [{num_leases}] leases")
+    cache.log_metrics(LOG)
+    metrics.log_summary(LOG)
+    metrics.write_report(path.joinpath(f"metrics_{worker_id}.json"), worker_id=worker_id, num_leases=num_leases)
+    trace.report(path.joinpath(f"trace_{worker_id}.json"), LOG)
+    queue.close()
+
+
+def spawn_worker(path: Path, command: List[str], worker_num: int) -> subprocess.Popen:
+    with open(path.joinpath(f"worker_{worker_num}.log"), "a", encoding='utf-8') as log_file:
+        return subprocess.Popen(command, stdout=log_file, stderr=subprocess.STDOUT)
+
+
+def wait_for_workers(queue: WorkQueue, path: Path, command: List[str], num_workers: int) -> None:
+    """
+    Runs num_workers local workers (restarting ones that die while there's work left) until all units are done or failed.
+    Workers on other hosts can join at any time, with num_workers = 0 it's up to them.
+    """
+    workers = {worker_num: spawn_worker(path, command, worker_num) for worker_num in range(num_workers)}
+    num_restarts = {worker_num: 0 for worker_num in range(num_workers)}
+    if num_workers == 0:
+        LOG.info(f"Waiting for workers. Start them with: python3 {' '.join(command[1:])}")
+
+    last_summary = None
+    while not queue.is_finished():
+        time.sleep(POLL_SECS)
+        queue.reclaim()
+        summary = queue.summary()
+        if summary != last_summary:
+            LOG.info(f"Units: [{summary}]")
+            last_summary = summary
+
+        for worker_num, worker in list(workers.items()):
+            if worker.poll() is None or queue.is_finished():
+                continue
+            if num_restarts[worker_num] >= MAX_WORKER_RESTARTS:
+                LOG.error(f"Local worker: [{worker_num}] died: [{MAX_WORKER_RESTARTS + 1}] times, see file: [{path.joinpath(f'worker_{worker_num}.log')}]. Not restarting it.")
+                del workers[worker_num]
+                continue
+            num_restarts[worker_num] += 1
+            LOG.warning(f"Local worker: [{worker_num}] exited with: [{worker.returncode}] while there's work left. Restarting it.")
+            workers[worker_num] = spawn_worker(path, command, worker_num)
+
+        if num_workers > 0 and len(workers) == 0:
+            LOG.error(f"All local workers died. Units left: [{queue.summary()}]")
+            break
+
+    for worker in workers.values():
+        worker.wait()
+
+
+def merge(queue: WorkQueue, path: Path, gds: List[Grading], grade_file_paths: Dict[int, Path]) -> Dict[int, List[GradingEvent]]:
+    """
+    Merges the workers' logs into each week's grading events log: users in their order in handles.csv, each with the events of the
+    lease that finished it, in the order they were made. So the log doesn't depend on which worker graded whom, or when.
+    Events of leases that expired or failed are left out.
+    """
+    units = queue.units()
+    week_events = dict()
+    for gd in gds:
+        lease_lines = dict() # lease_id => {uni => [log lines]}
+        lines = []
+        for uni, status, lease_id, _ in units:
+            if status != DONE:
+                continue
+            if lease_id not in lease_lines:
+                lease_lines[lease_id] = dict()
+                with open(lease_file_path(path, lease_id, gd.week_num), "r", encoding='utf-8') as f:
+                    for line in f:
+                        lease_lines[lease_id].setdefault(GradingEvent.from_log_line(line).uni, []).append(line)
+            lines += lease_lines[lease_id].get(uni, [])
+
+        write_atomically(grade_file_paths[gd.week_num], "".join(lines))
+        events = [GradingEvent.from_log_line(line) for line in lines]
+        LOG.info(f"Merged: [{len(events)}] events for week: [{gd.week_num}] into: [{grade_file_paths[gd.week_num]}]")
+        week_events[gd.week_num] = events
+    return week_events
+
+
+def coordinate(week_nums: List[int], force: bool, uni: str, platform_name: str, num_workers: int, use_store: bool = False) -> Iterator[GradingEvent]:
+    """
+    Grades (see grader.grade_events) across processes and hosts: contests are discovered once, users are queued as units (see WorkQueue)
+    for num_workers local workers plus any that join from other hosts (see work), and their logs are merged into each week's
+    grading events log once all users are done. Platforms' rate limits are per worker, so each worker (host) gets its own budget.
+
+    Yields the merged events, a user's at a time per week.
+    """
+    gds = [Grading(week_num=week_num) for week_num in sorted(set(week_nums))]
+    span_gd = Grading.span(gds)
+    uni = uni.strip() if uni is not None else uni
+    platform_name = platform_name.strip() if platform_name is not None else platform_name
+    users = grader.apply_filters(uni, platform_name)
+    grade_file_paths = {gd.week_num: grader.prepare_grade_file(gd, force, uni, platform_name) for gd in gds}
+
+    path = run_path(week_nums, uni, platform_name)
+    path.mkdir(parents=True, exist_ok=True)
+    for old_file_path in list(path.glob("lease_*.log")) + list(path.glob("worker_*.log")) + list(path.glob("metrics_*.json")) + list(path.glob("trace_*")):
+        old_file_path.unlink()
+    week_platform_contests_map = grader.discover_contests(gds, span_gd)
+    save_contests(path, week_platform_contests_map)
+    if uni is None or uni == "":
+        pre_process_bulk(week_platform_contests_map, gds, users)
+    else:
+        # What's pre-processed is for everyone, so a contest pre-processed for the filtered users would pass for it for all of them.
+        # A single user is a single lease anyway, which loads the contest (in memory only) once.
+        LOG.info(f"Not pre-processing bulk contests for the filtered users: [{[usr.uni for usr in users]}]")
+    queue = WorkQueue(path.joinpath("queue.db"))
+    queue.reset([usr.uni for usr in users])
+    star(f"Sharded run: [{path.name}] with: [{len(users)}] users and: [{num_workers}] local workers", LOG, 100)
+
+    wait_for_workers(queue, path, worker_command(week_nums, uni, platform_name, use_store), num_workers)
+    week_events = merge(queue, path, gds, grade_file_paths)
+
+    for unit_uni, status, _, last_error in queue.units():
+        if status != DONE:
+            LOG.error(f"User: [{unit_uni}] wasn't graded: [{status}]. {last_error if last_error is not None else ''}")
+            LOG.error(f"Resume with: python3 grader.py -w {','.join([str(gd.week_num) for gd in gds])} -u {unit_uni}{' -p ' + platform_name if platform_name else ''}")
+    grader.SKIPPED_UNITS.extend(queue.skipped_units())
+    queue.close()
+
+    for gd in gds:
+        yield from week_events[gd.week_num]
+    grader.report_skipped_units(grade_file_paths[span_gd.week_num].name)
+    workers = dict() # Each worker's own metrics (see work), the coordinator's only cover contest discovery and pre-processing
+    for metrics_file_path in sorted(path.glob("metrics_*.json")):
+        with open(metrics_file_path, "r", encoding='utf-8') as f:
+            workers[metrics_file_path.stem[len("metrics_"):]] = loads(f.read())
+    grader.report_metrics(grade_file_paths[span_gd.week_num].name, week_nums=[gd.week_num for gd in gds], num_users=len(users), workers=workers)
+    grader.report_trace(grade_file_paths[span_gd.week_num].name) # The workers' traces are in the run's directory
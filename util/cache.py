@@ -0,0 +1,197 @@
+import gzip
+import threading
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import quote, unquote
+from constants import CACHE_PATH
+from util import trace
+from util.decode import loads, dumps
+from util.log import get_logger
+
+LOG = get_logger("Cache")
+
+# Values put with persist are kept here, under a directory per namespace and version
+STORE_PATH = CACHE_PATH.joinpath("store")
+DISK_SUFFIX = ".json.gz"
+DEFAULT_MAX_MEMORY_BYTES = 256*1024*1024
+
+# namespace => its store, so that each namespace has a single memory tier (and metrics) per process
+STORES: Dict[str, "CacheStore"] = dict()
+
+
+class CacheStore:
+    """
+    A namespace of cached values (ex: a platform's contest results), each under a key of a few parts (ex: (week_num, contest_id)).
+
+    Values are kept in memory up to max_memory_bytes (of their json size), beyond which the least recently used ones are evicted.
+    Values put with persist are also kept on disk, as gzipped json (STORE_PATH/<namespace>/v<version>/<part>/.../<last part>.json.gz),
+    and a value that's not in memory (anymore) is read back from there. The namespace's version is part of the path, so bumping it
+    (when the values' format changes) leaves older values unread.
+
+    Hits (memory or disk), misses, evictions and bytes are counted in metrics (see log_metrics).
+    """
+
+    def __init__(self, namespace: str, version: int = 1, max_memory_bytes: int = DEFAULT_MAX_MEMORY_BYTES) -> None:
+        self.namespace = namespace
+        self.version = version
+        self.max_memory_bytes = max_memory_bytes
+        self.memory: OrderedDict = OrderedDict() # key => (value, size), least recently used first
+        self.memory_bytes = 0
+        self.metrics = defaultdict(int)
+        self.lock = threading.RLock() # Pre-processing jobs share stores across threads
+
+
+    def __key(self, key: Tuple) -> Tuple[str, ...]:
+        return tuple([str(part) for part in key])
+
+
+    def path(self, key: Tuple) -> Path:
+        parts = [quote(part, safe="") for part in self.__key(key)]
+        return STORE_PATH.joinpath(self.namespace, f"v{self.version}", *parts[:-1], parts[-1] + DISK_SUFFIX)
+
+
+    def keys(self, prefix: Tuple = ()) -> List[Tuple[str, ...]]:
+        """
+        Keys (as strings) of the values on disk under the prefix, ex: (week_num,) for the week's contests.
+        """
+        dir_path = STORE_PATH.joinpath(self.namespace, f"v{self.version}", *[quote(part, safe="") for part in self.__key(prefix)])
+        if not dir_path.is_dir():
+            return []
+        return sorted([self.__key(prefix) + tuple([unquote(part) for part in path.relative_to(dir_path).parts[:-1]]) + (unquote(path.name[:-len(DISK_SUFFIX)]),)
+            for path in dir_path.rglob(f"*{DISK_SUFFIX}")])
+
+
+    def on_disk(self, key: Tuple) -> bool:
+        return self.path(key).exists()
+
+
+    def __contains__(self, key: Tuple) -> bool:
+        with self.lock:
+            return self.__key(key) in self.memory or self.on_disk(key)
+
+
+    @staticmethod
+    def encode(value) -> bytes:
+        return gzip.compress(dumps(value).encode("utf-8"), mtime=0) # No timestamp, so the same value always makes the same file
+
+
+    @staticmethod
+    def decode(data: bytes):
+        return loads(gzip.decompress(data))
+
+
+    def __remember(self, key: Tuple[str, ...], value, size: int) -> None:
+        if key in self.memory:
+            self.memory_bytes -= self.memory.pop(key)[1]
+        self.memory[key] = (value, size)
+        self.memory_bytes += size
+        while self.memory_bytes > self.max_memory_bytes and len(self.memory) > 1:
+            evicted_key, (_, evicted_size) = self.memory.popitem(last=False)
+            self.memory_bytes -= evicted_size
+            self.metrics["evictions"] += 1
+            LOG.debug(f"[{self.namespace}]: Evicted: [{evicted_key}] of: [{evicted_size}] bytes")
+
+
+    def get(self, key: Tuple, loader: Callable = None, persist: bool = False, remember: bool = True):
+        """
+        The value from memory, or else from disk, or else from loader (when given, and put with persist), or else None.
+        Values read from disk are kept in memory, unless remember is unset (ex: only a part of them is kept by the caller).
+        """
+        str_key = self.__key(key)
+        with self.lock:
+            if str_key in self.memory:
+                self.memory.move_to_end(str_key)
+                self.metrics["hits"] += 1
+                return self.memory[str_key][0]
+
+            path = self.path(key)
+            if path.exists():
+                with trace.span(f"{self.namespace} read", 'cache', key=str_key):
+                    data = path.read_bytes()
+                    raw = gzip.decompress(data)
+                    value = loads(raw)
+                self.metrics["disk_hits"] += 1
+                self.metrics["disk_bytes_read"] += len(data)
+                if remember:
+                    self.__remember(str_key, value, len(raw))
+                return value
+
+            self.metrics["misses"] += 1
+        if loader is None:
+            return None
+        value = loader()
+        if value is not None:
+            self.put(key, value, persist)
+        return value
+
+
+    def put(self, key: Tuple, value, persist: bool = False, size: int = None) -> None:
+        """
+        Keeps the value in memory, and on disk if persist is set. The disk write is atomic, readers never see a half written value.
+        Values that aren't json (ex: sets) are only kept in memory, and should come with their size.
+        """
+        str_key = self.__key(key)
+        raw = dumps(value).encode("utf-8") if (persist or size is None) else None
+        with self.lock:
+            self.metrics["puts"] += 1
+            self.__remember(str_key, value, size if size is not None else len(raw))
+            if persist:
+                data = gzip.compress(raw, mtime=0)
+                path = self.path(key)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_name(path.name + ".tmp")
+                tmp_path.write_bytes(data)
+                tmp_path.replace(path)
+                self.metrics["disk_writes"] += 1
+                self.metrics["disk_bytes_written"] += len(data)
+                self.metrics["raw_bytes_written"] += len(raw)
+
+
+    def evict(self, key: Tuple) -> bool:
+        """
+        Drops the value from memory only (ex: once it's been applied to all users). Whether it was there.
+        """
+        with self.lock:
+            entry = self.memory.pop(self.__key(key), None)
+            if entry is None:
+                return False
+            self.memory_bytes -= entry[1]
+            return True
+
+
+    def invalidate(self, key: Tuple) -> None:
+        """
+        Drops the value from memory and from disk, so that it's loaded afresh.
+        """
+        with self.lock:
+            self.evict(key)
+            self.path(key).unlink(missing_ok=True)
+            self.metrics["invalidations"] += 1
+
+
+    def summary(self) -> Dict[str, int]:
+        with self.lock:
+            return {**self.metrics, "memory_values": len(self.memory), "memory_bytes": self.memory_bytes}
+
+
+def get_store(namespace: str, version: int = 1, max_memory_bytes: int = DEFAULT_MAX_MEMORY_BYTES) -> CacheStore:
+    if namespace not in STORES:
+        STORES[namespace] = CacheStore(namespace, version, max_memory_bytes)
+    return STORES[namespace]
+
+
+def log_metrics(logger = LOG) -> None:
+    """
+    Logs what caching saved: per namespace, how often values were found (in memory or on disk) instead of fetched, and the
+    compression of what was written to disk.
+    """
+    for namespace, store in sorted(STORES.items()):
+        summary = store.summary()
+        lookups = summary.get("hits", 0) + summary.get("disk_hits", 0) + summary.get("misses", 0)
+        if lookups == 0 and summary.get("puts", 0) == 0:
+            continue
+        hit_rate = (summary.get("hits", 0) + summary.get("disk_hits", 0)) / lookups if lookups > 0 else 0
+        compression = summary.get("disk_bytes_written", 0) / summary["raw_bytes_written"] if summary.get("raw_bytes_written", 0) > 0 else None
+        logger.info(f"Cache: [{namespace}] hit rate: [{hit_rate:.0%}] of: [{lookups}] lookups, "
+            f"compressed to: [{f'{compression:.0%}' if compression is not None else '-'}], metrics: [{summary}]")
@@ -0,0 +1,130 @@
+import threading
+import time
+from typing import Tuple
+from util.log import get_logger
+
+LOG = get_logger("CircuitBreaker")
+
+
+class CircuitOpenException(Exception):
+    """
+        Raised instead of calling a platform whose circuit is open, i.e. the platform is considered unavailable.
+    """
+    pass
+
+
+class PlatformUnavailable(Exception):
+    """
+        Raised when the platform itself failed (unreachable, server errors, still throttling after all retries).
+    """
+    pass
+
+
+class UserFailure(Exception):
+    """
+        Raised when a call failed for its user alone (unknown handle, user missing from a contest's data etc.), which says nothing
+        about the platform. These never count towards opening a circuit.
+    """
+    pass
+
+
+class CircuitBreaker:
+    """
+        Stops calling a platform that keeps failing (site down, throttling us etc.) so that it doesn't
+        stall the whole grading run with rate-limit waits and selenium timeouts.
+
+        CLOSED: Calls go through. K consecutive failures open the circuit.
+        OPEN: Calls are short-circuited with CircuitOpenException until the reset timeout passes.
+        HALF_OPEN: A single probe call is let through, others are short-circuited. Success closes the circuit, failure opens it again.
+
+        Any exception is a failure (ex: a scrape whose selectors stopped matching after a layout change), except UserFailure, which is
+        raised as is and leaves the circuit as it was. A probe that ends with one didn't tell either way, so the next call is the probe.
+        Calls can be made for a key (ex: the user's uni), so that one user failing over and over (ex: in every contest) counts once,
+        it takes K different users to open the circuit. PlatformUnavailable always counts.
+    """
+
+    CLOSED = "CLOSED"
+    OPEN = "OPEN"
+    HALF_OPEN = "HALF_OPEN"
+
+    FAILURE_THRESHOLD = 5
+    RESET_TIMEOUT_SECS = 10*60
+
+    def __init__(self, name: str, failure_threshold: int = FAILURE_THRESHOLD, reset_timeout_secs: int = RESET_TIMEOUT_SECS) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_secs = reset_timeout_secs
+        self.state = CircuitBreaker.CLOSED
+        self.consecutive_failures = 0
+        self.failed_keys = set() # Of the consecutive failures
+        self.opened_at_ts_sec = 0
+        self.num_short_circuited = 0
+        self.is_probing = False
+        self.lock = threading.Lock()
+
+
+    def __admit(self) -> Tuple[bool, bool]:
+        """
+        Whether a call may go through, and whether it is the probe.
+        """
+        with self.lock:
+            if self.state == CircuitBreaker.OPEN and (time.time() - self.opened_at_ts_sec) >= self.reset_timeout_secs:
+                LOG.info(f"[{self.name}]: Reset timeout of [{self.reset_timeout_secs}](s) passed. Letting a probe call through.")
+                self.state = CircuitBreaker.HALF_OPEN
+            if self.state == CircuitBreaker.HALF_OPEN:
+                if self.is_probing:
+                    return False, False
+                self.is_probing = True
+                return True, True
+            return self.state != CircuitBreaker.OPEN, False
+
+
+    def record_success(self) -> None:
+        with self.lock:
+            if self.state != CircuitBreaker.CLOSED:
+                LOG.info(f"[{self.name}]: Probe call succeeded. Closing circuit.")
+            self.state = CircuitBreaker.CLOSED
+            self.consecutive_failures = 0
+            self.failed_keys = set()
+
+
+    def record_failure(self, key: str = None) -> None:
+        with self.lock:
+            if key is not None:
+                if key in self.failed_keys and self.state != CircuitBreaker.HALF_OPEN:
+                    return
+                self.failed_keys.add(key)
+            self.consecutive_failures += 1
+            if self.state == CircuitBreaker.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                LOG.error(f"[{self.name}]: [{self.consecutive_failures}] consecutive failures. Opening circuit for [{self.reset_timeout_secs}](s).")
+                self.state = CircuitBreaker.OPEN
+                self.opened_at_ts_sec = time.time()
+
+
+    def call(self, fn, *args, key: str = None, **kwargs):
+        """
+        Calls fn(*args, **kwargs) through the circuit, for key (see the class).
+        """
+        is_allowed, is_probe = self.__admit()
+        if not is_allowed:
+            with self.lock:
+                self.num_short_circuited += 1
+            raise CircuitOpenException(f"Platform: [{self.name}] is unavailable (circuit open after [{self.consecutive_failures}] consecutive failures)")
+        try:
+            ret = fn(*args, **kwargs)
+        except UserFailure:
+            raise
+        except PlatformUnavailable:
+            self.record_failure()
+            raise
+        except Exception as e:
+            LOG.debug(f"[{self.name}]: Failure for: [{key}]: [{type(e).__name__}]")
+            self.record_failure(key)
+            raise
+        else:
+            self.record_success()
+            return ret
+        finally:
+            if is_probe:
+                with self.lock:
+                    self.is_probing = False
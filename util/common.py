@@ -1,14 +1,42 @@
+from pathlib import Path
+from typing import List
 from util.log import get_logger
 
 LOG = get_logger("common")
 
 
 # Log and raise exception
-def fail(s: str, logger = LOG):
+def fail(s: str, logger = LOG, exception_type = Exception):
     logger.error(s)
-    raise Exception(s)
+    raise exception_type(s)
 
 
 def star(s: str, logger = LOG, size = 50):
     size = max(len(s)+ 10, size)
     logger.info(s.center(size, '*'))
+
+
+def parse_week_nums(val: str) -> List[int]:
+    """
+    Parses '5', '3-7' or '3,5,7' (or a mix, ex: '1,3-5') into a list of week numbers.
+    """
+    week_nums = []
+    for part in val.split(","):
+        part = part.strip()
+        if "-" in part:
+            start, end = part.split("-")
+            week_nums += list(range(int(start), int(end) + 1))
+        else:
+            week_nums.append(int(part))
+    return week_nums
+
+
+
+def write_atomically(path: Path, text: str) -> None:
+    """
+    Writes to a file aside and then moves it in place, so that readers never see a half written file.
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding='utf-8') as f:
+        f.write(text)
+    tmp_path.replace(path)
@@ -1,7 +1,9 @@
 from constants import TIC_WEEK_1_START_DATE
 from util.log import get_logger
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, tzinfo
 from typing import Tuple
+from bisect import bisect_right
+from functools import lru_cache
 import pytz
 from constants import TIC_WEEK_START_DATES, EST_TZINFO_DELTA, EST_TZINFO
 from util.common import fail
@@ -27,12 +29,12 @@ def get_course_week(est_date: datetime) -> Tuple[datetime, datetime, int]:
     if not is_est(est_date):
         fail(f"Not an EST DATE: {est_date}", LOG)
 
-    if est_date > TIC_WEEK_START_DATES[-1] or est_date < TIC_WEEK_1_START_DATE:
+    if est_date >= TIC_WEEK_START_DATES[-1] or est_date < TIC_WEEK_1_START_DATE:
         fail(f"Date {est_date} not within the course duration: [{TIC_WEEK_1_START_DATE}, {TIC_WEEK_START_DATES[-1]}", LOG)
 
-    for i, dt in enumerate(TIC_WEEK_START_DATES):
-        if est_date < dt:
-            return [TIC_WEEK_START_DATES[i-1], TIC_WEEK_START_DATES[i] - timedelta(seconds=1), i]
+    # TIC_WEEK_START_DATES is sorted, so bisect for the first week start strictly after est_date
+    i = bisect_right(TIC_WEEK_START_DATES, est_date)
+    return [TIC_WEEK_START_DATES[i-1], TIC_WEEK_START_DATES[i] - timedelta(seconds=1), i]
 
 
 def get_course_week_by_num(week_num: int):
@@ -42,8 +44,15 @@ def get_course_week_by_num(week_num: int):
 def to_dt_from_ts(epoch_millis: int) -> datetime:
     return datetime.fromtimestamp(epoch_millis/1000.0, tz=EST_TZINFO)
 
-def to_dt_from_fmt(date_str: str, fmt: str) -> datetime:
-    fail("Unimplemented to_dt_from_fmt", LOG)
+@lru_cache(maxsize=4096)
+def to_dt_from_fmt(date_str: str, fmt: str, tz: tzinfo = EST_TZINFO) -> datetime:
+    """
+        Parses date_str (in timezone tz) and returns it as an EST datetime. Cached, because the same
+        timestamps (ex: Codechef's "%I:%M %p %d/%m/%y") show up over and over again.
+    """
+    dt = datetime.strptime(date_str, fmt)
+    dt = dt.replace(tzinfo=tz)
+    return dt.astimezone(EST_TZINFO)
 
 
 def in_between_dt(target_dt: datetime, start_dt: datetime, end_dt: datetime) -> bool:
@@ -52,14 +61,20 @@ def in_between_dt(target_dt: datetime, start_dt: datetime, end_dt: datetime) ->
     """
     return (target_dt >= start_dt) and (target_dt <= end_dt)
 
-def in_between_ts(target_dt: datetime, start_epoch_ms: int, end_epoch_ms: int) -> bool:
+def in_between_ts(target_epoch: int, start_epoch: int, end_epoch: int) -> bool:
     """
-        start_epoch_ms, end_epoch_ms must both be milliseconds since unix epoch time,
-        further the check is inclusive of both.
+        All of target_epoch, start_epoch and end_epoch must be in the same unit since unix epoch time (seconds or milliseconds),
+        further the check is inclusive of both. Meant for hot loops, where building a datetime per submission is too slow.
     """
-    start_dt = datetime.fromtimestamp(start_epoch_ms/1000.0, tz=EST_TZINFO)
-    end_dt = datetime.fromtimestamp(start_epoch_ms/1000.0, tz=EST_TZINFO)
-    return in_between_dt(target_dt, start_dt, end_dt)
+    return start_epoch <= target_epoch <= end_epoch
+
+
+def to_ts_sec(dt: datetime) -> int:
+    return int(dt.timestamp())
+
+
+def to_ts_ms(dt: datetime) -> int:
+    return int(dt.timestamp()*1000)
 
 
 def get_curr_dt_est() -> datetime:
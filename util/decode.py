@@ -0,0 +1,136 @@
+import json
+from typing import Callable, Iterator
+from util.log import get_logger
+
+# Both backends are optional. Without them we fall back to the standard library json module.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+LOG = get_logger("Decode")
+
+# What the backends raise for documents that aren't json (ex: an empty body or an html error page). orjson's and json's errors are ValueErrors.
+DECODE_ERRORS = (ValueError,) if ijson is None else (ValueError, ijson.JSONError)
+LOG.debug(f"JSON backend: [{'orjson' if orjson is not None else 'json'}], streaming backend: [{'ijson' if ijson is not None else 'None'}]")
+
+
+def loads(data):
+    """
+        Decodes a whole json document (str or bytes) with the fastest available backend.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj)
+
+
+class PrefixNotFound(Exception):
+    """
+        Raised when a streamed document has nothing at the prefix, not even an empty array, i.e. it isn't shaped as expected
+        (ex: an error body instead of the catalog), or isn't json at all.
+    """
+    pass
+
+
+class _RecordingStream:
+    """
+        Keeps what's read from a stream until it's told to stop, so that a document that turned out to have no items can still be
+        looked at whole. Documents with items stop it at the first one, so only what precedes it is ever kept.
+    """
+
+    def __init__(self, stream) -> None:
+        self.stream = stream
+        self.chunks = []
+        self.is_recording = True
+
+
+    def read(self, size: int = -1):
+        data = self.stream.read(size)
+        if self.is_recording:
+            self.chunks.append(data)
+        return data
+
+
+    def stop(self) -> None:
+        self.is_recording = False
+        self.chunks = []
+
+
+def _walk_prefix(doc, prefix: str) -> Iterator:
+    """
+        Mimics ijson's prefix semantics on an already decoded document. 'item' stands for
+        every element of an array, ex: 'data.objects.item'.
+    """
+    curr_vals = [doc]
+    for part in prefix.split(".") if prefix != "" else []:
+        next_vals = []
+        for val in curr_vals:
+            if part == "item":
+                next_vals.extend(val if isinstance(val, list) else [])
+            elif isinstance(val, dict) and part in val:
+                next_vals.append(val[part])
+        curr_vals = next_vals
+    return iter(curr_vals)
+
+
+def _decoded(items: Iterator, prefix: str) -> Iterator:
+    """
+        Passes streamed items through, turning decode errors (ex: on a truncated document) into PrefixNotFound.
+    """
+    try:
+        yield from items
+    except DECODE_ERRORS as e:
+        raise PrefixNotFound(f"Not a json document with items at: [{prefix}]. {e}")
+
+
+def _loads_document(data, prefix: str):
+    try:
+        return loads(data)
+    except DECODE_ERRORS as e:
+        raise PrefixNotFound(f"Not a json document with items at: [{prefix}] in: [{data[:200]}]. {e}")
+
+
+def iter_items(stream, prefix: str, predicate: Callable = None) -> Iterator:
+    """
+        Yields the items found at prefix (ijson style, ex: 'result.item') in a file-like stream of json, keeping only
+        those for which predicate is True.
+
+        With ijson installed, the document is parsed incrementally and items failing the predicate are dropped as soon as
+        they are parsed, so the whole document is never held in memory. Otherwise the whole document is decoded first.
+
+        Raises PrefixNotFound if there's no array at all at prefix (as opposed to an empty one), or if the document isn't json,
+        so that an error body isn't taken for a document without items.
+    """
+    doc = None
+    if ijson is not None:
+        stream = _RecordingStream(stream)
+        items = _decoded(ijson.items(stream, prefix, use_float=True), prefix)
+    else:
+        doc = _loads_document(stream.read(), prefix)
+        items = _walk_prefix(doc, prefix)
+
+    num_items = 0
+    for item in items:
+        num_items += 1
+        if num_items == 1 and doc is None:
+            stream.stop()
+        if predicate is None or predicate(item):
+            yield item
+
+    if num_items == 0:
+        if doc is None:
+            doc = _loads_document(b"".join(stream.chunks), prefix)
+        array_prefix = prefix.rsplit(".", 1)[0] if "." in prefix else ""
+        if not any(isinstance(val, list) for val in _walk_prefix(doc, array_prefix)):
+            raise PrefixNotFound(f"No array at: [{array_prefix}] for items at: [{prefix}] in: [{str(doc)[:200]}]")
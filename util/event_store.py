@@ -0,0 +1,164 @@
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+from constants import CACHE_PATH
+from model.grading_event import GradingEvent
+from util.common import fail
+from util.decode import dumps
+from util.log import get_logger
+
+LOG = get_logger("EventStore")
+
+
+class EventStore:
+    """
+    Local (SQLite) store of all grading events of the term, compacted from the grading events logs
+    (grading_events_<week_num>[_<uni>][_<platform>][_old_<ts>].log).
+
+    An event is identified by (week_num, uni, platform_name, event_type, event_name). When the same event was logged more than once
+    (ex: a re-run for a single user or platform, or a forced re-grade that moved the older log aside), only the latest one is kept,
+    along with the log (and line) it came from. Logs that haven't changed since they were last ingested are skipped.
+    """
+
+    DB_PATH = CACHE_PATH.joinpath("grading_events.db")
+
+    # Columns that totals can be grouped by
+    GROUP_BY_COLUMNS = ["week_num", "uni", "platform_name", "event_type", "event_name", "source_log"]
+
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS events (
+            week_num INTEGER NOT NULL,
+            uni TEXT NOT NULL,
+            platform_name TEXT NOT NULL,
+            event_type TEXT NOT NULL,
+            event_name TEXT NOT NULL,
+            points REAL NOT NULL,
+            is_exception INTEGER NOT NULL,
+            is_unavailable INTEGER NOT NULL,
+            curr_dt TEXT NOT NULL,
+            curr_ts_ms INTEGER NOT NULL,
+            problems TEXT,
+            partial_problems TEXT,
+            excluded_problems TEXT,
+            source_log TEXT NOT NULL,
+            source_line INTEGER NOT NULL,
+            PRIMARY KEY (week_num, uni, platform_name, event_type, event_name)
+        )""",
+        "CREATE INDEX IF NOT EXISTS events_by_uni ON events (uni, week_num)",
+        "CREATE INDEX IF NOT EXISTS events_by_platform ON events (platform_name, week_num)",
+        """CREATE TABLE IF NOT EXISTS ingested_logs (
+            source_log TEXT NOT NULL PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            num_events INTEGER NOT NULL
+        )""",
+    ]
+
+    # Keeps the latest of the two events, by the time they were logged at
+    UPSERT = """INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (week_num, uni, platform_name, event_type, event_name) DO UPDATE SET
+            points = excluded.points, is_exception = excluded.is_exception, is_unavailable = excluded.is_unavailable,
+            curr_dt = excluded.curr_dt, curr_ts_ms = excluded.curr_ts_ms, problems = excluded.problems, partial_problems = excluded.partial_problems,
+            excluded_problems = excluded.excluded_problems, source_log = excluded.source_log, source_line = excluded.source_line
+        WHERE excluded.curr_ts_ms > events.curr_ts_ms"""
+
+    def __init__(self, db_path: Path = DB_PATH) -> None:
+        self.db_path = db_path
+        self.conn = sqlite3.connect(str(db_path))
+        for statement in EventStore.SCHEMA:
+            self.conn.execute(statement)
+        self.conn.commit()
+
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+    def __json(self, val) -> str:
+        return dumps(val) if val is not None else None
+
+
+    def ingest_log(self, log_path: Path) -> int:
+        """
+        Ingests a grading events log, unless it was already ingested as is. Returns the number of events read from it.
+        """
+        stat = log_path.stat()
+        ingested = self.conn.execute("SELECT size, mtime_ns FROM ingested_logs WHERE source_log = ?", (log_path.name,)).fetchone()
+        if ingested is not None and ingested[0] == stat.st_size and ingested[1] == stat.st_mtime_ns:
+            LOG.debug(f"Already ingested: [{log_path.name}]")
+            return 0
+
+        rows = []
+        with open(log_path, "r", encoding='utf-8') as f:
+            for line_num, line in enumerate(f, start=1):
+                if line.strip() == "":
+                    continue
+                try:
+                    event = GradingEvent.from_log_line(line)
+                except Exception as e:
+                    LOG.error(f"Skipping malformed event at: [{log_path.name}:{line_num}]. {e}")
+                    continue
+                curr_ts_ms = int(datetime.fromisoformat(event.curr_dt).timestamp()*1000)
+                rows.append((event.week_num, event.uni, event.platform_name, event.event_type, event.event_name, event.points, int(event.is_exception), int(event.is_unavailable),
+                    event.curr_dt, curr_ts_ms, self.__json(event.problems), self.__json(event.partial_problems), self.__json(event.excluded_problems), log_path.name, line_num))
+
+        self.conn.executemany(EventStore.UPSERT, rows)
+        self.conn.execute("INSERT OR REPLACE INTO ingested_logs VALUES (?, ?, ?, ?)", (log_path.name, stat.st_size, stat.st_mtime_ns, len(rows)))
+        self.conn.commit()
+        LOG.info(f"Ingested: [{len(rows)}] events from: [{log_path.name}]")
+        return len(rows)
+
+
+    def ingest_all(self, logs_path: Path = CACHE_PATH) -> int:
+        """
+        Ingests all grading events logs (including the '_old_' ones moved aside by forced re-grades) found in logs_path.
+        """
+        log_paths = sorted(logs_path.glob("grading_events_*.log"))
+        num_events = sum([self.ingest_log(log_path) for log_path in log_paths])
+        num_stored = self.conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+        LOG.info(f"Ingested: [{num_events}] events from: [{len(log_paths)}] logs. Store has: [{num_stored}] events after removing superseded ones.")
+        return num_events
+
+
+    def __where(self, week_nums: List[int] = None, uni: str = None, platform_name: str = None):
+        clauses, params = [], []
+        if week_nums is not None and len(week_nums) > 0:
+            clauses.append(f"week_num IN ({', '.join(['?']*len(week_nums))})")
+            params += week_nums
+        if uni is not None and uni != "":
+            clauses.append("uni = ?")
+            params.append(uni)
+        if platform_name is not None and platform_name != "":
+            clauses.append("platform_name = ?")
+            params.append(platform_name)
+        return (" WHERE " + " AND ".join(clauses)) if len(clauses) > 0 else "", params
+
+
+    def totals(self, group_by: List[str], week_nums: List[int] = None, uni: str = None, platform_name: str = None) -> List[Dict]:
+        """
+        Totals per group (ex: ["uni", "platform_name"]) across the whole term, or the given weeks/uni/platform.
+
+        'points' is summed the way calculate_points does (each event's points as an int), 'raw_points' as logged.
+        """
+        unknown_columns = set(group_by) - set(EventStore.GROUP_BY_COLUMNS)
+        if len(unknown_columns) > 0:
+            fail(f"Can't group by: [{unknown_columns}], only by: [{EventStore.GROUP_BY_COLUMNS}]", LOG)
+
+        where, params = self.__where(week_nums, uni, platform_name)
+        columns = ", ".join(group_by)
+        query = f"""SELECT {columns + ', ' if columns != '' else ''}SUM(CAST(points AS INTEGER)), ROUND(SUM(points), 4), COUNT(*), SUM(is_exception), SUM(is_unavailable), GROUP_CONCAT(DISTINCT source_log)
+            FROM events{where}{' GROUP BY ' + columns + ' ORDER BY ' + columns if columns != '' else ''}"""
+
+        headers = group_by + ["points", "raw_points", "num_events", "num_exceptions", "num_unavailable", "source_logs"]
+        return [dict(zip(headers, row)) for row in self.conn.execute(query, params).fetchall()]
+
+
+    def events(self, week_nums: List[int] = None, uni: str = None, platform_name: str = None) -> List[Dict]:
+        """
+        The (latest) events themselves, along with the log and line each came from.
+        """
+        where, params = self.__where(week_nums, uni, platform_name)
+        headers = ["week_num", "uni", "platform_name", "event_type", "event_name", "points", "is_exception", "is_unavailable", "curr_dt", "problems", "source_log", "source_line"]
+        query = f"SELECT {', '.join(headers)} FROM events{where} ORDER BY week_num, uni, platform_name, event_type, event_name"
+        return [dict(zip(headers, row)) for row in self.conn.execute(query, params).fetchall()]
@@ -0,0 +1,122 @@
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+from constants import CACHE_PATH
+from util.log import get_logger
+
+LOG = get_logger("JobStore")
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobStore:
+    """
+    Local (SQLite) store of pre-processing jobs, one per (platform, week, contest), so that they survive restarts of the preprocessor.
+
+    A failed job is retried with an exponential backoff, up to MAX_ATTEMPTS times, after which it's marked as failed. On start,
+    jobs that were running (the preprocessor was stopped mid way) and failed ones are pending again, and so are failed ones that
+    are queued again FAILED_COOLDOWN_SECS after they failed. A job that wasn't ready (see defer) is tried again without using up an attempt.
+    """
+
+    DB_PATH = CACHE_PATH.joinpath("preprocess_jobs.db")
+
+    MAX_ATTEMPTS = 5
+    RETRY_BACKOFF_SECS = 60
+    MAX_RETRY_BACKOFF_SECS = 60*60
+    NOT_READY_RETRY_SECS = 15*60 # Codeforces' system tests often take an hour or two
+    FAILED_COOLDOWN_SECS = 6*60*60
+
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS jobs (
+            platform_name TEXT NOT NULL,
+            week_num INTEGER NOT NULL,
+            contest_id TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL,
+            next_attempt_ts_sec INTEGER NOT NULL,
+            last_error TEXT,
+            updated_ts_sec INTEGER NOT NULL,
+            PRIMARY KEY (platform_name, week_num, contest_id)
+        )""",
+    ]
+
+    def __init__(self, db_path: Path = DB_PATH) -> None:
+        self.db_path = db_path
+        self.conn = sqlite3.connect(str(db_path))
+        for statement in JobStore.SCHEMA:
+            self.conn.execute(statement)
+        num_reset = self.conn.execute("UPDATE jobs SET status = ?, attempts = 0, next_attempt_ts_sec = 0 WHERE status IN (?, ?)", (PENDING, RUNNING, FAILED)).rowcount
+        self.conn.commit()
+        if num_reset > 0:
+            LOG.info(f"Re-queued: [{num_reset}] running/failed jobs from a previous run")
+
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+    def add(self, platform_name: str, week_num: int, contest_id: str) -> None:
+        """
+        Queues a job, unless it's already queued. A job that was done is queued again (its cache went missing since), and so is one
+        that failed at least FAILED_COOLDOWN_SECS ago.
+        """
+        now_ts_sec = int(time.time())
+        self.conn.execute("""INSERT INTO jobs VALUES (?, ?, ?, ?, 0, 0, NULL, ?)
+            ON CONFLICT (platform_name, week_num, contest_id) DO UPDATE SET status = excluded.status, attempts = 0, next_attempt_ts_sec = 0, updated_ts_sec = excluded.updated_ts_sec
+            WHERE jobs.status = ? OR (jobs.status = ? AND jobs.updated_ts_sec <= ?)""",
+            (platform_name, week_num, contest_id, PENDING, now_ts_sec, DONE, FAILED, now_ts_sec - JobStore.FAILED_COOLDOWN_SECS))
+        self.conn.commit()
+
+
+    def pending(self) -> List[Tuple[str, int, str, int]]:
+        """
+        (platform_name, week_num, contest_id, next_attempt_ts_sec) of pending jobs.
+        """
+        return self.conn.execute("SELECT platform_name, week_num, contest_id, next_attempt_ts_sec FROM jobs WHERE status = ? ORDER BY week_num, platform_name, contest_id",
+            (PENDING,)).fetchall()
+
+
+    def start(self, platform_name: str, week_num: int, contest_id: str) -> None:
+        self.conn.execute("UPDATE jobs SET status = ?, attempts = attempts + 1, updated_ts_sec = ? WHERE platform_name = ? AND week_num = ? AND contest_id = ?",
+            (RUNNING, int(time.time()), platform_name, week_num, contest_id))
+        self.conn.commit()
+
+
+    def finish(self, platform_name: str, week_num: int, contest_id: str) -> None:
+        self.conn.execute("UPDATE jobs SET status = ?, last_error = NULL, updated_ts_sec = ? WHERE platform_name = ? AND week_num = ? AND contest_id = ?",
+            (DONE, int(time.time()), platform_name, week_num, contest_id))
+        self.conn.commit()
+
+
+    def fail(self, platform_name: str, week_num: int, contest_id: str, error: str) -> None:
+        attempts = self.conn.execute("SELECT attempts FROM jobs WHERE platform_name = ? AND week_num = ? AND contest_id = ?", (platform_name, week_num, contest_id)).fetchone()[0]
+        now_ts_sec = int(time.time())
+        if attempts >= JobStore.MAX_ATTEMPTS:
+            LOG.error(f"Job: [{platform_name}, {week_num}, {contest_id}] failed for good after: [{attempts}] attempts. {error}")
+            status, next_attempt_ts_sec = FAILED, 0
+        else:
+            backoff_secs = min(JobStore.MAX_RETRY_BACKOFF_SECS, JobStore.RETRY_BACKOFF_SECS*(2**(attempts - 1)))
+            LOG.warning(f"Job: [{platform_name}, {week_num}, {contest_id}] failed on attempt: [{attempts}], retrying in: [{backoff_secs}] secs. {error}")
+            status, next_attempt_ts_sec = PENDING, now_ts_sec + backoff_secs
+        self.conn.execute("UPDATE jobs SET status = ?, next_attempt_ts_sec = ?, last_error = ?, updated_ts_sec = ? WHERE platform_name = ? AND week_num = ? AND contest_id = ?",
+            (status, next_attempt_ts_sec, error, now_ts_sec, platform_name, week_num, contest_id))
+        self.conn.commit()
+
+
+    def defer(self, platform_name: str, week_num: int, contest_id: str, reason: str) -> None:
+        """
+        Tries the job again in NOT_READY_RETRY_SECS, without counting the attempt that found it wasn't ready.
+        """
+        now_ts_sec = int(time.time())
+        LOG.info(f"Job: [{platform_name}, {week_num}, {contest_id}] isn't ready, retrying in: [{JobStore.NOT_READY_RETRY_SECS}] secs. {reason}")
+        self.conn.execute("UPDATE jobs SET status = ?, attempts = MAX(attempts - 1, 0), next_attempt_ts_sec = ?, last_error = ?, updated_ts_sec = ? WHERE platform_name = ? AND week_num = ? AND contest_id = ?",
+            (PENDING, now_ts_sec + JobStore.NOT_READY_RETRY_SECS, reason, now_ts_sec, platform_name, week_num, contest_id))
+        self.conn.commit()
+
+
+    def summary(self) -> Dict[str, int]:
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
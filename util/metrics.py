@@ -0,0 +1,173 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Tuple
+from urllib.parse import urlparse
+from util.common import write_atomically
+from util.decode import dumps
+from util.log import get_logger
+
+LOG = get_logger("Metrics")
+
+# Upper bounds of the latency buckets, roughly log spaced. Durations above the last one go into an overflow bucket.
+LATENCY_BUCKETS_MILLIS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000]
+
+# Histograms (durations) and counters recorded per (platform, endpoint)
+LATENCY = "latency"
+RATE_LIMIT_SLEEP = "rate_limit_sleep"
+SELENIUM_LAUNCH = "selenium_launch"
+PAGE_LOAD = "page_load"
+SELENIUM_WAIT = "selenium_wait"
+REQUESTS = "requests"
+BYTES = "bytes"
+RETRIES = "retries"
+EXCEPTIONS = "exceptions"
+SHORT_CIRCUITED = "short_circuited"
+
+# (platform, endpoint) => its metrics. Shared by all threads (ex: pre-processing jobs), under LOCK.
+METRICS: Dict[Tuple[str, str], "EndpointMetrics"] = dict()
+LOCK = threading.Lock()
+
+
+class Histogram:
+    """
+    Durations in fixed buckets (see LATENCY_BUCKETS_MILLIS), so that percentiles of a long run take no more memory than those of a short one.
+    Percentiles are the upper bound of the bucket they fall in (or the largest duration, if it's smaller).
+    """
+
+    def __init__(self) -> None:
+        self.bucket_counts = [0]*(len(LATENCY_BUCKETS_MILLIS) + 1)
+        self.count = 0
+        self.total_millis = 0.0
+        self.max_millis = 0.0
+
+
+    def add(self, millis: float) -> None:
+        self.bucket_counts[bisect_left(LATENCY_BUCKETS_MILLIS, millis)] += 1
+        self.count += 1
+        self.total_millis += millis
+        self.max_millis = max(self.max_millis, millis)
+
+
+    def percentile(self, fraction: float) -> float:
+        if self.count == 0:
+            return 0
+        rank = fraction*self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.bucket_counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(LATENCY_BUCKETS_MILLIS[i], round(self.max_millis, 1)) if i < len(LATENCY_BUCKETS_MILLIS) else round(self.max_millis, 1)
+        return round(self.max_millis, 1)
+
+
+    def to_dict(self) -> Dict:
+        return {"count": self.count, "total_millis": round(self.total_millis, 1), "max_millis": round(self.max_millis, 1),
+            "p50_millis": self.percentile(0.5), "p90_millis": self.percentile(0.9), "p99_millis": self.percentile(0.99),
+            "buckets": {(f"le_{bound}" if i < len(LATENCY_BUCKETS_MILLIS) else "inf"): bucket_count
+                for i, (bound, bucket_count) in enumerate(zip(LATENCY_BUCKETS_MILLIS + [None], self.bucket_counts)) if bucket_count > 0}}
+
+
+class EndpointMetrics:
+    def __init__(self) -> None:
+        self.counters = defaultdict(int)
+        self.histograms: Dict[str, Histogram] = defaultdict(Histogram)
+
+
+    def to_dict(self) -> Dict:
+        return {"counters": dict(self.counters), "histograms": {name: histogram.to_dict() for name, histogram in self.histograms.items()}}
+
+
+def endpoint_of(url: str) -> str:
+    """
+    The endpoint a url (or url template) is for: its host and path, without the query, and with numbers and placeholders made into {}.
+    Ex: https://dmoj.ca/api/v2/contest/{contest_id} => dmoj.ca/api/v2/contest/{}. Urls with other ids (ex: handles) in their path
+    should be given as their template.
+    """
+    parsed = urlparse(url)
+    parts = ["{}" if (part.isdigit() or "{" in part or "=" in part) else part for part in parsed.path.split("/") if part != ""]
+    return "/".join([parsed.netloc] + parts)
+
+
+def __get(platform: str, endpoint: str) -> EndpointMetrics:
+    key = (platform, endpoint)
+    if key not in METRICS:
+        METRICS[key] = EndpointMetrics()
+    return METRICS[key]
+
+
+def count(platform: str, endpoint: str, name: str, value: int = 1) -> None:
+    with LOCK:
+        __get(platform, endpoint).counters[name] += value
+
+
+def count_exception(platform: str, endpoint: str, e: BaseException) -> None:
+    count(platform, endpoint, EXCEPTIONS)
+    count(platform, endpoint, f"{EXCEPTIONS}.{type(e).__name__}")
+
+
+def observe(platform: str, endpoint: str, name: str, millis: float) -> None:
+    with LOCK:
+        __get(platform, endpoint).histograms[name].add(millis)
+
+
+@contextmanager
+def timed(platform: str, endpoint: str, name: str = LATENCY):
+    """
+    Observes how long the block took, even if it raised.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(platform, endpoint, name, (time.perf_counter() - start)*1000)
+
+
+def summary() -> Dict[str, Dict[str, Dict]]:
+    """
+    {platform => {endpoint => {"counters": {...}, "histograms": {name => {...}}}}}
+    """
+    with LOCK:
+        platforms = defaultdict(dict)
+        for (platform, endpoint), endpoint_metrics in sorted(METRICS.items()):
+            platforms[platform][endpoint] = endpoint_metrics.to_dict()
+        return dict(platforms)
+
+
+def summary_rows() -> List[List[str]]:
+    rows = [["platform", "endpoint", "requests", "MB", "retries", "errors", "slept(s)", "time(s)", "p50(ms)", "p90(ms)", "p99(ms)", "max(ms)", "selenium(s)"]]
+    for platform, endpoints in summary().items():
+        for endpoint, endpoint_metrics in endpoints.items():
+            counters, histograms = endpoint_metrics["counters"], endpoint_metrics["histograms"]
+            latency = histograms.get(LATENCY, Histogram().to_dict())
+            selenium_millis = sum([histograms[name]["total_millis"] for name in [SELENIUM_LAUNCH, PAGE_LOAD, SELENIUM_WAIT] if name in histograms])
+            rows.append([platform, endpoint, str(counters.get(REQUESTS, latency["count"])), f"{counters.get(BYTES, 0)/(1024*1024):.2f}",
+                str(counters.get(RETRIES, 0)), str(counters.get(EXCEPTIONS, 0) + counters.get(SHORT_CIRCUITED, 0)),
+                f"{histograms[RATE_LIMIT_SLEEP]['total_millis']/1000:.1f}" if RATE_LIMIT_SLEEP in histograms else "0.0",
+                f"{latency['total_millis']/1000:.1f}", str(latency["p50_millis"]), str(latency["p90_millis"]), str(latency["p99_millis"]),
+                str(int(latency["max_millis"])), f"{selenium_millis/1000:.1f}"])
+    return rows
+
+
+def log_summary(logger = LOG) -> None:
+    """
+    Logs a table of where the run's time went, per platform and endpoint: requests, bytes, retries, errors, time slept for rate
+    limits, time spent in requests (with latency percentiles) and in selenium.
+    """
+    rows = summary_rows()
+    if len(rows) == 1:
+        return
+    widths = [max([len(row[i]) for row in rows]) for i in range(len(rows[0]))]
+    for row in rows:
+        logger.info("  ".join([cell.ljust(width) if i < 2 else cell.rjust(width) for i, (cell, width) in enumerate(zip(row, widths))]))
+
+
+def write_report(path: Path, **extra) -> None:
+    """
+    Saves the metrics (see summary) as json, along with extra details of the run (ex: its weeks).
+    """
+    write_atomically(path, dumps({**extra, "latency_buckets_millis": LATENCY_BUCKETS_MILLIS, "platforms": summary()}))
+    LOG.info(f"Saved request metrics to: [{path}]")
@@ -0,0 +1,129 @@
+import random
+import threading
+import time
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from util.log import get_logger
+
+LOG = get_logger("RateLimiter")
+
+
+def now_millis() -> int:
+    return int(time.time()*1000)
+
+
+def parse_retry_after(value: str) -> float:
+    """
+        Retry-After can either be a number of seconds or a HTTP date. Returns seconds to wait, or None if
+        the header is missing/unparseable.
+    """
+    if value is None or value.strip() == "":
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_dt = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        LOG.warning(f"Unable to parse Retry-After: [{value}]")
+        return None
+    return max(0.0, retry_dt.timestamp() - datetime.now(retry_dt.tzinfo).timestamp())
+
+
+class RateLimiter:
+    """
+        Spaces out requests made to a single site.
+
+        The configured rate limit is the smallest interval we are ever allowed between two requests. Requests only
+        wait for whatever is still owed of that interval (plus some jitter), not for the time that already passed.
+
+        When the site throttles us (429/503) we back off: the site is blocked for the Retry-After duration (or a
+        decorrelated jitter backoff if it doesn't say) and the interval is multiplied. Every successful request after
+        that shaves a fixed step off the interval until it's back to the configured rate limit (AIMD).
+
+        It's safe to share across threads (ex: concurrent pre-processing jobs of a platform): each request reserves its slot
+        under a lock, then sleeps until it outside of it.
+
+        Source: https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+    """
+
+    BACKOFF_FACTOR = 2
+    RECOVERY_STEP_MILLIS = 250
+    MIN_BACKOFF_MILLIS = 1000
+    MAX_BACKOFF_MILLIS = 5*60*1000
+    MAX_INTERVAL_MILLIS = 60*1000
+
+    def __init__(self, rate_limit_millis: int = 0, max_jitter_millis: int = 0, name: str = None) -> None:
+        self.name = name
+        self.min_interval_millis = rate_limit_millis
+        self.interval_millis = rate_limit_millis
+        self.max_jitter_millis = max_jitter_millis
+        self.last_request_ts_millis = 0
+        self.blocked_until_ts_millis = 0
+        self.last_backoff_millis = 0
+        self.lock = threading.Lock()
+
+
+    def wait(self) -> int:
+        """
+            Blocks until the next request is allowed. Returns the number of millis slept.
+        """
+        with self.lock:
+            req_ts_millis = now_millis()
+            owed_millis = 0
+            if self.interval_millis > 0:
+                owed_millis = self.last_request_ts_millis + self.interval_millis - req_ts_millis
+            owed_millis = max(owed_millis, self.blocked_until_ts_millis - req_ts_millis)
+
+            sleep_millis = 0
+            random_jitter_millis = 0
+            if owed_millis > 0:
+                # Jitter is bounded by the interval itself so that it never dominates short rate limits
+                random_jitter_millis = random.randint(0, min(self.max_jitter_millis, max(self.interval_millis, 0)))
+                sleep_millis = owed_millis + random_jitter_millis
+
+            # The slot is taken now, so that the next request (from another thread) waits for an interval after it
+            self.last_request_ts_millis = req_ts_millis + sleep_millis
+
+        if sleep_millis > 0:
+            LOG.debug(f"[{self.name}]: Rate limit applied. Interval: {self.interval_millis}(ms), owed: {owed_millis}(ms) + random jitter {random_jitter_millis}(ms), i.e a total of {sleep_millis}(ms)")
+            time.sleep(sleep_millis/1000.0) # sleep takes seconds but fractional values are allowed, so dividing by 1000 is alright, no info lost
+        return sleep_millis
+
+
+    def expected_request_millis(self, latency_millis: int) -> float:
+        """
+            Expected time taken per request, back to back, for requests that take latency_millis themselves. Used for estimates.
+        """
+        if latency_millis >= self.interval_millis:
+            return latency_millis
+        return self.interval_millis + min(self.max_jitter_millis, self.interval_millis)/2
+
+
+    def on_success(self) -> None:
+        """
+            Additive increase (of the request rate): slowly probe back towards the configured rate limit.
+        """
+        with self.lock:
+            if self.interval_millis > self.min_interval_millis:
+                self.interval_millis = max(self.min_interval_millis, self.interval_millis - RateLimiter.RECOVERY_STEP_MILLIS)
+                LOG.debug(f"[{self.name}]: Recovering, interval is now: {self.interval_millis}(ms)")
+                if self.interval_millis == self.min_interval_millis:
+                    self.last_backoff_millis = 0
+
+
+    def on_throttle(self, retry_after_secs: float = None) -> None:
+        """
+            Multiplicative decrease (of the request rate) and a block on the site until the backoff is over.
+        """
+        with self.lock:
+            base_millis = max(self.min_interval_millis, RateLimiter.MIN_BACKOFF_MILLIS)
+            prev_backoff_millis = max(self.last_backoff_millis, base_millis)
+            backoff_millis = min(RateLimiter.MAX_BACKOFF_MILLIS, random.randint(base_millis, prev_backoff_millis*3))
+            if retry_after_secs is not None:
+                backoff_millis = max(backoff_millis, int(retry_after_secs*1000))
+            self.last_backoff_millis = backoff_millis
+
+            self.blocked_until_ts_millis = now_millis() + backoff_millis
+            self.interval_millis = min(RateLimiter.MAX_INTERVAL_MILLIS, max(self.interval_millis*RateLimiter.BACKOFF_FACTOR, base_millis))
+        LOG.warning(f"[{self.name}]: Throttled. Backing off for {backoff_millis}(ms) (Retry-After: {retry_after_secs}), interval is now: {self.interval_millis}(ms)")
@@ -0,0 +1,96 @@
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Set
+from model.grading_event import GradingEvent
+from constants import PRACTICE_PROBLEM_MULTIPLIER, CONTEST_PROBLEM_MULTIPLIER
+from util.common import fail
+from util.decode import loads
+from util.log import get_logger
+
+LOG = get_logger("Scoring")
+
+
+class ScoringRules:
+    """
+    Rules to re-score grading events offline, from the problems logged with each event (see model/grading_event.py) instead of
+    refetching anything. Loaded from a json file, where every key is optional, ex:
+    {
+        "contest_problem_multiplier": 1,
+        "practice_problem_multiplier": 0.01,
+        "platform_multipliers": {"Dmoj_contest": 2, "Spoj_practice": 0.02},
+        "partial_credit": true,
+        "count_excluded_problems": false,
+        "dedup_across_platforms": true
+    }
+
+    - platform_multipliers: overrides the multiplier for a '<platform>_<event_type>'
+    - partial_credit: count partially solved problems (ex: Dmoj) by the fraction of points obtained
+    - count_excluded_problems: also count problems the grader excluded (ex: Codechef problems solved outside the grading week)
+    - dedup_across_platforms: count a problem once per user, even if it shows up in several events. Contest events take precedence,
+      as long as they come first in the log (which is the order in which the grader writes them).
+    """
+    def __init__(self, rules: Dict = dict()) -> None:
+        unknown_rules = set(rules) - set(["contest_problem_multiplier", "practice_problem_multiplier", "platform_multipliers", "partial_credit", "count_excluded_problems", "dedup_across_platforms"])
+        if len(unknown_rules) > 0:
+            fail(f"Unknown scoring rules: [{unknown_rules}]", LOG)
+
+        self.multipliers = {"contest": rules.get("contest_problem_multiplier", CONTEST_PROBLEM_MULTIPLIER), "practice": rules.get("practice_problem_multiplier", PRACTICE_PROBLEM_MULTIPLIER)}
+        self.platform_multipliers = rules.get("platform_multipliers", dict())
+        self.partial_credit = rules.get("partial_credit", False)
+        self.count_excluded_problems = rules.get("count_excluded_problems", False)
+        self.dedup_across_platforms = rules.get("dedup_across_platforms", False)
+
+        self.seen_problems: Dict[str, Set[str]] = defaultdict(set) # uni => problems already counted
+        self.num_unscorable = 0
+
+
+    @staticmethod
+    def from_file(rules_path: Path) -> "ScoringRules":
+        if not rules_path.exists():
+            fail(f"Scoring rules file: [{rules_path}] does not exist", LOG)
+        with open(rules_path, "r", encoding='utf-8') as f:
+            return ScoringRules(loads(f.read()))
+
+
+    def multiplier(self, platform_name: str, event_type: str) -> float:
+        return self.platform_multipliers.get(f"{platform_name}_{event_type}", self.multipliers[event_type])
+
+
+    def __problem_key(self, event: GradingEvent, problem: str) -> str:
+        # Same keys as the practice pipeline's problem_key, so that contest and practice problems line up
+        return f"{event.event_name}/{problem}" if event.event_type == "contest" else problem
+
+
+    def __count(self, event: GradingEvent, problems: Dict[str, float]) -> float:
+        if not self.dedup_across_platforms:
+            return sum(problems.values())
+
+        seen_problems = self.seen_problems[event.uni]
+        num_problems = 0
+        for problem, credit in problems.items():
+            key = self.__problem_key(event, problem)
+            if key in seen_problems:
+                LOG.debug(f"Problem: [{key}] of user: [{event.uni}] was already counted, skipping it for platform: [{event.platform_name}]")
+                continue
+            seen_problems.add(key)
+            num_problems += credit
+        return num_problems
+
+
+    def score(self, event: GradingEvent) -> float:
+        """
+        Points for a grading event under these rules. Events logged before problems were recorded keep their points.
+        """
+        if event.problems is None:
+            self.num_unscorable += 1
+            return event.points
+
+        problems = {problem: 1 for problem in event.problems}
+        if self.partial_credit:
+            for problem, fraction in (event.partial_problems or dict()).items():
+                problems.setdefault(problem, fraction)
+        if self.count_excluded_problems:
+            for problem in (event.excluded_problems or dict()):
+                problems.setdefault(problem, 1)
+
+        return self.multiplier(event.platform_name, event.event_type) * self.__count(event, problems)
@@ -0,0 +1,118 @@
+import sqlite3
+import time
+from pathlib import Path
+from typing import List
+from constants import CACHE_PATH
+from model.submission import SubmissionRecord
+from model.user import User
+from util.log import get_logger
+
+LOG = get_logger("SubmissionStore")
+
+
+class SubmissionStore:
+    """
+    Local (SQLite) store of users' practice submissions, so that each grading run only fetches what's new.
+
+    For each (platform, handle) a sync cursor tracks the time range that is already fully synced: [synced_from_ts_sec, synced_to_ts_sec].
+    A sync for a grading week only fetches submissions newer than synced_to_ts_sec, unless the week starts before
+    synced_from_ts_sec, in which case the history is fetched back to the week's start (already stored submissions are ignored).
+    """
+
+    DB_PATH = CACHE_PATH.joinpath("submissions.db")
+
+    # Some platforms report times coarsely (ex: Codechef's '2 hours ago'), so re-fetch a little before the cursor
+    SYNC_OVERLAP_SECS = 2*60*60
+
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS submissions (
+            platform TEXT NOT NULL,
+            handle TEXT NOT NULL,
+            submission_id TEXT NOT NULL,
+            problem_id TEXT NOT NULL,
+            contest_id TEXT,
+            verdict TEXT,
+            is_accepted INTEGER NOT NULL,
+            ts_sec INTEGER NOT NULL,
+            PRIMARY KEY (platform, handle, submission_id)
+        )""",
+        "CREATE INDEX IF NOT EXISTS submissions_by_time ON submissions (platform, handle, ts_sec)",
+        """CREATE TABLE IF NOT EXISTS sync_cursors (
+            platform TEXT NOT NULL,
+            handle TEXT NOT NULL,
+            synced_from_ts_sec INTEGER NOT NULL,
+            synced_to_ts_sec INTEGER NOT NULL,
+            last_submission_id TEXT,
+            PRIMARY KEY (platform, handle)
+        )""",
+    ]
+
+    def __init__(self, db_path: Path = DB_PATH) -> None:
+        self.db_path = db_path
+        self.conn = sqlite3.connect(str(db_path))
+        for statement in SubmissionStore.SCHEMA:
+            self.conn.execute(statement)
+        self.conn.commit()
+
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+    def get_cursor(self, platform_name: str, handle: str):
+        """
+        Returns (synced_from_ts_sec, synced_to_ts_sec, last_submission_id) or None if never synced.
+        """
+        return self.conn.execute("SELECT synced_from_ts_sec, synced_to_ts_sec, last_submission_id FROM sync_cursors WHERE platform = ? AND handle = ?", (platform_name, handle)).fetchone()
+
+
+    def sync(self, platform, usr: User, from_ts_sec: int) -> int:
+        """
+        Ensures that all of the user's submissions on the platform since from_ts_sec are stored. Returns the number of new submissions.
+
+        Submissions are told apart by id, or for platforms that report times coarsely (see PracticePlatformBase.SUBMISSION_TIME_PRECISION_SECS),
+        by problem and verdict within that precision, as their ids change with the reported time.
+        """
+        platform_name = platform.name()
+        handle = usr.handle(platform_name)
+        sync_start_ts_sec = int(time.time())
+        cursor = self.get_cursor(platform_name, handle)
+
+        after_submission_id = None
+        if cursor is not None and cursor[0] <= from_ts_sec:
+            since_ts_sec = cursor[1] - SubmissionStore.SYNC_OVERLAP_SECS
+            after_submission_id = cursor[2]
+            synced_from_ts_sec = cursor[0]
+        else:
+            since_ts_sec = from_ts_sec
+            synced_from_ts_sec = from_ts_sec if cursor is None else min(cursor[0], from_ts_sec)
+        LOG.debug(f"Syncing: [{platform_name}] for handle: [{handle}] since: [{since_ts_sec}], after submission id: [{after_submission_id}]")
+
+        num_new = 0
+        last_submission_id = after_submission_id
+        for record in platform.iter_submissions(usr, since_ts_sec, after_submission_id):
+            if platform.SUBMISSION_TIME_PRECISION_SECS > 0 and self.__is_stored_near(record, platform.SUBMISSION_TIME_PRECISION_SECS):
+                continue
+            num_new += self.conn.execute("INSERT OR IGNORE INTO submissions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (record.platform, record.handle, record.submission_id, record.problem_id, record.contest_id, record.verdict, int(record.is_accepted), record.ts_sec)).rowcount
+            if record.submission_id.isdigit() and (last_submission_id is None or int(record.submission_id) > int(last_submission_id)):
+                last_submission_id = record.submission_id
+
+        self.conn.execute("INSERT OR REPLACE INTO sync_cursors VALUES (?, ?, ?, ?, ?)", (platform_name, handle, synced_from_ts_sec, sync_start_ts_sec, last_submission_id))
+        self.conn.commit()
+        LOG.info(f"Synced: [{num_new}] new submissions on: [{platform_name}] for handle: [{handle}]")
+        return num_new
+
+
+    def __is_stored_near(self, record: SubmissionRecord, precision_secs: int) -> bool:
+        return self.conn.execute("SELECT 1 FROM submissions WHERE platform = ? AND handle = ? AND ts_sec BETWEEN ? AND ? AND problem_id = ? AND contest_id IS ? AND verdict = ? LIMIT 1",
+            (record.platform, record.handle, record.ts_sec - precision_secs, record.ts_sec + precision_secs, record.problem_id, record.contest_id, record.verdict)).fetchone() is not None
+
+
+    def query(self, platform_name: str, handle: str, start_ts_sec: int, end_ts_sec: int) -> List[SubmissionRecord]:
+        """
+        Stored submissions made within [start_ts_sec, end_ts_sec] (inclusive).
+        """
+        rows = self.conn.execute("SELECT platform, handle, submission_id, problem_id, contest_id, verdict, is_accepted, ts_sec FROM submissions WHERE platform = ? AND handle = ? AND ts_sec BETWEEN ? AND ? ORDER BY ts_sec DESC",
+            (platform_name, handle, start_ts_sec, end_ts_sec)).fetchall()
+        return [SubmissionRecord(row[0], row[1], row[2], row[3], row[4], row[5], bool(row[6]), row[7]) for row in rows]
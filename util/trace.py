@@ -0,0 +1,178 @@
+import contextlib
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Tuple
+from util.common import write_atomically
+from util.decode import dumps
+from util.log import get_logger
+
+LOG = get_logger("Trace")
+
+TOP_FUNCTIONS = 15 # Per phase, by cumulative time
+TOP_ALLOCATIONS = 10 # Per phase, by size
+TRACEMALLOC_FRAMES = 1
+
+# Set by enable. Spans are no-ops unless it was called.
+ENABLED = False
+PROFILING = False
+START_PERF_SECS = 0.0
+
+# Finished spans, as Chrome trace events (https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU)
+EVENTS: List[Dict] = []
+THREAD_NAMES: Dict[int, str] = dict()
+# (phase, thread id) => the profile of the phase's spans on the thread. A profiler only sees its own thread, so each thread has its own.
+PROFILES: Dict[Tuple[str, int], cProfile.Profile] = dict()
+# phase => {allocation site => [bytes, count]}, summed over the phase's spans, of what they kept allocated
+ALLOCATIONS: Dict[str, Dict[str, List[int]]] = defaultdict(dict)
+# phase => the most memory traced at once during any of its spans (ex: a payload parsed, and dropped, while grading a contest)
+PEAK_BYTES: Dict[str, int] = defaultdict(int)
+LOCK = threading.Lock()
+LOCAL = threading.local() # Whether the thread is profiling a span already, profilers don't nest
+
+
+def enable(profile: bool = False) -> None:
+    """
+    Starts recording spans. With profile, each phase (a span's category) is also profiled with cProfile, and tracemalloc tracks
+    what it allocates. Profiling slows the run down noticeably, snapshots are taken around every profiled span.
+    """
+    global ENABLED, PROFILING, START_PERF_SECS
+    ENABLED = True
+    PROFILING = profile
+    START_PERF_SECS = time.perf_counter()
+    if profile and not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+
+
+def is_enabled() -> bool:
+    return ENABLED
+
+
+def is_profiling() -> bool:
+    return PROFILING
+
+
+def __micros(perf_secs: float) -> int:
+    return int((perf_secs - START_PERF_SECS)*1000000)
+
+
+def __snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, path) for path in [tracemalloc.__file__, contextlib.__file__, __file__]])
+
+
+def __add_allocations(phase: str, before: tracemalloc.Snapshot) -> None:
+    stats = __snapshot().compare_to(before, "lineno")
+    with LOCK:
+        for stat in sorted(stats, key=lambda stat: -stat.size_diff)[:TOP_ALLOCATIONS]:
+            if stat.size_diff <= 0:
+                break
+            site = ALLOCATIONS[phase].setdefault(str(stat.traceback), [0, 0])
+            site[0] += stat.size_diff
+            site[1] += stat.count_diff
+
+
+@contextmanager
+def span(name: str, phase: str, **args):
+    """
+    Times the block as a span of the phase (ex: "contest", "practice"), with args to tell spans apart (ex: the uni) in the trace.
+    When profiling, the outermost span of each thread is profiled (and its allocations tracked) as its phase, spans within it
+    (ex: cache loads while grading a contest) count towards it.
+    """
+    if not ENABLED:
+        yield
+        return
+
+    thread = threading.current_thread()
+    profiler, before, peak_bytes = None, None, None
+    if PROFILING and not getattr(LOCAL, "profiling", False):
+        LOCAL.profiling = True
+        before = __snapshot()
+        tracemalloc.reset_peak() # Process wide, so spans on other threads make it an upper bound
+        with LOCK:
+            profiler = PROFILES.setdefault((phase, thread.ident), cProfile.Profile())
+        profiler.enable()
+
+    start_perf_secs = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        end_perf_secs = time.perf_counter()
+        if profiler is not None:
+            profiler.disable()
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+            __add_allocations(phase, before)
+            with LOCK:
+                PEAK_BYTES[phase] = max(PEAK_BYTES[phase], peak_bytes)
+            LOCAL.profiling = False
+        event = {"name": name, "cat": phase, "ph": "X", "ts": __micros(start_perf_secs), "dur": __micros(end_perf_secs) - __micros(start_perf_secs),
+            "pid": os.getpid(), "tid": thread.ident, "args": {key: str(value) for key, value in args.items()}}
+        if error is not None:
+            event["args"]["error"] = error
+        if peak_bytes is not None:
+            event["args"]["peak_kib"] = round(peak_bytes/1024, 1)
+        with LOCK:
+            EVENTS.append(event)
+            THREAD_NAMES[thread.ident] = thread.name
+
+
+def export(path: Path) -> None:
+    """
+    Saves the spans as a Chrome trace, which chrome://tracing and https://ui.perfetto.dev open. Allocations (when profiling) are
+    saved along, under otherData.
+    """
+    with LOCK:
+        thread_events = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": thread_name}} for tid, thread_name in THREAD_NAMES.items()]
+        trace = {"traceEvents": thread_events + sorted(EVENTS, key=lambda event: event["ts"]), "displayTimeUnit": "ms",
+            "otherData": {"allocations": {phase: {site: {"bytes": size, "count": num} for site, (size, num) in sites.items()} for phase, sites in ALLOCATIONS.items()},
+                "peak_bytes": dict(PEAK_BYTES)}}
+    write_atomically(path, dumps(trace))
+    LOG.info(f"Saved trace of: [{len(EVENTS)}] spans to: [{path}]. Open it in chrome://tracing or https://ui.perfetto.dev")
+
+
+def report(path: Path, logger = LOG) -> None:
+    """
+    Logs the time spent in each phase and exports the trace to path (see export). When profiling, also logs each phase's slowest
+    functions and largest allocations, and saves its profile next to the trace (<trace>_<phase>.prof, for pstats or snakeviz).
+    """
+    if not ENABLED:
+        return
+    phase_secs, phase_spans = defaultdict(float), defaultdict(int)
+    with LOCK:
+        for event in EVENTS:
+            phase_secs[event["cat"]] += event["dur"]/1000000
+            phase_spans[event["cat"]] += 1
+    for phase in sorted(phase_secs, key=lambda phase: -phase_secs[phase]):
+        logger.info(f"Phase: [{phase}] spans: [{phase_spans[phase]}] took: [{phase_secs[phase]:.1f}](s)")
+    export(path)
+    if not PROFILING:
+        return
+
+    phase_profiles = defaultdict(list)
+    for (phase, _), profiler in PROFILES.items():
+        phase_profiles[phase].append(profiler)
+    for phase, profilers in sorted(phase_profiles.items()):
+        stats = pstats.Stats(profilers[0])
+        for profiler in profilers[1:]:
+            stats.add(profiler)
+        profile_path = path.with_name(f"{path.stem}_{phase}.prof")
+        stats.dump_stats(profile_path)
+
+        stream = io.StringIO()
+        pstats.Stats(str(profile_path), stream=stream).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        logger.info(f"Profile of phase: [{phase}], saved to: [{profile_path}]\n{stream.getvalue()}")
+
+        logger.info(f"Phase: [{phase}] peaked at: [{PEAK_BYTES.get(phase, 0)/(1024*1024):.1f}](MiB) of traced memory")
+        sites = sorted(ALLOCATIONS.get(phase, dict()).items(), key=lambda site: -site[1][0])[:TOP_ALLOCATIONS]
+        for site, (size, num) in sites:
+            logger.info(f"Phase: [{phase}] allocated: [{size/1024:.1f}](KiB) in: [{num}] blocks at: [{site}]")
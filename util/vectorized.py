@@ -0,0 +1,58 @@
+from typing import Dict, Sequence, Tuple
+from util.log import get_logger
+
+# NumPy is optional. Callers should check HAS_NUMPY and fall back to their scalar loops without it.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+LOG = get_logger("Vectorized")
+
+HAS_NUMPY = np is not None
+
+# Below this many rows, building the arrays costs more than the python loop it replaces
+MIN_VECTORIZED_ROWS = 500
+
+
+def should_vectorize(num_rows: int) -> bool:
+    return HAS_NUMPY and num_rows >= MIN_VECTORIZED_ROWS
+
+
+def first_solved(rows: Sequence[Sequence[int]], problem_col: int, verdict_col: int, ts_col: int, accepted_verdict: int, start_ts: int, end_ts: int) -> Dict[int, int]:
+    """
+        For numeric submission rows (ex: uHunt's [sid, pid, verdict, runtime, ts, ...]) returns the problems that were accepted
+        within [start_ts, end_ts], along with the earliest ts at which each was, {problem_id => ts}.
+    """
+    if len(rows) == 0:
+        return dict()
+    arr = np.asarray([(row[problem_col], row[verdict_col], row[ts_col]) for row in rows], dtype=np.int64)
+    arr = arr[(arr[:, 1] == accepted_verdict) & (arr[:, 2] >= start_ts) & (arr[:, 2] <= end_ts)]
+    arr = arr[np.argsort(arr[:, 2], kind="stable")]
+    problem_ids, first_idxs = np.unique(arr[:, 0], return_index=True)
+    return dict(zip(problem_ids.tolist(), arr[first_idxs, 2].tolist()))
+
+
+def first_solved_batch(histories: Dict[str, Sequence[Sequence[int]]], problem_col: int, verdict_col: int, ts_col: int, accepted_verdict: int, windows: Sequence[Tuple[int, int]]) -> Dict[Tuple[int, int], Dict[str, Dict[int, int]]]:
+    """
+        Same as first_solved, but for many histories (ex: all users') and many [start_ts, end_ts] windows (ex: grading weeks) at once,
+        {window => {key => {problem_id => ts}}}. All rows are masked together, then reduced to the first accepted (key, problem) pairs
+        of each window.
+    """
+    keys = list(histories.keys())
+    ret = {window: {key: dict() for key in keys} for window in windows}
+    owner_rows = [(owner, row[problem_col], row[verdict_col], row[ts_col]) for owner, key in enumerate(keys) for row in histories[key]]
+    if len(owner_rows) == 0:
+        return ret
+
+    arr = np.asarray(owner_rows, dtype=np.int64)
+    arr = arr[arr[:, 2] == accepted_verdict]
+    # Sorted by (owner, problem, ts), so that the first row of each pair within a window is its earliest accepted submission
+    arr = arr[np.lexsort((arr[:, 3], arr[:, 1], arr[:, 0]))]
+    for start_ts, end_ts in windows:
+        window_arr = arr[(arr[:, 3] >= start_ts) & (arr[:, 3] <= end_ts)]
+        is_first = np.ones(len(window_arr), dtype=bool)
+        is_first[1:] = (window_arr[1:, 0] != window_arr[:-1, 0]) | (window_arr[1:, 1] != window_arr[:-1, 1])
+        for owner, problem_id, _, ts in window_arr[is_first].tolist():
+            ret[(start_ts, end_ts)][keys[owner]][problem_id] = ts
+    return ret
@@ -3,73 +3,179 @@ import time
 from util.log import get_logger
 import uuid
 import requests as r
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 from constants import CHROME_DRIVER_PATH
-import random
+from util.rate_limit import RateLimiter, parse_retry_after
+from util.common import fail
+from util.circuit_breaker import PlatformUnavailable
+from util.decode import loads, iter_items, PrefixNotFound
+from util import metrics
+from typing import Callable, Dict, Iterator, List
 
 LOG = get_logger("WebRequest")
 
 class WebRequest:
+    # Statuses with which sites tell us to slow down. Retried after backing off.
+    THROTTLE_STATUS_CODES = [429, 503]
+    MAX_RETRIES = 5
+
     def __init__(self, rate_limit_millis: int = 0, name: str = None) -> None:
         self.rate_limit_millis = rate_limit_millis
-        self.last_request_ts_millis = 0
         self.web_request_obj_id = str(uuid.uuid4())
+        self.name = name if name is not None else self.web_request_obj_id
         self.MAX_JITTER_MILLIS = 2000
         self.WAIT_UNTIL_TS_SEC = 5
+        self.rate_limiter = RateLimiter(rate_limit_millis, self.MAX_JITTER_MILLIS, self.name)
+        self.scraper_options = None
+
+    def __get_scraper_options(self):
+        # Selenium is imported lazily, only once a scrape actually happens
+        if self.scraper_options is None:
+            from selenium.webdriver.chrome.options import Options
+            options = Options()
+            options.headless = True
+            options.add_argument("--window-size=1920,1200")
+            self.scraper_options = options
+        return self.scraper_options
+
+    def __rate_limit(self, endpoint: str):
+        metrics.observe(self.name, endpoint, metrics.RATE_LIMIT_SLEEP, self.rate_limiter.wait())
+
+
+    def __request(self, method: str, url: str, endpoint: str = None, **kwargs) -> r.Response:
+        """
+        Makes the request within the rate limit, backing off and retrying whenever the site throttles us.
+        Its latency, time slept, retries and failures are recorded for the endpoint (see util.metrics.endpoint_of, by default from url).
+        Raises PlatformUnavailable if the site can't be reached, or keeps throttling us.
+        """
+        endpoint = metrics.endpoint_of(endpoint if endpoint is not None else url)
+        for attempt in range(WebRequest.MAX_RETRIES + 1):
+            self.__rate_limit(endpoint)
+            metrics.count(self.name, endpoint, metrics.REQUESTS)
+            try:
+                with metrics.timed(self.name, endpoint):
+                    resp = r.request(method, url, **kwargs)
+            except r.exceptions.RequestException as e:
+                metrics.count_exception(self.name, endpoint, e)
+                raise PlatformUnavailable(f"[{self.name}]: Request to [{url}] failed: [{e}]") from e
+            except Exception as e:
+                metrics.count_exception(self.name, endpoint, e)
+                raise
+            metrics.count(self.name, endpoint, f"status.{resp.status_code}")
+            if resp.status_code not in WebRequest.THROTTLE_STATUS_CODES:
+                if not kwargs.get("stream", False):
+                    metrics.count(self.name, endpoint, metrics.BYTES, len(resp.content))
+                self.rate_limiter.on_success()
+                return resp
+
+            retry_after_secs = parse_retry_after(resp.headers.get("Retry-After"))
+            LOG.warning(f"[{self.name}]: Throttled with status: [{resp.status_code}] for [{url}], attempt: [{attempt + 1}/{WebRequest.MAX_RETRIES + 1}]")
+            metrics.count(self.name, endpoint, metrics.RETRIES)
+            self.rate_limiter.on_throttle(retry_after_secs)
+        metrics.count(self.name, endpoint, metrics.EXCEPTIONS)
+        fail(f"[{self.name}]: Still throttled after [{WebRequest.MAX_RETRIES}] retries for [{url}]", LOG, PlatformUnavailable)
+
+    def __check_available(self, resp: r.Response, url: str) -> None:
+        """
+        Server errors are the site failing for everyone, not just for what was asked (unlike ex: a 400 for an unknown handle).
+        """
+        if resp.status_code >= 500:
+            resp.close()
+            fail(f"[{self.name}]: Server error with status: [{resp.status_code}] for [{url}]", LOG, PlatformUnavailable)
 
-        options = Options()
-        options.headless = True
-        options.add_argument("--window-size=1920,1200")
-        self.scraper_options = options
-
-    def __rate_limit(self):
-        req_ts_millis = int(time.time()*1000)
-        if self.rate_limit_millis > 0:
-            diff_millis = req_ts_millis - self.last_request_ts_millis
-            LOG.debug(f"[{self.web_request_obj_id}]: Diff: {diff_millis}(ms), Rate limit: {self.rate_limit_millis}(ms)")
-            if diff_millis <= self.rate_limit_millis:
-                random_jitter_millis = random.randint(0, self.MAX_JITTER_MILLIS)
-                LOG.info(f"[{self.web_request_obj_id}]: Rate limit applied. Sleeping for {diff_millis}(ms) + random jitter {random_jitter_millis}(ms), i.e a total of {random_jitter_millis + diff_millis}(ms)")
-                time.sleep((diff_millis + random_jitter_millis)/1000.0) # sleep takes seconds but fractional values are allowed, so dividing by 1000 is alright, no info lost
-        self.last_request_ts_millis = req_ts_millis
-
-    def scrape(self, url: str) -> webdriver.Chrome:
+    def scrape(self, url: str, endpoint: str = None) -> "webdriver.Chrome":
+        """
+        A (headless) browser at url. Launching the browser and loading the page are timed separately, launches are often the slower one.
+        """
         LOG.debug(f"SCRAPE: [{url}]")
-        self.__rate_limit()
-        driver = webdriver.Chrome(options=self.scraper_options, executable_path=str(CHROME_DRIVER_PATH))
-        driver.get(url)
+        from selenium import webdriver
+        if not (CHROME_DRIVER_PATH.exists() and CHROME_DRIVER_PATH.is_file()):
+            fail(f"Chrome driver not found at: [{CHROME_DRIVER_PATH}]. Download it from https://chromedriver.chromium.org/downloads and set its path in constants.py", LOG)
+        endpoint = metrics.endpoint_of(endpoint if endpoint is not None else url)
+        options = self.__get_scraper_options()
+        self.__rate_limit(endpoint)
+        metrics.count(self.name, endpoint, metrics.REQUESTS)
+        try:
+            with metrics.timed(self.name, endpoint, metrics.SELENIUM_LAUNCH):
+                driver = webdriver.Chrome(options=options, executable_path=str(CHROME_DRIVER_PATH))
+            with metrics.timed(self.name, endpoint, metrics.PAGE_LOAD):
+                driver.get(url)
+        except Exception as e:
+            metrics.count_exception(self.name, endpoint, e)
+            raise PlatformUnavailable(f"[{self.name}]: Scrape of [{url}] failed: [{e}]") from e
         return driver        
 
     # until_presence_of is a css selector that the driver will wait for before returning
-    def wait_until_presence_of(self, driver, until_presence_of: str) -> webdriver.Chrome:
+    def wait_until_presence_of(self, driver, until_presence_of: str) -> "webdriver.Chrome":
         if until_presence_of is not None and until_presence_of != "":
+            from selenium.webdriver.common.by import By
+            from selenium.webdriver.support.ui import WebDriverWait
+            from selenium.webdriver.support import expected_conditions as EC
             try:
-                WebDriverWait(driver, self.WAIT_UNTIL_TS_SEC).until(EC.presence_of_all_elements_located((By.CSS_SELECTOR, until_presence_of)))
+                with metrics.timed(self.name, metrics.endpoint_of(driver.current_url), metrics.SELENIUM_WAIT):
+                    WebDriverWait(driver, self.WAIT_UNTIL_TS_SEC).until(EC.presence_of_all_elements_located((By.CSS_SELECTOR, until_presence_of)))
             finally:
                 return driver
         return driver
 
 
-    def get(self, url: str, is_json=True):
+    def get(self, url: str, is_json=True, endpoint: str = None):
         """
         Returns dict if is_json is True, else string.
+        endpoint is the url template, when url has parts (ex: handles) that shouldn't count as an endpoint of their own.
         """
         LOG.debug(f"GET: [{url}]")
-        self.__rate_limit()
-        resp = r.get(url)
+        resp = self.__request("GET", url, endpoint)
+        self.__check_available(resp, url)
         if is_json:
-            return resp.json()
+            return loads(resp.content)
         return resp.text
 
+    def get_items(self, url: str, prefix: str, predicate: Callable = None) -> Iterator:
+        """
+        Streams the json response and yields only the items at prefix (ex: 'result.item') that satisfy the predicate.
+        Meant for large catalog responses where only a handful of items are of interest.
+        A response without the items' array (ex: an error body) raises PlatformUnavailable, instead of passing for one without items.
+        """
+        LOG.debug(f"GET (streaming): [{url}] for items at: [{prefix}]")
+        resp = self.__request("GET", url, stream=True)
+        self.__check_available(resp, url)
+        resp.raw.decode_content = True
+        try:
+            yield from iter_items(resp.raw, prefix, predicate)
+        except PrefixNotFound as e:
+            fail(f"[{self.name}]: Unexpected response with status: [{resp.status_code}] for [{url}]. {e}", LOG, PlatformUnavailable)
+        finally:
+            metrics.count(self.name, metrics.endpoint_of(url), metrics.BYTES, resp.raw.tell()) # As far as it was read
+            resp.close()
+
+    def probe(self, url: str, endpoint: str = None) -> bool:
+        """
+        Whether the page at url exists: True if it's there, False if it's missing (404, or a redirect away from it, which is how some
+        sites answer for unknown users), None if the site couldn't tell (ex: a server error).
+        """
+        LOG.debug(f"PROBE: [{url}]")
+        resp = self.__request("GET", url, endpoint, allow_redirects=False)
+        resp.close()
+        if resp.status_code == 200:
+            return True
+        if resp.status_code == 404 or 300 <= resp.status_code < 400:
+            return False
+        LOG.warning(f"[{self.name}]: Can't tell if [{url}] exists, status: [{resp.status_code}]")
+        return None
+
+    def probe_handles(self, user_url: str, handles: List[str]) -> Dict[str, bool]:
+        """
+        Probes a user page (user_url with a {user_id} placeholder) per handle. Handles the site couldn't tell about are left out.
+        """
+        validity = dict()
+        for handle in handles:
+            exists = self.probe(user_url.format(user_id=handle), user_url)
+            if exists is not None:
+                validity[handle] = exists
+        return validity
+
     def post(self, url: str, data: dict = None, headers: dict = None):
         LOG.debug(f"POST: [{url}] with data: [{data}] and headers: [{headers}]")
-        self.__rate_limit()
-        if data is not None:
-            if headers is not None:
-                return r.post(url, data=data, headers=headers).json()
-            return r.post(url, data=data).json()
-        return r.post(url).json()
\ No newline at end of file
+        resp = self.__request("POST", url, data=data, headers=headers)
+        self.__check_available(resp, url)
+        return loads(resp.content)
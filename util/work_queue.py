@@ -0,0 +1,199 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+from util.log import get_logger
+
+LOG = get_logger("WorkQueue")
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+# Lease statuses
+ACTIVE = "active"
+EXPIRED = "expired"
+RELEASED = "released"
+
+
+class WorkQueue:
+    """
+    Local (SQLite) queue of the units of a sharded grading run, one per user, shared by the coordinator and its workers (on this host,
+    or on others that see the same file system). No broker needed, SQLite's file locks do the coordination.
+
+    Workers lease a few units at a time and keep the lease alive with heartbeats. A lease that isn't renewed within LEASE_SECS
+    (its worker died or hung) expires, and its units are leased again, up to MAX_ATTEMPTS times, after which they're marked as failed.
+    A unit is done once the worker that holds its lease finishes it. A worker whose lease expired can't finish it anymore, so that
+    only one grading of each unit ever counts.
+    """
+
+    LEASE_SECS = 2*60
+    MAX_ATTEMPTS = 3
+
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS units (
+            uni TEXT PRIMARY KEY,
+            position INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            lease_id INTEGER,
+            attempts INTEGER NOT NULL,
+            last_error TEXT
+        )""",
+        """CREATE TABLE IF NOT EXISTS leases (
+            lease_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            worker_id TEXT NOT NULL,
+            status TEXT NOT NULL,
+            expires_ts_sec INTEGER NOT NULL,
+            updated_ts_sec INTEGER NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS skipped_units (
+            lease_id INTEGER NOT NULL,
+            week_num INTEGER NOT NULL,
+            uni TEXT NOT NULL,
+            platform_name TEXT NOT NULL,
+            event_type TEXT NOT NULL,
+            event_name TEXT NOT NULL
+        )""",
+    ]
+
+    def __init__(self, db_path: Path) -> None:
+        self.db_path = db_path
+        # Transactions are explicit (BEGIN IMMEDIATE), so that a lease is taken by one process only. The connection is shared with
+        # the heartbeat thread, hence the lock.
+        self.conn = sqlite3.connect(str(db_path), timeout=60, isolation_level=None, check_same_thread=False)
+        self.lock = threading.Lock()
+        for statement in WorkQueue.SCHEMA:
+            self.conn.execute(statement)
+
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+    def __transaction(self, func, *args):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(*args)
+                self.conn.execute("COMMIT")
+                return result
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+
+    def reset(self, unis: List[str]) -> None:
+        """
+        Starts a new run with the units, in the order they're to be merged in.
+        """
+        def reset():
+            for table in ["units", "leases", "skipped_units"]:
+                self.conn.execute(f"DELETE FROM {table}")
+            self.conn.executemany("INSERT INTO units VALUES (?, ?, ?, NULL, 0, NULL)", [(uni, position, PENDING) for position, uni in enumerate(unis)])
+        self.__transaction(reset)
+
+
+    def __requeue(self, lease_id: int, error: str) -> None:
+        self.conn.execute("UPDATE units SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, last_error = ? WHERE lease_id = ? AND status = ?",
+            (WorkQueue.MAX_ATTEMPTS, FAILED, PENDING, error, lease_id, LEASED))
+
+
+    def __reclaim(self) -> None:
+        now_ts_sec = int(time.time())
+        for (lease_id, worker_id) in self.conn.execute("SELECT lease_id, worker_id FROM leases WHERE status = ? AND expires_ts_sec < ?", (ACTIVE, now_ts_sec)).fetchall():
+            LOG.warning(f"Lease: [{lease_id}] of worker: [{worker_id}] expired. Its units are up for grabs again.")
+            self.conn.execute("UPDATE leases SET status = ?, updated_ts_sec = ? WHERE lease_id = ?", (EXPIRED, now_ts_sec, lease_id))
+            self.__requeue(lease_id, f"Lease expired, worker: [{worker_id}]")
+
+
+    def reclaim(self) -> None:
+        """
+        Expires the leases that weren't renewed in time.
+        """
+        self.__transaction(self.__reclaim)
+
+
+    def lease(self, worker_id: str, max_units: int) -> Tuple[int, List[str]]:
+        """
+        (lease_id, unis) of up to max_units pending units, now leased to the worker. None if there's nothing pending.
+        """
+        def lease():
+            self.__reclaim()
+            unis = [uni for (uni,) in self.conn.execute("SELECT uni FROM units WHERE status = ? ORDER BY position LIMIT ?", (PENDING, max_units)).fetchall()]
+            if len(unis) == 0:
+                return None
+            now_ts_sec = int(time.time())
+            lease_id = self.conn.execute("INSERT INTO leases (worker_id, status, expires_ts_sec, updated_ts_sec) VALUES (?, ?, ?, ?)",
+                (worker_id, ACTIVE, now_ts_sec + WorkQueue.LEASE_SECS, now_ts_sec)).lastrowid
+            self.conn.executemany("UPDATE units SET status = ?, lease_id = ?, attempts = attempts + 1 WHERE uni = ?", [(LEASED, lease_id, uni) for uni in unis])
+            return lease_id, unis
+        return self.__transaction(lease)
+
+
+    def heartbeat(self, lease_id: int) -> bool:
+        """
+        Renews the lease. False if it's no longer held (it expired).
+        """
+        now_ts_sec = int(time.time())
+        with self.lock:
+            return self.conn.execute("UPDATE leases SET expires_ts_sec = ?, updated_ts_sec = ? WHERE lease_id = ? AND status = ?",
+                (now_ts_sec + WorkQueue.LEASE_SECS, now_ts_sec, lease_id, ACTIVE)).rowcount == 1
+
+
+    def finish(self, lease_id: int, skipped_units: List[Dict] = []) -> bool:
+        """
+        Marks the lease's units as done, along with the units its worker skipped (their platform was unavailable).
+        False if the lease is no longer held, in which case its work doesn't count.
+        """
+        def finish():
+            now_ts_sec = int(time.time())
+            if self.conn.execute("UPDATE leases SET status = ?, updated_ts_sec = ? WHERE lease_id = ? AND status = ?", (DONE, now_ts_sec, lease_id, ACTIVE)).rowcount != 1:
+                return False
+            self.conn.execute("UPDATE units SET status = ?, last_error = NULL WHERE lease_id = ? AND status = ?", (DONE, lease_id, LEASED))
+            self.conn.executemany("INSERT INTO skipped_units VALUES (?, ?, ?, ?, ?, ?)",
+                [(lease_id, unit["week_num"], unit["uni"], unit["platform_name"], unit["event_type"], unit["event_name"]) for unit in skipped_units])
+            return True
+        return self.__transaction(finish)
+
+
+    def release(self, lease_id: int, error: str) -> None:
+        """
+        Gives up the lease (its worker failed), so that its units are leased again.
+        """
+        def release():
+            if self.conn.execute("UPDATE leases SET status = ?, updated_ts_sec = ? WHERE lease_id = ? AND status = ?", (RELEASED, int(time.time()), lease_id, ACTIVE)).rowcount == 1:
+                self.__requeue(lease_id, error)
+        self.__transaction(release)
+
+
+    def is_finished(self) -> bool:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM units WHERE status IN (?, ?)", (PENDING, LEASED)).fetchone()[0] == 0
+
+
+    def units(self) -> List[Tuple[str, str, int, str]]:
+        """
+        (uni, status, lease_id, last_error) of all units, in their order.
+        """
+        with self.lock:
+            return self.conn.execute("SELECT uni, status, lease_id, last_error FROM units ORDER BY position").fetchall()
+
+
+    def skipped_units(self) -> List[Dict]:
+        """
+        Units skipped by the workers, of leases that were finished.
+        """
+        with self.lock:
+            rows = self.conn.execute("""SELECT s.week_num, s.uni, s.platform_name, s.event_type, s.event_name FROM skipped_units s
+                JOIN units u ON u.lease_id = s.lease_id AND u.uni = s.uni WHERE u.status = ? ORDER BY u.position, s.rowid""", (DONE,)).fetchall()
+        return [{"week_num": week_num, "uni": uni, "platform_name": platform_name, "event_type": event_type, "event_name": event_name}
+            for week_num, uni, platform_name, event_type, event_name in rows]
+
+
+    def summary(self) -> Dict[str, int]:
+        with self.lock:
+            summary = dict(self.conn.execute("SELECT status, COUNT(*) FROM units GROUP BY status").fetchall())
+            summary["workers"] = self.conn.execute("SELECT COUNT(DISTINCT worker_id) FROM leases WHERE status = ?", (ACTIVE,)).fetchone()[0]
+        return summary